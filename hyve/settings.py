@@ -81,21 +81,28 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'material.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'djangorestframework_camel_case.render.CamelCaseJSONRenderer',
+        'material.camelcase.CamelCaseJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'djangorestframework_camel_case.parser.CamelCaseFormParser',
         'djangorestframework_camel_case.parser.CamelCaseMultiPartParser',
-        'djangorestframework_camel_case.parser.CamelCaseJSONParser',
+        'material.camelcase.CamelCaseJSONParser',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'material.pagination.CursorPagination',
+    'PAGE_SIZE': decouple.config('API_PAGE_SIZE', default=100, cast=int),
 }
 
+# Upper bound for the page size that clients can request with `?page_size=`
+API_MAX_PAGE_SIZE = decouple.config('API_MAX_PAGE_SIZE', default=1000, cast=int)
+# Upper bound for the number of items in requests to batch endpoints
+API_MAX_BATCH_SIZE = decouple.config('API_MAX_BATCH_SIZE', default=1000, cast=int)
+
 BROWSABLE_API = decouple.config('BROWSABLE_API', default=False, cast=bool)
 if BROWSABLE_API:
     REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] += [
@@ -123,6 +130,11 @@ MIDDLEWARE = [
     'wagtail.contrib.redirects.middleware.RedirectMiddleware',
 ]
 
+# Compress responses with Brotli (if the `brotli` package is installed) or gzip. Usually your web server does this.
+if decouple.config('COMPRESS_RESPONSES', default=False, cast=bool):
+    # Must come before middleware that reads or changes the response body
+    MIDDLEWARE.insert(0, 'material.middleware.CompressionMiddleware')
+
 DJOSER = {
     'EMAIL': {
         'password_reset': 'material.email.PasswordResetEmail',
@@ -229,6 +241,31 @@ STATIC_ROOT = decouple.config('STATIC_ROOT')
 MEDIA_URL = decouple.config('MEDIA_URL', default='/media/')
 MEDIA_ROOT = decouple.config('MEDIA_ROOT')
 
+# Whether to transcode lesson videos and audio to HLS renditions with ffmpeg (see material/transcoding.py)
+TRANSCODE_MEDIA = decouple.config('TRANSCODE_MEDIA', default=True, cast=bool)
+FFMPEG = decouple.config('FFMPEG', default='ffmpeg')
+FFPROBE = decouple.config('FFPROBE', default='ffprobe')
+
+# Whether the backend serves MEDIA_URL itself (see material/media.py). If so, set MEDIA_ACCEL to `x-accel-redirect`
+# (nginx) or `x-sendfile` to let the web server transfer the files. For X-Accel-Redirect, the web server must serve
+# MEDIA_ROOT at the internal location MEDIA_ACCEL_REDIRECT_PREFIX.
+SERVE_MEDIA = decouple.config('SERVE_MEDIA', default=DEBUG, cast=bool)
+MEDIA_ACCEL = decouple.config('MEDIA_ACCEL', default='')
+MEDIA_ACCEL_REDIRECT_PREFIX = decouple.config('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
+# Scheme and host of the API for absolute URLs in offline content packs (see material/packs.py). Set
+# FORCE_SCRIPT_NAME if the API is served from a path other than `/`.
+CONTENT_PACK_BASE_URL = decouple.config('CONTENT_PACK_BASE_URL', default='http://localhost:8000/')
+
+# Directory (a symbolic link managed by `manage.py resyncsnapshot`) to write static snapshots of the content API to,
+# and the base URL for absolute URLs in them. Snapshots are disabled if not set. See material/snapshots.py.
+API_SNAPSHOT_ROOT = decouple.config('API_SNAPSHOT_ROOT', default=None)
+API_SNAPSHOT_BASE_URL = decouple.config('API_SNAPSHOT_BASE_URL', default=CONTENT_PACK_BASE_URL)
+
+# Limits for uploaded avatars and logos in bytes and in pixels (width times height). See material/uploads.py.
+MAX_IMAGE_UPLOAD_SIZE = decouple.config('MAX_IMAGE_UPLOAD_SIZE', default=10 * 2**20, cast=int)
+MAX_IMAGE_UPLOAD_PIXELS = decouple.config('MAX_IMAGE_UPLOAD_PIXELS', default=40_000_000, cast=int)
+
 # If serving from a subdirectory, you may want to set FORCE_SCRIPT_NAME
 FORCE_SCRIPT_NAME = decouple.config('FORCE_SCRIPT_NAME', default=None)
 
@@ -241,9 +278,56 @@ if decouple.config('USE_PROXY_HEADERS', default=False, cast=bool):
     USE_X_FORWARDED_HOST = True
     SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
+# Caching
+# Cached data is invalidated by signal handlers in the process that changed the data, so when running several worker
+# processes, use a backend that is shared between them (such as Memcached; see the README). Home bundles and expanded
+# rich text are an exception, since their versions are stored in the database (see material/versions.py).
+
+CACHE_BACKEND = decouple.config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHE_LOCATION = decouple.config('CACHE_LOCATION', default='')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    # Wagtail looks up image renditions in this cache before querying the database
+    'renditions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': 'renditions',
+        'TIMEOUT': 600,
+    },
+    # Authenticated users by API token (see material/authentication.py). Tokens are not cached with a process-local
+    # backend such as the default LocMemCache, since logging out in one process couldn't invalidate them in others.
+    'tokens': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'KEY_PREFIX': 'tokens',
+        'TIMEOUT': decouple.config('TOKEN_CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': decouple.config('TOKEN_CACHE_MAX_ENTRIES', default=10000, cast=int),
+        },
+    },
+}
+
+# Background tasks (see material/tasks.py)
+
+BACKGROUND_TASK_WORKERS = decouple.config('BACKGROUND_TASK_WORKERS', default=2, cast=int)
+# Run background tasks in the thread that scheduled them (once the transaction is committed). Useful for testing.
+BACKGROUND_TASKS_SYNCHRONOUS = decouple.config('BACKGROUND_TASKS_SYNCHRONOUS', default=False, cast=bool)
+# Queue expensive tasks, such as processing avatars and transcoding media, in the database for
+# `manage.py runqueuedtasks` instead of running them in the web server process
+TASK_QUEUE = decouple.config('TASK_QUEUE', default=False, cast=bool)
+
 # Email
 
 DEFAULT_FROM_EMAIL = decouple.config('DEFAULT_FROM_EMAIL', default='webmaster@localhost')
 EMAIL_BACKEND = decouple.config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+# With EMAIL_OUTBOX, emails are queued in the database instead and sent with EMAIL_BACKEND by
+# `manage.py sendqueuedmail`, which must then be running (see material/outbox.py).
+OUTBOX_EMAIL_BACKEND = EMAIL_BACKEND
+if decouple.config('EMAIL_OUTBOX', default=False, cast=bool):
+    EMAIL_BACKEND = 'material.outbox.OutboxBackend'
 EMAIL_HOST = decouple.config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = decouple.config('EMAIL_PORT', default=25, cast=int)
 # For other setups, we may want to be able to specify the other EMAIL_* options as well in the future...
@@ -13,14 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+from urllib.parse import urlsplit
+
 from django.conf import settings
-from django.conf.urls.static import static
-from django.urls import path, include
-from djoser.views import UserViewSet as DjoserUserViewSet
+from django.urls import path, include, re_path
 from rest_framework import routers
 from wagtail.admin import urls as wagtailadmin_urls
 
-from material import views
+from material import media, views
 
 router = routers.DefaultRouter()
 router.register(r'categories', views.CategoryViewSet)
@@ -36,7 +37,7 @@ router.register(r'block-completions', views.BlockCompletionViewSet)
 router.register(r'static-pages', views.StaticPageViewSet)
 # Register Djoser URLs (same as in djoser.views) explicitly in this router , otherwise they won't be displayed in the
 # browsable API due to duplicates (see comment below).
-router.register(r'users', DjoserUserViewSet)
+router.register(r'users', views.UserViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -48,7 +49,12 @@ urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
     # path('admin/', admin.site.urls),  # Django admin
     path('admin/', include(wagtailadmin_urls)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.SERVE_MEDIA and not urlsplit(settings.MEDIA_URL).netloc:
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve),
+    ]
 
 if settings.BROWSABLE_API:
     urlpatterns += [
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MaterialConfig(AppConfig):
     name = 'material'
+
+    def ready(self):
+        from material import signals  # noqa: F401
@@ -0,0 +1,57 @@
+import hashlib
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+CACHE_ALIAS = 'tokens'
+
+
+def get_cache_key(key):
+    # Don't put the tokens themselves into a potentially shared cache
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def is_cache_shared():
+    # Signal handlers can only invalidate the entries of a process-local cache in their own process
+    return not isinstance(caches[CACHE_ALIAS], LocMemCache)
+
+
+def invalidate_tokens(keys):
+    caches[CACHE_ALIAS].delete_many([get_cache_key(key) for key in keys])
+
+
+def invalidate_user_tokens(users):
+    """Remove the cached tokens of the given users (a queryset or an iterable of users)."""
+    invalidate_tokens(Token.objects.filter(user__in=users).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token together with its user and the user's organization, so that
+    authenticating a request with a cached token makes no database query.
+
+    The size and lifetime of the cache are bounded by the `tokens` cache in the settings. Cached tokens are
+    invalidated by the signal handlers in `material.signals` when the token is deleted (e.g., on logout) or when its
+    user or their organization changes (e.g., on password change or deactivation).
+
+    Tokens are only cached if the `tokens` cache is shared by all processes, since otherwise other worker processes
+    would keep accepting revoked tokens until their cache entries expire.
+    """
+    def authenticate_credentials(self, key):
+        cache = caches[CACHE_ALIAS]
+        cache_key = get_cache_key(key)
+        token = cache.get(cache_key) if is_cache_shared() else None
+        if token is None:
+            try:
+                token = self.get_model().objects.select_related('user__organization').get(key=key)
+            except self.get_model().DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            if is_cache_shared():
+                cache.set(cache_key, token)
+        return token.user, token
@@ -0,0 +1,126 @@
+"""
+Avatar variants, generated in the background.
+
+Decoding, resizing and re-encoding a large photo takes long enough to block a worker, so uploaded avatars are stored
+as they are. Once the upload has been committed, a background task (see `material.tasks`) replaces the original by a
+copy without metadata such as the location of the photo, and generates a downscaled copy for each of `SIZES`, both
+in the format of the original and, if Pillow supports it, as WebP. The variants are recorded in `User.avatar_variants`
+together with the name of the avatar they belong to. Until they are ready, `UserSerializer` returns the URL of the
+original for every variant.
+"""
+import io
+import os
+import time
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from material import authentication, blobs, models
+
+# Maximum width and height of each variant
+SIZES = {
+    'small': 64,
+    'medium': 160,
+    'large': 400,
+}
+QUALITY = 85
+VARIANT_DIRECTORY = 'avatars/variants'
+
+
+def get_storage():
+    return models.User._meta.get_field('avatar').storage
+
+
+def get_variant_keys():
+    """Return the keys of the URL map of an avatar."""
+    return [key for size in SIZES for key in (size, f'{size}_webp')]
+
+
+def get_variant_directory(avatar_name):
+    stem = os.path.splitext(os.path.basename(avatar_name))[0]
+    return f'{VARIANT_DIRECTORY}/{stem}'
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format=image_format, quality=QUALITY)
+    return ContentFile(output.getvalue())
+
+
+def process_avatar(user_id, avatar_name):
+    """
+    Strip the metadata from the avatar `avatar_name` of the given user and generate its variants, unless the user's
+    avatar has changed in the meantime.
+    """
+    started_at = time.time()
+    storage = get_storage()
+    with storage.open(avatar_name) as f:
+        image = Image.open(f)
+        original_format = image.format
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = ImageOps.exif_transpose(image)
+    if original_format in ('JPEG', 'PNG'):
+        variant_format = original_format
+    else:
+        variant_format = 'PNG' if has_alpha else 'JPEG'
+    extension = {'PNG': 'png', 'JPEG': 'jpg'}[variant_format]
+
+    # Pillow doesn't save the metadata unless told to. The copy has a different content and thus a different name.
+    stripped_name = storage.save(avatar_name, encode(image, original_format))
+
+    directory = get_variant_directory(stripped_name)
+    variants = {'source': stripped_name}
+    for size_name, size in SIZES.items():
+        variant = image.copy()
+        variant.thumbnail((size, size))
+        variants[size_name] = storage.save(f'{directory}/{size_name}.{extension}', encode(variant, variant_format))
+        if features.check('webp'):
+            variants[f'{size_name}_webp'] = storage.save(f'{directory}/{size_name}.webp', encode(variant, 'WEBP'))
+
+    # Updating doesn't send signals, so this doesn't schedule processing again
+    updated = models.User.objects.filter(pk=user_id, avatar=avatar_name).update(avatar=stripped_name,
+                                                                               avatar_variants=variants)
+    if updated:
+        # Cached tokens contain the user
+        authentication.invalidate_user_tokens([user_id])
+        # Deletes the original with its metadata unless another user has uploaded the same file
+        blobs.delete_unreferenced(storage, [avatar_name], started_at)
+    else:
+        # We have just saved the copy ourselves, so it is only in use if referenced
+        blobs.delete_unreferenced(storage, [stripped_name])
+
+
+def delete_variants(avatar_name):
+    delete_directory(get_variant_directory(avatar_name))
+
+
+def delete_directory(directory):
+    storage = get_storage()
+    if not storage.exists(directory):
+        return
+    _, files = storage.listdir(directory)
+    for name in files:
+        storage.delete(f'{directory}/{name}')
+    os.rmdir(storage.path(directory))
+
+
+def needs_processing(user):
+    return bool(user.avatar) and user.avatar_variants.get('source') != user.avatar.name
+
+
+def get_urls(user, request=None):
+    """
+    Return a dict mapping the keys from `get_variant_keys()` to the URLs of the variants of the user's avatar, using
+    the original for variants that are not ready, or None if the user has no avatar.
+    """
+    if not user.avatar:
+        return None
+    storage = get_storage()
+    variants = user.avatar_variants if not needs_processing(user) else {}
+    urls = {}
+    for key in get_variant_keys():
+        url = storage.url(variants.get(key, user.avatar.name))
+        urls[key] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,95 @@
+"""
+Garbage collection of avatars and logos, which are kept in `ContentAddressedStorage`.
+
+Identical uploads share one file, so a file can only be deleted once no user or organization refers to it anymore.
+When an avatar or logo is replaced or its owner is deleted, the signal handlers in `material.signals` schedule
+`delete_unreferenced` for the previous file in the background. Files that have been saved again since then are kept,
+as a new reference to them may not have been committed yet. `collect_garbage` (see `manage.py collectblobs`) deletes
+all files that are not referenced and haven't been saved for a while, which catches what the background tasks missed.
+"""
+import logging
+import os
+import time
+
+from material import avatars, models
+
+logger = logging.getLogger(__name__)
+
+# Models, the names of their fields stored in ContentAddressedStorage and the directories of these fields
+AVATAR_DIRECTORY = 'avatars'
+FIELDS = [
+    (models.User, 'avatar', AVATAR_DIRECTORY),
+    (models.Organization, 'logo', 'logos'),
+]
+# File modification times come from a coarse clock that may lag behind time.time() by a tick
+MTIME_RESOLUTION = 0.05
+# Seconds for which `collect_garbage` keeps unreferenced files after they have been saved
+GRACE_PERIOD = 24 * 60 * 60
+
+
+def get_field(model):
+    """Return the field of `model` that is stored in ContentAddressedStorage."""
+    return next(model._meta.get_field(field_name) for field_model, field_name, _ in FIELDS if field_model is model)
+
+
+def is_referenced(name):
+    return any(model.objects.filter(**{field_name: name}).exists() for model, field_name, _ in FIELDS)
+
+
+def get_modified_time(storage, name):
+    return os.path.getmtime(storage.path(name))
+
+
+def delete_blob(storage, name):
+    storage.delete(name)
+    # Variants of avatars belong to their original
+    if name.startswith(f'{AVATAR_DIRECTORY}/'):
+        avatars.delete_variants(name)
+
+
+def delete_unreferenced(storage, names, since=None):
+    """
+    Delete the files `names` from `storage` unless they are referenced or, if `since` is given, have been saved after
+    the timestamp `since`.
+    """
+    for name in names:
+        if not name or not storage.exists(name):
+            continue
+        if since is not None and get_modified_time(storage, name) >= since - MTIME_RESOLUTION:
+            continue
+        if is_referenced(name):
+            continue
+        delete_blob(storage, name)
+
+
+def collect_garbage(grace_period=GRACE_PERIOD):
+    """Delete all files of the fields in FIELDS that are not referenced anymore. Return the number of deleted files."""
+    deleted = 0
+    cutoff = time.time() - grace_period
+    for model, field_name, directory in FIELDS:
+        storage = model._meta.get_field(field_name).storage
+        if not storage.exists(directory):
+            continue
+        referenced = set(model.objects.exclude(**{field_name: ''}).values_list(field_name, flat=True))
+        _, files = storage.listdir(directory)
+        for file_name in files:
+            name = f'{directory}/{file_name}'
+            if name in referenced or get_modified_time(storage, name) >= cutoff:
+                continue
+            logger.info("Deleting unreferenced file %s", name)
+            delete_blob(storage, name)
+            deleted += 1
+    # Variants of avatars that have been replaced or deleted while being processed
+    storage = avatars.get_storage()
+    if storage.exists(avatars.VARIANT_DIRECTORY):
+        referenced = {avatars.get_variant_directory(name)
+                      for name in models.User.objects.exclude(avatar='').values_list('avatar', flat=True) if name}
+        directories, _ = storage.listdir(avatars.VARIANT_DIRECTORY)
+        for stem in directories:
+            directory = f'{avatars.VARIANT_DIRECTORY}/{stem}'
+            if directory in referenced or get_modified_time(storage, directory) >= cutoff:
+                continue
+            logger.info("Deleting unreferenced avatar variants %s", directory)
+            avatars.delete_directory(directory)
+            deleted += 1
+    return deleted
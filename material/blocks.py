@@ -1,7 +1,10 @@
+from collections import defaultdict
+
 from django.forms.utils import flatatt
 from django.utils.functional import cached_property
 from django.utils.html import format_html, format_html_join
 from wagtail.core import blocks
+from wagtail.core.blocks import StreamValue
 from wagtailmedia.blocks import AbstractMediaChooserBlock
 
 
@@ -58,23 +61,43 @@ class QuizChooserBlock(blocks.ChooserBlock):
         from .choosers import QuizChooser
         return QuizChooser
 
+    def get_api_representation(self, value, context=None):
+        """Return the quiz ID, or the whole quiz if LessonSerializer put a serializer for inlining into the context."""
+        quiz_serializer = context.get('quiz_serializer') if context else None
+        if value is None or quiz_serializer is None:
+            return super().get_api_representation(value, context)
+        return quiz_serializer.to_representation(value)
+
 
 class MediaChooserBlock(AbstractMediaChooserBlock):
     class Meta:
         icon = 'media'
 
+    # Related objects that `prefetch_chooser_blocks` fetches along with the media items
+    select_related = ['streams']
+
     def get_api_representation(self, value, context):
+        """
+        Return the media item with its original file and, once it has been transcoded by `material.transcoding`, the
+        URLs of its HLS master playlist (`hls`), renditions (`variants`) and poster frame (`poster`).
+        """
+        from . import transcoding
         request = context['request']
         if value.thumbnail:
             thumbnail_url = request.build_absolute_uri(value.thumbnail.url)
         else:
             thumbnail_url = None
+        streams = transcoding.get_representation(value, request) or {'hls': None, 'variants': [], 'poster': None}
         return {
             'type': value.type,
             'file': request.build_absolute_uri(value.file.url),
             'width': value.width,
             'height': value.height,
             'thumbnail': thumbnail_url,
+            # None until transcoded, and clients without HLS support play the original anyway
+            'hls': streams['hls'],
+            'variants': streams['variants'],
+            'poster': streams['poster'] or thumbnail_url,
         }
 
     def render_basic(self, value, context=None):
@@ -104,3 +127,30 @@ class MediaChooserBlock(AbstractMediaChooserBlock):
             '\n', "<source{0}>",
             [[flatatt(s)] for s in value.sources]
         ))
+
+
+def prefetch_chooser_blocks(stream_values):
+    """
+    Resolve the chooser blocks in all of the given StreamValues with a single `in_bulk` query per target model.
+
+    Wagtail batches these lookups only per block type within one StreamValue, which still costs a query per chooser
+    type, locale and lesson.
+    """
+    # Target model -> list of (StreamValue, index, block, ID) for all chooser blocks pointing to that model
+    pending = defaultdict(list)
+    for stream_value in stream_values:
+        for i, raw_item in enumerate(stream_value.raw_data):
+            # Skip blocks that have already been converted, e.g., by an earlier call for the same lessons
+            if stream_value._bound_blocks[i] is not None:
+                continue
+            block = stream_value.stream_block.child_blocks.get(raw_item['type'])
+            if isinstance(block, blocks.ChooserBlock):
+                pending[block.target_model].append((stream_value, i, block, raw_item['value']))
+
+    for target_model, items in pending.items():
+        select_related = {field for _, _, block, _ in items for field in getattr(block, 'select_related', [])}
+        objects = (target_model.objects.select_related(*select_related)
+                   .in_bulk({pk for _, _, _, pk in items if pk is not None}))
+        for stream_value, i, block, pk in items:
+            block_id = stream_value.raw_data[i].get('id')
+            stream_value[i] = StreamValue.StreamChild(block, objects.get(pk), id=block_id)
@@ -0,0 +1,91 @@
+"""
+Home bundles: everything the frontend of an organization needs at startup, in one response.
+
+A bundle contains the organization, the live lessons assigned to it grouped by their categories and the live static
+pages of the site. It is the same for all members of the organization, so we build it once per organization and base
+URL and cache it along with the version of the content it was built from. The version is bumped whenever something
+in any bundle might change (see `material.signals`) and stored in the database (see `material.versions`), so that
+bundles cached by other processes are invalidated as well. Serving a cached bundle takes one query for the version
+and one cache lookup.
+
+Bundles are built for a request without query parameters, so `?expand=` and friends don't apply to them.
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from wagtail.core.models import Page, Site
+
+from material import models, payloads, serializers, versions
+
+CACHE_TIMEOUT = 24 * 60 * 60
+# Name of the bundle version in `material.versions`
+VERSION = 'bundles'
+
+
+def get_version():
+    return versions.get_version(VERSION)[0]
+
+
+def bump_version():
+    """Invalidate all cached bundles."""
+    versions.bump_version(VERSION)
+
+
+def get_cache_key(organization_id, base_url):
+    url_hash = hashlib.sha1(base_url.encode()).hexdigest()
+    return f'bundle:{organization_id}:{url_hash}'
+
+
+def get_cached_bundle(organization_id, request):
+    """Return the cached bundle of the organization for the base URL of `request` if it is up to date, else None."""
+    entry = cache.get(get_cache_key(organization_id, payloads.get_base_url(request)))
+    if entry is None or entry['version'] != get_version():
+        return None
+    return entry['data']
+
+
+def store_bundle(organization, request):
+    """Build the bundle of `organization` for the base URL of `request`, cache it and return it."""
+    base_url = payloads.get_base_url(request)
+    # Content changing while we build the bundle bumps the version, so the bundle will not be served
+    version = get_version()
+    data = build_bundle(organization, payloads.build_request(base_url))
+    cache.set(get_cache_key(organization.pk, base_url), {'version': version, 'data': data}, CACHE_TIMEOUT)
+    return data
+
+
+def build_bundle(organization, request):
+    site = Site.find_for_request(request)
+    root = site.root_page if site else Page.get_first_root_node()
+    context = {'request': request}
+
+    # Only the IDs of the lessons are needed since their representations are taken from the payload store
+    deferred = [field.name for field in models.Lesson._meta.local_concrete_fields if not field.primary_key]
+    assigned = set(organization.lessons.values_list('pk', flat=True))
+    lessons_by_category = {}
+    for category in models.Category.live_catalog(root, deferred_lesson_fields=deferred):
+        lesson_ids = [lesson.pk for lesson in category.lessons if lesson.pk in assigned]
+        if lesson_ids:
+            lessons_by_category[category] = lesson_ids
+
+    all_lesson_ids = [pk for lesson_ids in lessons_by_category.values() for pk in lesson_ids]
+    stored = payloads.get_payloads(all_lesson_ids, request)
+    missing = models.Lesson.objects.in_bulk([pk for pk in all_lesson_ids if pk not in stored])
+    lesson_data = {pk: stored[pk] if pk in stored else payloads.store_payload(missing[pk], request)
+                   for pk in all_lesson_ids}
+
+    categories = serializers.CategorySerializer(list(lessons_by_category), many=True, context=context,
+                                                omit=['lessons']).data
+    for category_data, lesson_ids in zip(categories, lessons_by_category.values()):
+        category_data['lessons'] = [lesson_data[pk] for pk in lesson_ids]
+
+    static_pages = models.StaticPage.objects.live().descendant_of(root).order_by('path')
+    data = {
+        'organization': serializers.OrganizationSerializer(organization, context=context, omit=['lessons']).data,
+        'categories': categories,
+        'static_pages': serializers.StaticPageSerializer(static_pages, many=True, context=context).data,
+    }
+    # Serializer output refers to model instances (e.g., in hyperlinks), which we don't want to pickle into the cache
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
@@ -0,0 +1,131 @@
+"""
+Faster drop-in replacements for the JSON renderer and parser of djangorestframework-camel-case.
+
+The library converts every key of every object with a regular expression on every request, although almost all keys
+come from the small vocabulary of our field names. We memoize these conversions. Responses consisting only of
+strings, integers, booleans, None, UUIDs, lists and dicts with string keys, which is what our serializers output
+almost everywhere, are encoded with orjson, whose output for these types is byte-identical to that of DRF's
+JSONRenderer. Anything else (e.g., floats, whose exponents orjson formats differently) is encoded by DRF as before.
+"""
+import json
+import uuid
+from functools import lru_cache
+
+import orjson
+from django.conf import settings
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from djangorestframework_camel_case import parser, render
+from djangorestframework_camel_case.settings import api_settings
+from djangorestframework_camel_case.util import camel_to_underscore, camelize_re, is_iterable, underscore_to_camel
+from rest_framework.exceptions import ParseError
+
+# Range of integers that orjson encodes
+MIN_INT = -2 ** 63
+MAX_INT = 2 ** 64 - 1
+
+KEY_CACHE_SIZE = 10000
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def camelize_key(key):
+    if '_' not in key:
+        return key
+    return camelize_re.sub(underscore_to_camel, key)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def underscoreize_key(key, no_underscore_before_number=False):
+    return camel_to_underscore(key, no_underscore_before_number=no_underscore_before_number)
+
+
+def camelize(data, ignore_fields=()):
+    """
+    Return `data` with camelCase keys like `djangorestframework_camel_case.util.camelize`, together with whether the
+    result can be encoded by orjson.
+    """
+    ignore_fields = ignore_fields or ()
+    encodable = True
+
+    def convert(value):
+        nonlocal encodable
+        value_type = type(value)
+        if value_type is str or value_type is bool or value is None or value_type is uuid.UUID:
+            return value
+        if value_type is int:
+            if not MIN_INT <= value <= MAX_INT:
+                encodable = False
+            return value
+        if isinstance(value, Promise):
+            return force_str(value)
+        if isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                if isinstance(key, Promise):
+                    key = force_str(key)
+                if isinstance(key, str):
+                    new_key = camelize_key(key)
+                else:
+                    new_key = key
+                    encodable = False
+                if key in ignore_fields or new_key in ignore_fields:
+                    result[new_key] = item
+                    encodable = False
+                else:
+                    result[new_key] = convert(item)
+            return result
+        if isinstance(value, str):
+            return value
+        if is_iterable(value):
+            return [convert(item) for item in value]
+        encodable = False
+        return value
+
+    result = convert(data)
+    return result, encodable
+
+
+def underscoreize(data, no_underscore_before_number=False, ignore_fields=()):
+    """Like `djangorestframework_camel_case.util.underscoreize`, but only for data decoded from JSON."""
+    ignore_fields = ignore_fields or ()
+    if isinstance(data, dict):
+        result = {}
+        for key, value in data.items():
+            new_key = underscoreize_key(key, no_underscore_before_number) if isinstance(key, str) else key
+            if key in ignore_fields or new_key in ignore_fields:
+                result[new_key] = value
+            else:
+                result[new_key] = underscoreize(value, no_underscore_before_number, ignore_fields)
+        return result
+    if isinstance(data, list):
+        return [underscoreize(item, no_underscore_before_number, ignore_fields) for item in data]
+    return data
+
+
+class CamelCaseJSONRenderer(render.CamelCaseJSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        data, encodable = camelize(data, self.json_underscoreize.get('ignore_fields'))
+        renderer_context = renderer_context or {}
+        if (encodable and data is not None and self.compact and not self.ensure_ascii
+                and self.get_indent(accepted_media_type, renderer_context) is None):
+            try:
+                content = orjson.dumps(data)
+            except orjson.JSONEncodeError:
+                # E.g., lone surrogates or too deeply nested data, for which DRF raises an error or not
+                pass
+            else:
+                # Like DRF, escape the line and paragraph separators, which are not allowed in JavaScript strings
+                return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        # Skip the conversion in the base class
+        return api_settings.RENDERER_CLASS.render(self, data, accepted_media_type, renderer_context)
+
+
+class CamelCaseJSONParser(parser.CamelCaseJSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read().decode(encoding)
+            return underscoreize(json.loads(data), **self.json_underscoreize)
+        except ValueError as exc:
+            raise ParseError("JSON parse error - %s" % str(exc))
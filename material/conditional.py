@@ -0,0 +1,127 @@
+"""
+Conditional GET support for the read-only content endpoints.
+
+Content only changes when editors publish pages or save snippets, so clients polling the API at startup mostly get
+the same data again. Views using `ConditionalGetMixin` derive a version of the requested content from a few narrow
+columns (publication data of pages, modification times of snippets), send it as a strong ETag along with a
+Last-Modified header, and answer `If-None-Match` requests with 304 Not Modified before anything is serialized.
+
+Lesson bodies also contain the URLs and streams of media items, which aren't referenced in a way we could query.
+Changing any media item or its streams bumps a media version stored in the database (see `material.versions`), which
+the lesson and category endpoints include in their content version.
+
+Last-Modified does not reflect deletions and unpublishing, so `If-Modified-Since` is ignored; it would make clients
+keep stale content.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from material import models, richtext, versions
+
+PAGE_VERSION_FIELDS = ['pk', 'live', 'live_revision_id', 'path', 'last_published_at']
+# Name of the media version in `material.versions`
+MEDIA_VERSION = 'media'
+
+
+def get_page_version(pages):
+    """Return (version, last_modified) for the given pages, based on when and where they were published."""
+    rows = list(pages.order_by('path').values_list(*PAGE_VERSION_FIELDS))
+    last_modified = max((row[-1] for row in rows if row[-1]), default=None)
+    return rows, last_modified
+
+
+def get_snippet_version(snippets):
+    """Return (version, last_modified) for the given objects having a `last_modified` field."""
+    rows = list(snippets.order_by('pk').values_list('pk', 'last_modified'))
+    last_modified = max((row[-1] for row in rows), default=None)
+    return rows, last_modified
+
+
+def get_quiz_version(quizzes):
+    """Return (version, last_modified) for the given quizzes including their questions and answers."""
+    rows, last_modified = get_snippet_version(quizzes)
+    # Counts reflect deleted questions and answers
+    children = [
+        models.MultipleChoiceQuestion.objects.filter(quiz__in=quizzes).aggregate(Count('pk'), Max('last_modified')),
+        models.MultipleChoiceAnswer.objects.filter(question__quiz__in=quizzes).aggregate(Count('pk'),
+                                                                                         Max('last_modified')),
+    ]
+    timestamps = [last_modified] + [c['last_modified__max'] for c in children]
+    last_modified = max((t for t in timestamps if t), default=None)
+    return (rows, children), last_modified
+
+
+def get_media_version():
+    """Return (version, last_modified) for all media items and their streams."""
+    return versions.get_version(MEDIA_VERSION)
+
+
+def bump_media_version():
+    """Change the version of all content containing media items."""
+    versions.bump_version(MEDIA_VERSION)
+
+
+def combine_versions(*versions):
+    """Return (version, last_modified) for the given (version, last_modified) tuples together."""
+    last_modified = max((t for _, t in versions if t), default=None)
+    return tuple(version for version, _ in versions), last_modified
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag and Last-Modified headers to `list` and `retrieve` responses and answers conditional requests.
+
+    Views must implement `get_content_version`.
+    """
+    def get_content_version(self):
+        """
+        Cheaply return a tuple (version, last_modified) for the content requested by the current action.
+
+        `version` must change whenever the representation of the content changes, and `last_modified` is the time of
+        the latest change or None.
+        """
+        raise NotImplementedError
+
+    def get_content_queryset(self):
+        """Return the filtered queryset of the current action, restricted to the requested object if retrieving."""
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            try:
+                queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            except (TypeError, ValueError, ValidationError):
+                # Like DRF's get_object_or_404 for lookup values of the wrong type
+                raise Http404
+        return queryset
+
+    def get_etag(self, version):
+        request = self.request
+        # Besides the content, the response depends on the query parameters, the host (for absolute URLs), the
+        # renderer and the expansion of rich text.
+        key = (version, request.get_full_path(), request.get_host(), request.META.get('HTTP_ACCEPT'),
+               richtext.get_version())
+        return quote_etag(hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def respond_conditionally(self, action, request, *args, **kwargs):
+        version, last_modified = self.get_content_version()
+        etag = self.get_etag(version)
+        timestamp = last_modified.timestamp() if last_modified else None
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = action(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.respond_conditionally(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respond_conditionally(super().retrieve, request, *args, **kwargs)
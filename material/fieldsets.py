@@ -0,0 +1,37 @@
+"""
+Sparse fieldsets in database queries.
+
+drf-flex-fields applies `?fields=` and `?omit=` only when serializing, so every column of the requested rows would be
+loaded even if the response doesn't contain it. This matters for the StreamField bodies of lessons and static pages,
+which are by far our largest columns. We therefore defer the model fields whose serializer fields are not output.
+
+Deferred fields are loaded with one query per object when accessed, so properties that read them must not be output
+or must do without them, like `Lesson.get_block_ids`.
+"""
+from rest_framework import permissions
+from rest_framework.serializers import ListSerializer
+
+from material.serializers import apply_representation_options
+
+
+def get_deferred_fields(serializer):
+    """
+    Return the names of the model fields that `serializer` (or its child if it is a list serializer) would output
+    under the same name if it weren't for its `fields` and `omit` options, including those from query parameters.
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    apply_representation_options(serializer)
+    model_fields = {field.name for field in serializer.Meta.model._meta.concrete_fields if not field.primary_key}
+    return [name for name in serializer.Meta.fields if name in model_fields and name not in serializer.fields]
+
+
+class SparseFieldsetMixin:
+    """Viewset mixin that defers loading the model fields that are not in the response to safe requests."""
+    def get_deferred_fields(self):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return []
+        return get_deferred_fields(self.get_serializer())
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.get_deferred_fields())
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from material import models, packs
+
+
+class Command(BaseCommand):
+    help = ("Build the offline content packs of the given organizations, or of all organizations if none are given. "
+            "Packs whose content hasn't changed are not built or written again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizations', nargs='*', metavar='organization', help="UUID of an organization")
+
+    def handle(self, *args, **options):
+        organizations = models.Organization.objects.order_by('name')
+        if options['organizations']:
+            organizations = organizations.filter(pk__in=options['organizations'])
+        for organization in organizations:
+            version, written = packs.get_pack(organization)
+            status = "Built" if written else "Unchanged"
+            self.stdout.write(f"{status}: {packs.get_name(organization.pk, version)}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from material import blobs
+
+
+class Command(BaseCommand):
+    help = "Delete avatars, avatar variants and logos that are not used anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=int, default=blobs.GRACE_PERIOD,
+                            help="Keep files saved less than this many seconds ago, as they may be about to be used")
+
+    def handle(self, *args, **options):
+        deleted = blobs.collect_garbage(options['grace_period'])
+        self.stdout.write(f"Deleted {deleted} unreferenced files")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from wagtail.images import get_image_model
+
+from material import models, renditions
+
+
+class Command(BaseCommand):
+    help = "Generate the missing image renditions returned by the API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Generate renditions for all images")
+
+    def handle(self, *args, **options):
+        images = get_image_model().objects.all()
+        if not options['all']:
+            image_ids = set(models.Category.objects.values_list('image', flat=True))
+            image_ids |= set(models.Lesson.objects.values_list('image', flat=True))
+            images = images.filter(pk__in=image_ids)
+        image_ids = list(images.values_list('pk', flat=True))
+        for image_id in image_ids:
+            renditions.generate_renditions(image_id)
+        self.stdout.write(f"Generated renditions for {len(image_ids)} images")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from material import avatars, models
+
+
+class Command(BaseCommand):
+    help = "Generate the missing variants of avatars."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Regenerate the variants of all avatars")
+
+    def handle(self, *args, **options):
+        users = models.User.objects.exclude(avatar='').exclude(avatar__isnull=True).only('avatar', 'avatar_variants')
+        users = [user for user in users if options['all'] or avatars.needs_processing(user)]
+        for user in users:
+            avatars.process_avatar(user.pk, user.avatar.name)
+        self.stdout.write(f"Processed {len(users)} avatars")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from material import models, progress
+
+
+class Command(BaseCommand):
+    help = "Recompute the progress of all organizations in all lessons."
+
+    def handle(self, *args, **options):
+        progress.rebuild()
+        count = models.OrganizationLessonProgress.objects.count()
+        self.stdout.write(f"Rebuilt progress with {count} rows")
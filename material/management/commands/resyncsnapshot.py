@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from material import snapshots
+
+
+class Command(BaseCommand):
+    help = ("Render all routes of the static API snapshot into a new directory and atomically replace the current "
+            "snapshot in API_SNAPSHOT_ROOT by it.")
+
+    def handle(self, *args, **options):
+        if not snapshots.is_enabled():
+            raise CommandError("API_SNAPSHOT_ROOT is not set")
+        try:
+            count = snapshots.resync()
+        except ValueError as e:
+            raise CommandError(e)
+        self.stdout.write(f"Wrote {count} routes to {settings.API_SNAPSHOT_ROOT}")
@@ -0,0 +1,11 @@
+from material import queues, tasks
+
+
+class Command(queues.WorkerCommand):
+    help = "Run the queued tasks that are due, retrying failed ones later (see material/tasks.py)."
+    items = 'tasks'
+    default_batch_size = tasks.BATCH_SIZE
+    batch_size_help = "Number of tasks to claim at once"
+
+    def process(self, batch_size):
+        return tasks.run_queued(batch_size)
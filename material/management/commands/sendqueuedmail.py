@@ -0,0 +1,11 @@
+from material import outbox, queues
+
+
+class Command(queues.WorkerCommand):
+    help = "Send the queued emails that are due, retrying failed ones later (see material/outbox.py)."
+    items = 'emails'
+    default_batch_size = outbox.BATCH_SIZE
+    batch_size_help = "Number of emails to send over one connection"
+
+    def process(self, batch_size):
+        return outbox.send_queued(batch_size)
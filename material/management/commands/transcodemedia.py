@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from wagtailmedia.models import get_media_model
+
+from material import transcoding
+
+
+class Command(BaseCommand):
+    help = "Transcode the media items that haven't been transcoded yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Transcode all media items again")
+
+    def handle(self, *args, **options):
+        items = get_media_model().objects.exclude(file='').select_related('streams')
+        items = [media for media in items if options['all'] or transcoding.get_streams(media) is None]
+        for media in items:
+            self.stdout.write(f"Transcoding {media.file.name}")
+            transcoding.transcode_media(media.pk, media.file.name, force=options['all'])
+        self.stdout.write(f"Transcoded {len(items)} media items")
@@ -1,4 +1,8 @@
+from functools import reduce
+from operator import or_
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models, transaction
 
 
 class UserManager(BaseUserManager):
@@ -27,3 +31,46 @@ class UserManager(BaseUserManager):
         if extra_fields.get('is_superuser') is not True:
             raise ValueError('Superuser must have is_superuser set to True')
         return self._create_user(email, None, password, **extra_fields)
+
+
+class UpsertQuerySet(models.QuerySet):
+    def bulk_upsert(self, objs, unique_fields, update_fields):
+        """
+        Insert the given objects or, where a row with the same values of `unique_fields` exists, update its
+        `update_fields` (and fields with `auto_now`) instead.
+
+        Return a list of pairs `(obj, created)` in the order of `objs`, where `obj` is the saved row. If several objects
+        have the same key, the last one wins.
+
+        Django 3.2 cannot update rows on conflict in `bulk_create`, so we update the existing rows with one query and
+        insert the others with another within one transaction. A row inserted concurrently between these queries is
+        kept as it is.
+        """
+        def key(obj):
+            return tuple(getattr(obj, field) for field in unique_fields)
+
+        objs = list(objs)
+        if not objs:
+            return []
+        objs_by_key = {key(obj): obj for obj in objs}
+        lookup = reduce(or_, (models.Q(**dict(zip(unique_fields, k))) for k in objs_by_key))
+        auto_now_fields = [field for field in self.model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+
+        with transaction.atomic(using=self.db):
+            existing = {key(obj): obj.pk for obj in self.select_for_update().filter(lookup).only('pk', *unique_fields)}
+            to_update = []
+            to_create = []
+            for k, obj in objs_by_key.items():
+                if k in existing:
+                    obj.pk = existing[k]
+                    for field in auto_now_fields:
+                        field.pre_save(obj, add=False)
+                    to_update.append(obj)
+                else:
+                    to_create.append(obj)
+            if to_update:
+                self.bulk_update(to_update, list(update_fields) + [field.name for field in auto_now_fields])
+            if to_create:
+                self.bulk_create(to_create, ignore_conflicts=True)
+            saved = {key(obj): obj for obj in self.filter(lookup)}
+        return [(saved[key(obj)], key(obj) not in existing) for obj in objs]
@@ -0,0 +1,184 @@
+"""
+Serving of media files, such as the videos and audio of lessons, by the backend.
+
+Usually the web server serves MEDIA_ROOT directly (see the README). If requests for media files reach the backend
+instead, `serve` checks that the file may be served (see `authorize`) and then, depending on MEDIA_ACCEL, hands the
+transfer to the web server with `X-Accel-Redirect` (nginx) or `X-Sendfile` (Apache with mod_xsendfile, lighttpd), so
+that no worker is busy while a large file is downloaded. Without MEDIA_ACCEL, the file is streamed by the backend in
+chunks, supporting single byte ranges so that clients can seek in videos without downloading them from the beginning.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+from wagtail.documents import get_document_model
+from wagtail.images import get_image_model
+from wagtailmedia.models import get_media_model
+
+from material import avatars, blobs, models, packs, transcoding
+
+CHUNK_SIZE = 64 * 2**10
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Like the web server configuration in the README for avatars and logos, whose names are derived from their content
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_immutable(name):
+    return name.split('/', 1)[0] in {directory for _, _, directory in blobs.FIELDS}
+
+
+def is_stream_referenced(name):
+    # Streams are grouped in a directory per file of a media item
+    directory = '/'.join(name.split('/')[:3])
+    return models.MediaStreams.objects.filter(playlist__startswith=f'{directory}/').exists()
+
+
+def is_avatar_variant_referenced(name):
+    # Variants are grouped in a directory named after their avatar
+    stem = name.split('/')[2]
+    return models.User.objects.filter(avatar__startswith=f'{blobs.AVATAR_DIRECTORY}/{stem}.').exists()
+
+
+# Directories below MEDIA_ROOT and functions returning whether a file in them is referenced by some object. Files in
+# other directories, e.g., uploads in progress, are only served to editors.
+REFERENCE_CHECKS = [
+    ('original_images/', lambda name: get_image_model().objects.filter(file=name).exists()),
+    ('images/', lambda name: get_image_model().get_rendition_model().objects.filter(file=name).exists()),
+    ('documents/', lambda name: get_document_model().objects.filter(file=name).exists()),
+    ('media/', lambda name: get_media_model().objects.filter(file=name).exists()),
+    ('media_thumbnails/', lambda name: get_media_model().objects.filter(thumbnail=name).exists()),
+    (f'{transcoding.DIRECTORY}/', is_stream_referenced),
+    (f'{avatars.VARIANT_DIRECTORY}/', is_avatar_variant_referenced),
+    (f'{blobs.AVATAR_DIRECTORY}/', blobs.is_referenced),
+    ('logos/', blobs.is_referenced),
+    # Replaced packs are deleted, so every pack is current
+    (f'{packs.DIRECTORY}/', lambda name: True),
+]
+
+
+def is_referenced(name):
+    check = next((check for prefix, check in REFERENCE_CHECKS if name.startswith(prefix)), None)
+    return check is not None and check(name)
+
+
+def authorize(request, name):
+    """
+    Return whether the file `name` relative to MEDIA_ROOT may be served for `request`.
+
+    Files that are being written under temporary names (see `material.storage.ContentAddressedStorage` and
+    `material.packs`) and hidden files are never served. Superusers may download all other files, and everybody else
+    only files of existing images, documents, media items, avatars, logos and packs. Orphaned files, e.g., of
+    deleted objects or replaced uploads, are thus not served even though they may still be on disk.
+    """
+    parts = name.split('/')
+    if any(part.startswith('.') for part in parts) or name.endswith('.tmp'):
+        return False
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_superuser:
+        return True
+    return is_referenced(name)
+
+
+def get_range(request, size, last_modified):
+    """
+    Return the first and last byte of the range requested with the `Range` header, or None if the whole file should
+    be sent. Raise ValueError if the range cannot be satisfied.
+    """
+    header = request.headers.get('Range')
+    if not header:
+        return None
+    # Ranges of an older version of the file don't apply
+    if_range = request.headers.get('If-Range')
+    if if_range and parse_http_date_safe(if_range) != int(last_modified):
+        return None
+    # We ignore everything but single byte ranges, which is allowed
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        # The last `end` bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def iter_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+@require_safe
+def serve(request, path):
+    name = posixpath.normpath(path).lstrip('/')
+    if not authorize(request, name):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        return response
+    if settings.MEDIA_ACCEL == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    try:
+        byte_range = get_range(request, stat.st_size, stat.st_mtime)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response.block_size = CHUNK_SIZE
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(iter_range(open(full_path, 'rb'), start, length), status=206,
+                                         content_type=content_type)
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if is_immutable(name):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
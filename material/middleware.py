@@ -0,0 +1,41 @@
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with Brotli if the client accepts it and the `brotli` package is installed, or else with gzip
+    like Django's GZipMiddleware.
+
+    Streaming responses are only compressed with gzip. Responses supporting byte ranges, such as media files served by
+    `material.media`, are not compressed since the ranges refer to the uncompressed content.
+    """
+    def process_response(self, request, response):
+        if response.has_header('Accept-Ranges'):
+            return response
+        accepts_brotli = re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is None or not accepts_brotli or response.streaming:
+            return super().process_response(request, response)
+
+        # The rest is like in GZipMiddleware
+        if len(response.content) < 200 or response.has_header('Content-Encoding'):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressed_content = brotli.compress(response.content)
+        if len(compressed_content) >= len(response.content):
+            return response
+        response.content = compressed_content
+        response.headers['Content-Length'] = str(len(response.content))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
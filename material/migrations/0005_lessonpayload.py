@@ -0,0 +1,29 @@
+# Generated by Django 3.2.12 on 2026-10-18 06:37
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0004_add_page_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonPayload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_url', models.CharField(max_length=250)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('last_modified', models.DateTimeField(auto_now=True)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payloads', to='material.lesson')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='lessonpayload',
+            constraint=models.UniqueConstraint(fields=('lesson', 'base_url'), name='unique_payload_for_lesson_and_base_url'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.12 on 2026-10-18 06:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_lesson_blocks(apps, schema_editor):
+    Lesson = apps.get_model('material', 'Lesson')
+    LessonBlock = apps.get_model('material', 'LessonBlock')
+    rows = [LessonBlock(lesson=lesson, language=language, block=item['id'])
+            for lesson in Lesson.objects.all()
+            for language, _ in settings.LANGUAGES
+            for item in getattr(lesson, f'body_{language}').raw_data
+            if item.get('id')]
+    LessonBlock.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0006_snippet_last_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', models.CharField(max_length=10)),
+                ('block', models.UUIDField(db_index=True)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='body_blocks', to='material.lesson')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='lessonblock',
+            constraint=models.UniqueConstraint(fields=('lesson', 'language', 'block'), name='unique_block_for_lesson_and_language'),
+        ),
+        migrations.RunPython(create_lesson_blocks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.12 on 2026-10-18 06:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0007_lessonblock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationLessonProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completed_blocks', models.PositiveIntegerField(default=0)),
+                ('members_started', models.PositiveIntegerField(default=0)),
+                ('members_finished', models.PositiveIntegerField(default=0)),
+                ('lesson', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='organization_progress', to='material.lesson')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lesson_progress', to='material.organization')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='organizationlessonprogress',
+            constraint=models.UniqueConstraint(fields=('organization', 'lesson'), name='unique_progress_for_organization_and_lesson'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.12 on 2026-10-18 07:14
+
+from django.db import migrations, models
+import material.models
+import material.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0008_organizationlessonprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=material.storage.OverwriteStorage(), upload_to=material.models.get_avatar_file_path),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.12 on 2026-10-18 07:22
+
+from django.db import migrations, models
+import material.models
+import material.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0009_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='organization',
+            name='logo',
+            field=models.ImageField(blank=True, storage=material.storage.ContentAddressedStorage(), upload_to=material.models.get_logo_file_path),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=material.storage.ContentAddressedStorage(), upload_to=material.models.get_avatar_file_path),
+        ),
+    ]
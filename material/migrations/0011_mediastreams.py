@@ -0,0 +1,26 @@
+# Generated by Django 3.2.12 on 2026-10-18 07:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtailmedia', '0004_duration_optional_floatfield'),
+        ('material', '0010_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaStreams',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255)),
+                ('playlist', models.CharField(max_length=255)),
+                ('poster', models.CharField(blank=True, max_length=255)),
+                ('variants', models.JSONField(default=list)),
+                ('media', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='streams', to='wagtailmedia.media')),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+from collections import Counter, defaultdict
+
+from django.db import migrations
+
+
+def create_progress(apps, schema_editor):
+    # Same as material.progress.refresh for all lessons, which can't be used with historical models
+    BlockCompletion = apps.get_model('material', 'BlockCompletion')
+    LessonBlock = apps.get_model('material', 'LessonBlock')
+    OrganizationLessonProgress = apps.get_model('material', 'OrganizationLessonProgress')
+    # A block may be part of a lesson in several languages
+    block_languages = defaultdict(set)
+    for lesson_id, block, language in LessonBlock.objects.values_list('lesson', 'block', 'language'):
+        block_languages[lesson_id, block].add(language)
+    total_blocks = Counter((lesson_id, language)
+                           for (lesson_id, _), languages in block_languages.items() for language in languages)
+
+    # Completed blocks per organization and lesson, and per organization and lesson, member and language
+    completed_blocks = Counter()
+    completed = defaultdict(lambda: defaultdict(Counter))
+    completions = (BlockCompletion.objects.filter(user__organization__isnull=False)
+                   .values_list('user__organization', 'lesson', 'user', 'block'))
+    for organization_id, lesson_id, user_id, block in completions.iterator():
+        if (lesson_id, block) in block_languages:
+            completed_blocks[organization_id, lesson_id] += 1
+            completed[organization_id, lesson_id][user_id].update(block_languages[lesson_id, block])
+
+    OrganizationLessonProgress.objects.all().delete()
+    OrganizationLessonProgress.objects.bulk_create([
+        OrganizationLessonProgress(
+            organization_id=organization_id,
+            lesson_id=lesson_id,
+            completed_blocks=completed_blocks[organization_id, lesson_id],
+            members_started=len(members),
+            members_finished=sum(any(count >= total_blocks[lesson_id, language] for language, count in counts.items())
+                                 for counts in members.values()),
+        )
+        for (organization_id, lesson_id), members in completed.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0012_queuedemail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_progress, migrations.RunPython.noop),
+    ]
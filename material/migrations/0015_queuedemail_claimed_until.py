@@ -0,0 +1,19 @@
+# Generated by Django 3.2.12 on 2026-10-18 07:54
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0014_queuedtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedemail',
+            name='claimed_until',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
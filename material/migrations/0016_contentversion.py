@@ -0,0 +1,21 @@
+# Generated by Django 3.2.12 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('material', '0015_queuedemail_claimed_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+                ('last_modified', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
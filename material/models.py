@@ -1,20 +1,26 @@
 import os
 import uuid
+from collections import defaultdict
+from itertools import chain
 
+from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
-from django.db import models
-from django.db.models import Q
-from django_resized import ResizedImageField
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+from django_cleanup import cleanup
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
+from modeltranslation.utils import build_localized_fieldname
 from wagtail.admin.edit_handlers import FieldPanel, InlinePanel, MultiFieldPanel, StreamFieldPanel
 from wagtail.core import blocks
 from wagtail.core.models import Orderable, Page
 from wagtail.core.fields import RichTextField, StreamField
 from wagtail.images.edit_handlers import ImageChooserPanel
 
-from material import managers, storage
+from material import managers, renditions, storage
 from material.blocks import OpenQuestionChooserBlock, QuizChooserBlock, MediaChooserBlock
 
 
@@ -64,11 +70,35 @@ class Lesson(Page):
     # FIXME: The following methods need to be kept in sync with the locales, which is terrible.
     @property
     def block_ids_en(self):
-        return [block.id for block in self.body_en]
+        return self.get_block_ids('en')
 
     @property
     def block_ids_fi(self):
-        return [block.id for block in self.body_fi]
+        return self.get_block_ids('fi')
+
+    def get_block_ids(self, language):
+        """
+        Return the IDs of the blocks of the body in the given language.
+
+        If the body has been deferred, the IDs are taken from `LessonBlock` instead so that the body needn't be loaded.
+        Prefetch `body_blocks` when doing this for many lessons.
+        """
+        field_name = build_localized_fieldname('body', language)
+        if field_name in self.get_deferred_fields():
+            # Rows are created in the order of the blocks in the body
+            rows = sorted(self.body_blocks.all(), key=lambda row: row.pk)
+            return [str(row.block) for row in rows if row.language == language]
+        return [block.id for block in getattr(self, field_name)]
+
+    def sync_body_blocks(self):
+        """Replace the `LessonBlock` rows of this lesson by the blocks of its body in each language."""
+        rows = [LessonBlock(lesson=self, language=language, block=item['id'])
+                for language, _ in settings.LANGUAGES
+                for item in getattr(self, build_localized_fieldname('body', language)).raw_data
+                if item.get('id')]
+        with transaction.atomic():
+            self.body_blocks.all().delete()
+            LessonBlock.objects.bulk_create(rows, ignore_conflicts=True)
 
     content_panels = Page.content_panels + [
         FieldPanel('description'),
@@ -87,6 +117,7 @@ class Quiz(ClusterableModel):
     # id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     internal_name = models.CharField(unique=True, max_length=250)
     # lesson = ParentalKey(Lesson, on_delete=models.CASCADE, related_name='quizzes')
+    last_modified = models.DateTimeField(auto_now=True)
 
     panels = [
         FieldPanel('internal_name'),
@@ -105,6 +136,7 @@ class MultipleChoiceQuestion(Orderable, ClusterableModel):
 
     text_en = models.CharField(max_length=250, blank=True)
     text_fi = models.CharField(max_length=250, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     panels = [
         FieldPanel('text_en'),
@@ -122,6 +154,7 @@ class MultipleChoiceAnswer(Orderable):
     correct = models.BooleanField(default=False)
     explanation_en = models.CharField(max_length=250, blank=True)
     explanation_fi = models.CharField(max_length=250, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     panels = [
         FieldPanel('text_en'),
@@ -137,6 +170,7 @@ class OpenQuestion(models.Model):
     # lesson = ParentalKey(Lesson, on_delete=models.CASCADE, related_name='open_questions')
     internal_name = models.CharField(unique=True, max_length=250)
     text = models.CharField(max_length=250, blank=True)
+    last_modified = models.DateTimeField(auto_now=True)
 
     panels = [
         FieldPanel('internal_name'),
@@ -170,15 +204,67 @@ class Category(Page):
 
     @property
     def lessons(self):
-        return self.get_children().specific()
-
-
+        try:
+            # Set by `live_catalog`
+            return self._lessons
+        except AttributeError:
+            return self.get_children().specific()
+
+    @classmethod
+    def live_catalog(cls, root, category_paths=None, deferred_lesson_fields=()):
+        """
+        Return the live categories below the page `root`, each with its live lessons in the `lessons` property.
+
+        If `category_paths` is given, only the categories with these tree paths are returned. This is meant for a page
+        of categories as returned by the paginator, so the query is limited to the path range that they span.
+
+        Of `deferred_lesson_fields`, those stored in the lesson table itself (such as the bodies) are not loaded.
+
+        All categories and lessons are fetched with a single query on the tree path, and the renditions of their
+        images with one more unless they are all in the rendition index.
+        """
+        local_fields = {field.name for field in Lesson._meta.local_concrete_fields}
+        deferred_lesson_fields = [name for name in deferred_lesson_fields if name in local_fields]
+        lesson_image = 'lesson' if 'image' in deferred_lesson_fields else 'lesson__image'
+        pages = (Page.objects.live().type(Category, Lesson)
+                 .filter(path__startswith=root.path, depth__gt=root.depth)
+                 .select_related('category__image', lesson_image)
+                 .defer(*(f'lesson__{name}' for name in deferred_lesson_fields)))
+        if category_paths is not None:
+            if not category_paths:
+                return []
+            category_paths = set(category_paths)
+            # Descendants of the last category have longer paths with the same prefix
+            pages = pages.filter(path__gte=min(category_paths),
+                                 path__lte=max(category_paths) + 'Z' * cls.steplen)
+        categories = []
+        lessons_by_parent_path = defaultdict(list)
+        for page in pages:
+            if hasattr(page, 'category'):
+                if category_paths is None or page.path in category_paths:
+                    categories.append(page.category)
+            else:
+                lessons_by_parent_path[page.path[:-cls.steplen]].append(page.lesson)
+        for category in categories:
+            category._lessons = lessons_by_parent_path[category.path]
+
+        pages_with_images = list(categories)
+        if 'image' not in deferred_lesson_fields:
+            pages_with_images.extend(chain(*(category._lessons for category in categories)))
+        images = [page.image for page in pages_with_images
+                  if page.image and not renditions.index.is_complete(page.image)]
+        prefetch_related_objects(images, 'renditions')
+        return categories
+
+
+# Files in ContentAddressedStorage may be shared, so they are deleted by material.blobs rather than django-cleanup
+@cleanup.ignore
 class Organization(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, blank=True)
     lessons = models.ManyToManyField(Lesson, blank=True)
     logo = models.ImageField(blank=True,
-                             storage=storage.OverwriteStorage(),
+                             storage=storage.ContentAddressedStorage(),
                              upload_to=get_logo_file_path)
 
     # URL of password reset form in frontend, returned when the user requests a link to reset their password.
@@ -197,6 +283,7 @@ class Organization(models.Model):
         return str(self.name)
 
 
+@cleanup.ignore
 class User(PermissionsMixin, AbstractBaseUser):
     class Meta:
         constraints = [
@@ -217,13 +304,13 @@ class User(PermissionsMixin, AbstractBaseUser):
     # first_name = models.CharField(max_length=100, blank=True)
     # last_name = models.CharField(max_length=100, blank=True)
     name = models.CharField(max_length=100, blank=True)
-    avatar = ResizedImageField(blank=True,
+    # Stored as uploaded and processed in the background; see material/avatars.py
+    avatar = models.ImageField(blank=True,
                                null=True,
-                               storage=storage.OverwriteStorage(),
-                               upload_to=get_avatar_file_path,
-                               size=(400, 400),
-                               quality=85,
-                               keep_meta=False)
+                               storage=storage.ContentAddressedStorage(),
+                               upload_to=get_avatar_file_path)
+    # Names of the downscaled copies of the avatar by size, and the name of the avatar they were made from as `source`
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(
         default=True,
         help_text="Designates whether this user should be able to log in. Unselect this instead of deleting accounts.",
@@ -276,6 +363,8 @@ class BlockCompletion(models.Model):
     block = models.UUIDField()
     last_modified = models.DateTimeField(auto_now=True)
 
+    objects = managers.UpsertQuerySet.as_manager()
+
 
 class MultipleChoiceResponse(models.Model):
     class Meta:
@@ -288,6 +377,8 @@ class MultipleChoiceResponse(models.Model):
     response = models.BooleanField()
     last_modified = models.DateTimeField(auto_now=True)
 
+    objects = managers.UpsertQuerySet.as_manager()
+
 
 class OpenQuestionResponse(models.Model):
     class Meta:
@@ -299,3 +390,128 @@ class OpenQuestionResponse(models.Model):
     question = models.ForeignKey(OpenQuestion, on_delete=models.CASCADE)
     response = models.TextField()
     last_modified = models.DateTimeField(auto_now=True)
+
+
+class LessonPayload(models.Model):
+    """
+    Stored API representation of a published lesson, as seen by requests with a particular base URL.
+
+    Rows are maintained by the handlers in `material.signals` and read by `LessonViewSet`; see `material.payloads`.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lesson', 'base_url'], name='unique_payload_for_lesson_and_base_url'),
+        ]
+
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='payloads')
+    # Scheme and host of the requests this payload is for, since some URLs in the representation are absolute
+    base_url = models.CharField(max_length=250)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    last_modified = models.DateTimeField(auto_now=True)
+
+
+class LessonBlock(models.Model):
+    """
+    Block of the body of a lesson in some language, so that progress in lessons can be computed from block completions
+    without loading the lesson bodies.
+
+    Rows are kept in sync with the lessons by the handlers in `material.signals`.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lesson', 'language', 'block'],
+                                    name='unique_block_for_lesson_and_language'),
+        ]
+
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='body_blocks')
+    language = models.CharField(max_length=10)
+    block = models.UUIDField(db_index=True)
+
+
+class OrganizationLessonProgress(models.Model):
+    """
+    Progress of the members of an organization in a lesson, for supervisors.
+
+    Rows are maintained by `material.progress`. Organizations without any progress in a lesson have no row for it or
+    a row of zeros.
+    """
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['organization', 'lesson'],
+                                    name='unique_progress_for_organization_and_lesson'),
+        ]
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name='lesson_progress')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='organization_progress')
+    # Number of completions of the lesson's blocks by all members together
+    completed_blocks = models.PositiveIntegerField(default=0)
+    # Number of members who completed at least one block of the lesson
+    members_started = models.PositiveIntegerField(default=0)
+    # Number of members who completed all blocks of the lesson in some language
+    members_finished = models.PositiveIntegerField(default=0)
+
+
+class MediaStreams(models.Model):
+    """
+    Adaptive streaming renditions and poster frame of a media item.
+
+    Rows are maintained by `material.transcoding`. Media items that haven't been transcoded yet have no row.
+    """
+    # wagtailmedia's default model, which we don't swap
+    media = models.OneToOneField('wagtailmedia.Media', on_delete=models.CASCADE, related_name='streams')
+    # Name of the media file the streams were generated from
+    source = models.CharField(max_length=255)
+    # Names of the HLS master playlist and the poster frame, relative to MEDIA_ROOT
+    playlist = models.CharField(max_length=255)
+    poster = models.CharField(max_length=255, blank=True)
+    # Bandwidth, width and height (None for audio) and playlist name of each rendition, by increasing bandwidth
+    variants = models.JSONField(default=list)
+
+
+class QueuedItem(models.Model):
+    """Item of a work queue processed by workers; see `material.queues`."""
+    class Meta:
+        abstract = True
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Null after the last failed attempt
+    next_attempt_at = models.DateTimeField(null=True, blank=True, default=timezone.now, db_index=True)
+    # Until when a worker is processing the item. Other workers take over afterwards.
+    claimed_until = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+
+class QueuedEmail(QueuedItem):
+    """
+    Email waiting to be sent.
+
+    Rows are created by `material.outbox.OutboxBackend` and deleted by `material.outbox` once the email has been sent.
+    """
+    # Fields of the EmailMessage; see `material.outbox.serialize`
+    message = models.JSONField()
+
+
+class QueuedTask(QueuedItem):
+    """
+    Call of a function waiting to be run by a worker process.
+
+    Rows are created by `material.tasks.run_in_worker` and deleted by `material.tasks` once the call has succeeded.
+    """
+    # Dotted path of a module-level function and its positional arguments
+    function = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+
+
+class ContentVersion(models.Model):
+    """
+    Version of some kind of content that is not derived from the content itself, e.g., because changes to it cannot be
+    queried.
+
+    Rows are maintained by `material.versions`. They are in the database so that all processes see the same version.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    # Random value that changes whenever the content changes
+    version = models.CharField(max_length=32)
+    # Null until the content changes for the first time
+    last_modified = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,106 @@
+"""
+Outbox for emails such as password reset links and djoser's confirmations.
+
+Sending an email over SMTP while handling a request blocks the worker for as long as the mail server takes, and the
+email is lost if sending fails. With EMAIL_OUTBOX enabled, EMAIL_BACKEND is `OutboxBackend` and sending an email only
+stores it as a `QueuedEmail`, which is committed together with the rest of the request. `manage.py sendqueuedmail`
+then sends the queued emails in batches with OUTBOX_EMAIL_BACKEND, reusing one connection per batch. A worker claims a
+batch for LEASE_DURATION before sending it outside of any transaction, so that other workers skip these emails without
+rows being locked while talking to the mail server. Emails that cannot be sent are retried with exponential backoff up
+to MAX_ATTEMPTS times (see `material.queues`).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+from material import models, queues
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+# Time in which a worker must send a batch before other workers may send its emails
+LEASE_DURATION = timedelta(minutes=10)
+MAX_ATTEMPTS = 10
+
+
+def serialize(message):
+    """Return the fields of the EmailMessage `message` as JSON-compatible data."""
+    if message.attachments:
+        raise ValueError("Queued emails cannot have attachments")
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'content_subtype': message.content_subtype,
+        'alternatives': [list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+    }
+
+
+def deserialize(data, connection=None):
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']],
+        connection=connection,
+    )
+    message.content_subtype = data['content_subtype']
+    return message
+
+
+class OutboxBackend(BaseEmailBackend):
+    """Email backend that queues emails for `send_queued` instead of sending them."""
+    def send_messages(self, email_messages):
+        queued = [models.QueuedEmail(message=serialize(message)) for message in email_messages if message.recipients()]
+        models.QueuedEmail.objects.bulk_create(queued)
+        return len(queued)
+
+
+def claim_batch(batch_size):
+    """Return up to `batch_size` queued emails that are due, claiming them for LEASE_DURATION."""
+    return queues.claim(models.QueuedEmail, batch_size, LEASE_DURATION)
+
+
+def send_batch(batch_size=BATCH_SIZE):
+    """
+    Send up to `batch_size` queued emails that are due over one connection. Return the number of emails that were
+    due, whether or not they could be sent.
+    """
+    queued = claim_batch(batch_size)
+    if not queued:
+        return 0
+    connection = get_connection(settings.OUTBOX_EMAIL_BACKEND)
+    try:
+        for email in queued:
+            try:
+                # Opens the connection unless it is open already
+                connection.open()
+                connection.send_messages([deserialize(email.message, connection)])
+            except Exception as e:
+                logger.warning("Could not send queued email %s: %s", email.pk, e)
+                queues.record_failure(email, e, MAX_ATTEMPTS)
+                # The connection may be broken, so start over with the next email
+                connection.close()
+            else:
+                email.delete()
+    finally:
+        connection.close()
+    return len(queued)
+
+
+def send_queued(batch_size=BATCH_SIZE):
+    """Send all queued emails that are due in batches and return the number of emails that were due."""
+    return queues.process_all(send_batch, batch_size)
@@ -0,0 +1,168 @@
+"""
+Offline content packs: gzip-compressed JSON files holding everything an organization's lessons need, for clients on
+poor connections.
+
+A pack contains the home bundle of the organization (see `material.bundles`), i.e., its assigned lessons in both
+locales grouped by category, along with the quizzes and open questions that the lessons refer to. URLs of media files
+and image renditions are rewritten to paths relative to `media_url` and listed in `media`, so that clients can fetch
+the files once and resolve the references locally.
+
+Packs are written below MEDIA_ROOT so that the web server can serve them as static files. The version of a pack is a
+hash of its content and part of its file name, so unchanged packs are not written again and clients can cache them
+forever. Absolute URLs in packs start with CONTENT_PACK_BASE_URL since packs are not built for a particular request.
+
+Building a pack just to find out that it hasn't changed is expensive, so `get_pack` caches the version of the last pack
+of each organization along with a key of the content it was built from: the bundle version, the assigned lessons and
+the modification times of quizzes and open questions. The pack is only built again when this key changes.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, prefetch_related_objects
+
+from material import bundles, models, payloads, serializers
+
+# Increment when changing the structure of packs
+FORMAT = 1
+DIRECTORY = 'packs'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_directory(organization_id):
+    return f'{DIRECTORY}/{organization_id}'
+
+
+def get_name(organization_id, version):
+    return f'{get_directory(organization_id)}/{version}.json.gz'
+
+
+def build_pack(organization):
+    """Return the content of the pack of `organization` as JSON-compatible data without `version`."""
+    request = payloads.build_request(settings.CONTENT_PACK_BASE_URL)
+    bundle = bundles.get_cached_bundle(organization.pk, request)
+    if bundle is None:
+        bundle = bundles.store_bundle(organization, request)
+
+    # Lesson bodies refer to quizzes and open questions by ID
+    referenced = {'quiz': set(), 'open_question': set()}
+    for category in bundle['categories']:
+        for lesson in category['lessons']:
+            for language, _ in settings.LANGUAGES:
+                for block in lesson.get(f'body_{language}', []):
+                    if block['type'] in referenced and block['value'] is not None:
+                        referenced[block['type']].add(block['value'])
+    quizzes = list(models.Quiz.objects.filter(pk__in=referenced['quiz']).order_by('pk'))
+    prefetch_related_objects(quizzes, 'questions__answers')
+    open_questions = models.OpenQuestion.objects.filter(pk__in=referenced['open_question']).order_by('pk')
+    context = {'request': request}
+
+    data = {
+        'format': FORMAT,
+        'organization': bundle['organization'],
+        'categories': bundle['categories'],
+        'quizzes': serializers.QuizSerializer(quizzes, many=True, context=context, expand=['questions.answers']).data,
+        'open_questions': serializers.OpenQuestionSerializer(open_questions, many=True, context=context).data,
+    }
+    data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+    media_url = request.build_absolute_uri(settings.MEDIA_URL)
+    data['media_url'] = media_url
+    data['media'] = rewrite_media_urls(data, media_url)
+    return data
+
+
+def rewrite_media_urls(data, media_url):
+    """
+    Replace the URLs starting with `media_url` or MEDIA_URL in `data` by paths relative to it, in place, and return
+    the sorted paths.
+
+    Besides strings consisting of a URL, this rewrites URLs in quoted attributes of HTML such as rich text.
+    """
+    url_pattern = re.compile(r'(?:^|(?<=["\']))(?:%s|%s)([^\s"\'<>?#]+)' % (re.escape(media_url),
+                                                                         re.escape(settings.MEDIA_URL)))
+    paths = set()
+
+    def replace(match):
+        paths.add(match.group(1))
+        return match.group(1)
+
+    def rewrite(value):
+        if isinstance(value, str):
+            return url_pattern.sub(replace, value)
+        if isinstance(value, list):
+            value[:] = [rewrite(item) for item in value]
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                value[key] = rewrite(item)
+        return value
+
+    rewrite(data)
+    return sorted(paths)
+
+
+def write_pack(organization):
+    """
+    Build the pack of `organization` and write it to the storage unless a pack with the same content exists, deleting
+    older packs of the organization. Return the version of the pack and whether it has been written.
+    """
+    data = build_pack(organization)
+    content = json.dumps(data, sort_keys=True, separators=(',', ':')).encode()
+    version = hashlib.sha1(content).hexdigest()
+    name = get_name(organization.pk, version)
+    if default_storage.exists(name):
+        return version, False
+
+    content = json.dumps({**data, 'version': version}, separators=(',', ':')).encode()
+    # Write to a temporary file first so that the web server never serves a partial pack. Concurrent builds of the
+    # same pack use different temporary files.
+    path = default_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(gzip.compress(content, mtime=0))
+    os.replace(temp_path, path)
+
+    _, files = default_storage.listdir(get_directory(organization.pk))
+    for old_name in files:
+        # Temporary files belong to builds in progress
+        if old_name != os.path.basename(name) and not old_name.endswith('.tmp'):
+            default_storage.delete(f'{get_directory(organization.pk)}/{old_name}')
+    return version, True
+
+
+def get_content_key(organization):
+    """Cheaply return a key that changes whenever the pack of `organization` might change."""
+    lessons = list(organization.lessons.order_by('pk').values_list('pk', flat=True))
+    # Counts reflect deleted snippets
+    snippets = [model.objects.aggregate(Count('pk'), Max('last_modified'))
+                for model in (models.Quiz, models.MultipleChoiceQuestion, models.MultipleChoiceAnswer,
+                              models.OpenQuestion)]
+    key = (FORMAT, settings.CONTENT_PACK_BASE_URL, bundles.get_version(), lessons, snippets)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def get_cache_key(organization_id):
+    return f'pack:{organization_id}'
+
+
+def get_pack(organization):
+    """
+    Return the version of the current pack of `organization`, writing it first if its content may have changed, and
+    whether it has been written.
+    """
+    # Content changing while we build the pack changes the key, so the pack will be checked again
+    content_key = get_content_key(organization)
+    entry = cache.get(get_cache_key(organization.pk))
+    if (entry is not None and entry['content_key'] == content_key
+            and default_storage.exists(get_name(organization.pk, entry['version']))):
+        return entry['version'], False
+    version, written = write_pack(organization)
+    cache.set(get_cache_key(organization.pk), {'content_key': content_key, 'version': version}, CACHE_TIMEOUT)
+    return version, written
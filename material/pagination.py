@@ -0,0 +1,20 @@
+from django.conf import settings
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Cursor pagination on the primary key.
+
+    Cursors encode a position in the ordering rather than an offset, so pages stay stable when rows are inserted
+    concurrently. Whether there are more results is determined by fetching one row more than the page size, so no
+    `COUNT(*)` query is made.
+    """
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+class PageCursorPagination(CursorPagination):
+    """Cursor pagination for Wagtail pages, which are listed in the order of the page tree."""
+    ordering = 'path'
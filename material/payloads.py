@@ -0,0 +1,92 @@
+"""
+Materialized API representations of published lessons.
+
+Serializing a lesson walks both body StreamFields and resolves every chooser block in them, which is by far the most
+expensive thing our read endpoints do. We therefore store the serialized lesson when it is published and serve it
+from the database until the lesson is published again, unpublished, moved or deleted. Some URLs in the
+representation are absolute, so payloads are stored separately for each base URL that requested them, up to
+MAX_BASE_URLS per lesson so that clients sending arbitrary hosts cannot grow the store without limit.
+"""
+from urllib.parse import urlsplit
+
+from django.http import HttpRequest, QueryDict
+from rest_framework.request import Request
+
+from material import models, serializers
+
+# Query parameters that change the representation of a lesson. Requests using any of them bypass the payload store.
+REPRESENTATION_PARAMS = {'expand', 'fields', 'inline_quizzes', 'omit'}
+# Number of base URLs for which the payload of a lesson is stored. Requests with other base URLs are served uncached.
+MAX_BASE_URLS = 4
+
+
+class InternalRequest(HttpRequest):
+    """GET request for `path` built by the backend itself, for which absolute URLs start with `base_url`."""
+    def __init__(self, base_url, path='/'):
+        super().__init__()
+        parts = urlsplit(base_url)
+        path, _, query = path.partition('?')
+        self.method = 'GET'
+        self.path = self.path_info = path
+        self.GET = QueryDict(query)
+        self.META.update({'HTTP_HOST': parts.netloc, 'QUERY_STRING': query, 'SERVER_NAME': parts.hostname,
+                          'SERVER_PORT': str(parts.port or (443 if parts.scheme == 'https' else 80))})
+        self._scheme = parts.scheme
+
+    def _get_scheme(self):
+        return self._scheme
+
+
+def get_base_url(request):
+    return request.build_absolute_uri('/')
+
+
+def is_servable(request):
+    """Return True if the stored payloads are what `request` would get from the lesson serializer."""
+    return not REPRESENTATION_PARAMS.intersection(request.query_params)
+
+
+def build_request(base_url):
+    """Return a request for which the lesson serializer builds absolute URLs starting with `base_url`."""
+    return Request(InternalRequest(base_url))
+
+
+def get_payloads(lesson_ids, request):
+    """Return a dict mapping lesson IDs to the payloads stored for the base URL of `request`."""
+    payloads = models.LessonPayload.objects.filter(lesson__in=lesson_ids, base_url=get_base_url(request))
+    return dict(payloads.values_list('lesson_id', 'data'))
+
+
+def store_payload(lesson, request):
+    """
+    Serialize `lesson` for `request` and return the result, which is stored if the lesson is live and the base URL
+    of `request` already has a payload or there is room for another one.
+    """
+    data = serializers.LessonSerializer(lesson, context={'request': request}).data
+    if lesson.live:
+        base_url = get_base_url(request)
+        stored_base_urls = list(lesson.payloads.values_list('base_url', flat=True)[:MAX_BASE_URLS])
+        if base_url in stored_base_urls or len(stored_base_urls) < MAX_BASE_URLS:
+            models.LessonPayload.objects.update_or_create(lesson=lesson, base_url=base_url, defaults={'data': data})
+    return data
+
+
+def refresh_payloads(lesson):
+    """Re-render the payloads of `lesson` for all base URLs that have requested it so far."""
+    base_urls = list(lesson.payloads.values_list('base_url', flat=True))
+    delete_payloads(lesson)
+    for base_url in base_urls:
+        store_payload(lesson, build_request(base_url))
+
+
+def delete_payloads(lesson):
+    models.LessonPayload.objects.filter(lesson=lesson).delete()
+
+
+def delete_payloads_below(page):
+    """Delete the payloads of all lessons in the subtree rooted at `page`."""
+    models.LessonPayload.objects.filter(lesson__path__startswith=page.path).delete()
+
+
+def delete_all_payloads():
+    models.LessonPayload.objects.all().delete()
@@ -39,3 +39,12 @@ class IsMemberOfThisOrganization(permissions.BasePermission):
     """
     def has_object_permission(self, request, view, obj):
         return request.user.is_authenticated and request.user.organization == obj
+
+
+class IsSupervisorOfThisOrganization(permissions.BasePermission):
+    """
+    Object-level permission to only allow supervisors of an organization and superusers to access the organization.
+    """
+    def has_object_permission(self, request, view, obj):
+        user = request.user
+        return user.is_authenticated and (user.is_superuser or (user.is_supervisor and user.organization == obj))
@@ -0,0 +1,74 @@
+"""
+Prefetching the relations that serializers output.
+
+Nested serializers, whether declared or expanded with `?expand=`, and lists of related IDs read a relation of every
+object they serialize, which costs a query per object unless the relation has been prefetched. We plan the prefetches
+from the serializer tree of the request, i.e., from the sources of the nested serializers after applying the `expand`,
+`fields` and `omit` options, so that the number of queries depends on how deeply the response is expanded but not on
+how many objects it contains.
+
+A list serializer can restrict the related objects that are fetched by defining `filter_prefetch_queryset(queryset)`,
+but it must still filter the objects it is given since they might not have been prefetched.
+"""
+from django.db.models import Prefetch
+from rest_framework import permissions
+from rest_framework.relations import ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from material.fieldsets import get_deferred_fields
+from material.serializers import apply_representation_options
+
+
+def get_relation(model, source):
+    """Return the field or reverse relation of `model` that is accessed as the attribute `source`, if any."""
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        # Reverse relations are accessed by their accessor name, e.g., `user_set`
+        name = field.name if field.concrete or not field.auto_created else field.get_accessor_name()
+        if name == source:
+            return field
+    return None
+
+
+def get_prefetches(serializer):
+    """
+    Return `Prefetch` objects for the relations read by `serializer` (or its child if it is a list serializer),
+    including those of its nested serializers, taking `?expand=`, `?fields=` and `?omit=` into account.
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    meta = getattr(serializer, 'Meta', None)
+    if not hasattr(meta, 'model'):
+        return []
+    apply_representation_options(serializer)
+
+    prefetches = []
+    for field in serializer.fields.values():
+        if not isinstance(field, (BaseSerializer, ManyRelatedField)):
+            continue
+        relation = get_relation(meta.model, field.source)
+        if relation is None or relation.related_model is None:
+            continue
+        # The foreign key of a reverse relation is needed for attaching the related objects to their parents
+        needed = [relation.remote_field.name] if relation.one_to_many else []
+        queryset = relation.related_model._default_manager.all()
+        if isinstance(field, ManyRelatedField):
+            # Only the IDs are output
+            queryset = queryset.only('pk', *needed)
+        else:
+            deferred = [name for name in get_deferred_fields(field) if name not in needed]
+            queryset = queryset.defer(*deferred).prefetch_related(*get_prefetches(field))
+            if hasattr(field, 'filter_prefetch_queryset'):
+                queryset = field.filter_prefetch_queryset(queryset)
+        prefetches.append(Prefetch(field.source, queryset=queryset))
+    return prefetches
+
+
+class PrefetchMixin:
+    """Viewset mixin that prefetches the relations read by the serializer when responding to safe requests."""
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = queryset.prefetch_related(*get_prefetches(self.get_serializer()))
+        return queryset
@@ -0,0 +1,152 @@
+"""
+Progress of the members of each organization in each lesson, kept in `OrganizationLessonProgress` for supervisors.
+
+When block completions are inserted or deleted, `record_completions` adjusts the rollup row of the member's
+organization by the difference the completions make, which only takes a few queries on the member's own completions in
+the lesson. Changing a lesson body changes what counts as progress, so then the rows of the lesson are recomputed from
+the completions of all members with `refresh`, as they are by `manage.py rebuildprogress`.
+"""
+import threading
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from material import models
+
+# Blocks whose completions are about to be deleted, by user and lesson, for each thread
+_deleting = threading.local()
+
+
+def refresh(lesson_ids, organizations=None):
+    """
+    Recompute the progress in the given lessons for the given organizations (a queryset or an iterable of IDs), or for
+    all organizations if `organizations` is None.
+    """
+    for lesson_id in set(lesson_ids):
+        _refresh_lesson(lesson_id, organizations)
+
+
+def refresh_for_users(lesson_ids, user_ids):
+    """Recompute the progress in the given lessons for the organizations of the given users."""
+    organizations = (models.User.objects.filter(pk__in=user_ids, organization__isnull=False)
+                     .values_list('organization', flat=True).distinct())
+    organizations = list(organizations)
+    if organizations:
+        refresh(lesson_ids, organizations)
+
+
+def rebuild():
+    """Recompute the progress of all organizations in all lessons."""
+    with transaction.atomic():
+        models.OrganizationLessonProgress.objects.all().delete()
+        refresh(models.Lesson.objects.values_list('pk', flat=True))
+
+
+def _count_by_language(blocks):
+    rows = blocks.order_by().values('language').annotate(count=Count('pk')).values_list('language', 'count')
+    return Counter(dict(rows))
+
+
+def _is_finished(completed, total):
+    # A member has finished the lesson if they completed all blocks in some language
+    return any(count >= total[language] for language, count in completed.items() if count > 0)
+
+
+def record_completions(user_id, lesson_id, blocks, delta):
+    """
+    Update the progress of the user's organization in the lesson after the user's completions of `blocks` in the
+    lesson have been inserted (`delta=1`) or deleted (`delta=-1`).
+    """
+    organization_id = models.User.objects.filter(pk=user_id).values_list('organization', flat=True).first()
+    if organization_id is None:
+        return
+    lesson_blocks = models.LessonBlock.objects.filter(lesson_id=lesson_id)
+    # Completions of blocks that are not part of the lesson don't count. A block may be part of the lesson in several
+    # languages, in which it counts for each of them, but it is still completed only once.
+    changed_blocks = set(lesson_blocks.filter(block__in=blocks).values_list('block', 'language'))
+    if not changed_blocks:
+        return
+    changed = Counter(language for _, language in changed_blocks)
+    key = {'organization_id': organization_id, 'lesson_id': lesson_id}
+    rows = models.OrganizationLessonProgress.objects.filter(**key)
+    with transaction.atomic():
+        if delta > 0:
+            models.OrganizationLessonProgress.objects.get_or_create(**key)
+        # Lock the row before counting, so that concurrent changes by the same member are counted in turn. Rows of
+        # deleted lessons may be gone already.
+        if not list(rows.select_for_update()):
+            return
+        total = _count_by_language(lesson_blocks)
+        completed_blocks = models.BlockCompletion.objects.filter(user_id=user_id, lesson_id=lesson_id).values('block')
+        after = _count_by_language(lesson_blocks.filter(block__in=completed_blocks))
+        before = Counter(after)
+        before.subtract({language: delta * count for language, count in changed.items()})
+        rows.update(
+            completed_blocks=F('completed_blocks') + delta * len({block for block, _ in changed_blocks}),
+            members_started=F('members_started') + (sum(after.values()) > 0) - (sum(before.values()) > 0),
+            members_finished=F('members_finished') + _is_finished(after, total) - _is_finished(before, total),
+        )
+
+
+def _get_deleting():
+    if not hasattr(_deleting, 'blocks'):
+        _deleting.blocks = defaultdict(set)
+    return _deleting.blocks
+
+
+def prepare_deletion(user_id, lesson_id, block):
+    """Remember that the user's completion of `block` in the lesson is about to be deleted."""
+    _get_deleting()[user_id, lesson_id].add(block)
+
+
+def record_deletion(user_id, lesson_id):
+    """
+    Update the progress after completions of the user in the lesson have been deleted.
+
+    Deleting a user deletes all their completions with one query before sending the signals for each of them, so the
+    deleted completions are recorded together when the first of these signals arrives.
+    """
+    blocks = _get_deleting().pop((user_id, lesson_id), set())
+    # Deletions that have failed are not recorded
+    blocks -= set(models.BlockCompletion.objects.filter(user_id=user_id, lesson_id=lesson_id, block__in=blocks)
+                  .values_list('block', flat=True))
+    if blocks:
+        record_completions(user_id, lesson_id, blocks, -1)
+
+
+def _refresh_lesson(lesson_id, organizations):
+    # A block may be part of the lesson in several languages
+    block_languages = defaultdict(set)
+    for block, language in models.LessonBlock.objects.filter(lesson_id=lesson_id).values_list('block', 'language'):
+        block_languages[block].add(language)
+    total_blocks = Counter(language for languages in block_languages.values() for language in languages)
+
+    completions = models.BlockCompletion.objects.filter(lesson_id=lesson_id, user__organization__isnull=False)
+    stale = models.OrganizationLessonProgress.objects.filter(lesson_id=lesson_id)
+    if organizations is not None:
+        completions = completions.filter(user__organization__in=organizations)
+        stale = stale.filter(organization__in=organizations)
+
+    # Completed blocks per organization, and per organization, member and language
+    completed_blocks = Counter()
+    completed = defaultdict(lambda: defaultdict(Counter))
+    for organization_id, user_id, block in completions.values_list('user__organization', 'user', 'block'):
+        # Completions of blocks that have been removed from the lesson don't count
+        if block in block_languages:
+            completed_blocks[organization_id] += 1
+            completed[organization_id][user_id].update(block_languages[block])
+
+    rows = [
+        models.OrganizationLessonProgress(
+            organization_id=organization_id,
+            lesson_id=lesson_id,
+            completed_blocks=completed_blocks[organization_id],
+            members_started=len(members),
+            members_finished=sum(_is_finished(counts, total_blocks) for counts in members.values()),
+        )
+        for organization_id, members in completed.items()
+    ]
+    with transaction.atomic():
+        stale.delete()
+        models.OrganizationLessonProgress.objects.bulk_create(rows)
@@ -0,0 +1,96 @@
+"""
+Work queues in the database, used by `material.tasks` and `material.outbox`.
+
+Items of a queue are rows of a model derived from `material.models.QueuedItem`. A worker claims a batch of items that
+are due for a lease duration in a short transaction and then processes them outside of any transaction, so that other
+workers skip these items without rows being locked while the work is done. Items claimed by crashed workers are
+processed again once their lease has expired. Failed items are retried with exponential backoff up to a maximum
+number of attempts, after which they are kept for inspection with `next_attempt_at` set to null.
+
+`WorkerCommand` is the base of the management commands that process a queue.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Delay after the first failed attempt, which doubles with every further attempt up to MAX_RETRY_DELAY
+RETRY_DELAY = timedelta(minutes=1)
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+
+def get_retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def claim(model, batch_size, lease_duration):
+    """Return up to `batch_size` items of the queue `model` that are due, claiming them for `lease_duration`."""
+    now = timezone.now()
+    with transaction.atomic():
+        # Other workers skip the items we are claiming
+        items = list(model.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(next_attempt_at__lte=now, claimed_until__lte=now)
+                     .order_by('next_attempt_at', 'pk')[:batch_size])
+        model.objects.filter(pk__in=[item.pk for item in items]).update(claimed_until=now + lease_duration)
+    return items
+
+
+def record_failure(item, error, max_attempts):
+    """Schedule the claimed `item` to be retried after failing with `error`, unless it has failed too often."""
+    item.attempts += 1
+    item.last_error = f'{type(error).__name__}: {error}'
+    if item.attempts < max_attempts:
+        item.next_attempt_at = timezone.now() + get_retry_delay(item.attempts)
+    else:
+        logger.error("Giving up on %s %s after %d attempts", item._meta.verbose_name, item.pk, item.attempts)
+        item.next_attempt_at = None
+    # Another worker may have taken over and finished the item after our lease expired
+    type(item).objects.filter(pk=item.pk).update(attempts=item.attempts, last_error=item.last_error,
+                                                 next_attempt_at=item.next_attempt_at, claimed_until=timezone.now())
+
+
+def process_all(process_batch, batch_size):
+    """
+    Call `process_batch(batch_size)`, which must return the number of items that were due in the batch, until a batch
+    is not full. Return the total number of items that were due.
+    """
+    total = 0
+    while True:
+        count = process_batch(batch_size)
+        total += count
+        if count < batch_size:
+            return total
+
+
+class WorkerCommand(BaseCommand):
+    """
+    Processes the queued items that are due once or, with `--loop`, periodically. Subclasses set `items` (a plural
+    noun for the output), `default_batch_size` and `batch_size_help`, and implement `process`.
+    """
+    items = 'items'
+    default_batch_size = 10
+    batch_size_help = "Number of items to claim at once"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=self.default_batch_size, help=self.batch_size_help)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help=f"Keep running and check for queued {self.items} every SECONDS seconds")
+
+    def process(self, batch_size):
+        """Process all queued items that are due and return their number."""
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process(options['batch_size'])
+            if processed or options['verbosity'] > 1:
+                self.stdout.write(f"Processed {processed} queued {self.items}")
+            if options['loop'] is None:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,86 @@
+"""
+Eager generation of the image renditions used by the API, and an in-process index of their representations.
+
+Wagtail creates renditions lazily when they are first requested, so a cold API request pays for decoding, resizing
+and encoding images, and every request pays a query per image for looking the rendition up. We generate the
+renditions in the background when an image is uploaded or attached to a page, and remember the representations of
+all renditions we have seen so that list endpoints can include images without any queries.
+"""
+import threading
+from collections import OrderedDict
+
+from wagtail.images import get_image_model
+from wagtail.images.models import Filter
+
+# Filter spec of the renditions of category and lesson images
+IMAGE_FILTER_SPEC = 'fill-400x200'
+
+# All filter specs for which the API returns renditions. These are generated eagerly.
+API_FILTER_SPECS = [IMAGE_FILTER_SPEC]
+
+
+class RenditionIndex:
+    """
+    Bounded mapping from images and filter specs to the representation of the corresponding rendition.
+
+    Keys contain everything that determines the rendition besides the filter spec, namely the image's file name and
+    focal point, so entries never go stale when an image is changed. (Entries for old versions of the image simply
+    won't be looked up anymore.)
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(image, filter_spec):
+        focal_point_key = Filter(spec=filter_spec).get_cache_key(image)
+        return (image.id, filter_spec, image.file.name, focal_point_key)
+
+    def get(self, image, filter_spec):
+        """Return the representation of the rendition of `image` for `filter_spec`, or None if it's not indexed."""
+        key = self.key(image, filter_spec)
+        with self._lock:
+            representation = self._entries.get(key)
+            if representation is None:
+                return None
+            self._entries.move_to_end(key)
+        return OrderedDict(representation)
+
+    def add(self, image, rendition):
+        """Index `rendition` of `image` and return its representation."""
+        key = self.key(image, rendition.filter_spec)
+        representation = OrderedDict([
+            ('url', rendition.url),
+            ('width', rendition.width),
+            ('height', rendition.height),
+            ('alt', rendition.alt),
+        ])
+        with self._lock:
+            self._entries[key] = representation
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return OrderedDict(representation)
+
+    def is_complete(self, image):
+        """Return True if the renditions of `image` for all API filter specs are indexed."""
+        with self._lock:
+            return all(self.key(image, filter_spec) in self._entries for filter_spec in API_FILTER_SPECS)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+index = RenditionIndex()
+
+
+def generate_renditions(image_id):
+    """Create the renditions for all API filter specs of the given image unless they exist, and index them."""
+    try:
+        image = get_image_model().objects.get(pk=image_id)
+    except get_image_model().DoesNotExist:
+        return
+    for filter_spec in API_FILTER_SPECS:
+        index.add(image, image.get_rendition(filter_spec))
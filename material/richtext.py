@@ -0,0 +1,158 @@
+"""
+Cached and batched expansion of rich text from its database representation into HTML.
+
+Wagtail's `expand_db_html` resolves every page link, document link and embed in a piece of rich text with separate
+queries, and it does so again on every request even though our rich text almost never changes. We cache expanded
+HTML keyed by a hash of the stored HTML and the site root, along with a version that is bumped whenever something
+that rich text can refer to changes (see `material.signals`). The version is stored in the database (see
+`material.versions`), so that changes invalidate the rich text cached by other processes as well. On a cache miss,
+`expand_many` resolves the references in all the given HTML strings together with one query per type.
+"""
+import hashlib
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.timezone import now
+from wagtail.core.models import Locale, Page
+from wagtail.core.rich_text import features
+from wagtail.core.rich_text.rewriters import (FIND_A_TAG, FIND_EMBED_TAG, EmbedRewriter, LinkRewriter,
+                                              MultiRuleRewriter, extract_attrs)
+from wagtail.documents import get_document_model
+from wagtail.embeds.embeds import get_embed_hash
+from wagtail.embeds.models import Embed
+from wagtail.images import get_image_model
+from wagtail.images.formats import get_image_format
+
+from material import versions
+
+CACHE_TIMEOUT = 24 * 60 * 60
+# Name of the rich text version in `material.versions`
+VERSION = 'richtext'
+
+
+def get_version():
+    return versions.get_version(VERSION)[0]
+
+
+def bump_version():
+    """Invalidate all cached rich text."""
+    versions.bump_version(VERSION)
+
+
+def get_cache_key(html, site_root_id, version):
+    html_hash = hashlib.sha1(html.encode()).hexdigest()
+    return f'richtext:{version}:{site_root_id}:{html_hash}'
+
+
+def expand_many(htmls, site_root_id=None, version=None):
+    """
+    Return a dict mapping each of the given rich text strings in database representation to its expansion.
+
+    Callers expanding rich text in several steps can pass the result of `get_version` as `version` to save a query.
+    """
+    htmls = set(htmls)
+    if version is None:
+        version = get_version()
+    keys = {get_cache_key(html, site_root_id, version): html for html in htmls}
+    cached = cache.get_many(keys)
+    expanded = {keys[key]: value for key, value in cached.items()}
+    missing = [html for html in htmls if html not in expanded]
+    if missing:
+        rewrite = BatchRewriter(missing)
+        new = {html: rewrite(html) for html in missing}
+        cache.set_many({get_cache_key(html, site_root_id, version): value for html, value in new.items()},
+                       CACHE_TIMEOUT)
+        expanded.update(new)
+    return expanded
+
+
+def expand(html, site_root_id=None, version=None):
+    return expand_many([html], site_root_id, version)[html]
+
+
+class BatchRewriter:
+    """
+    Does the same as `expand_db_html`, but resolves the pages, documents, images and media embeds referenced in all
+    the rich text strings given to the constructor with one query per type. Other link and embed types are expanded
+    by their handlers as usual.
+    """
+    def __init__(self, htmls):
+        ids = defaultdict(set)
+        embed_urls = set()
+        for html in htmls:
+            for match in FIND_A_TAG.finditer(html):
+                attrs = extract_attrs(match.group(1))
+                if attrs.get('linktype') in ('page', 'document') and 'id' in attrs:
+                    ids[attrs['linktype']].add(attrs['id'])
+            for match in FIND_EMBED_TAG.finditer(html):
+                attrs = extract_attrs(match.group(1))
+                if attrs.get('embedtype') == 'image' and 'id' in attrs:
+                    ids['image'].add(attrs['id'])
+                elif attrs.get('embedtype') == 'media' and 'url' in attrs:
+                    embed_urls.add(attrs['url'])
+
+        self.page_urls = self._get_page_urls(ids['page'])
+        self.documents = self._in_bulk(get_document_model(), ids['document'])
+        self.images = self._in_bulk(get_image_model(), ids['image'])
+        self.embeds = {}
+        if embed_urls:
+            hashes = {get_embed_hash(url): url for url in embed_urls}
+            for embed in Embed.objects.exclude(cache_until__lte=now()).filter(hash__in=hashes):
+                self.embeds[hashes[embed.hash]] = embed
+
+        link_rules = {linktype: handler.expand_db_attributes for linktype, handler in features.get_link_types().items()}
+        link_rules.update(page=self.expand_page_link, document=self.expand_document_link)
+        embed_rules = {embedtype: handler.expand_db_attributes
+                       for embedtype, handler in features.get_embed_types().items()}
+        self.expand_media_embed_fallback = embed_rules.get('media')
+        embed_rules.update(image=self.expand_image_embed, media=self.expand_media_embed)
+        self.rewrite = MultiRuleRewriter([LinkRewriter(link_rules), EmbedRewriter(embed_rules)])
+
+    def __call__(self, html):
+        return self.rewrite(html)
+
+    @staticmethod
+    def _in_bulk(model, ids):
+        ids = [int(id) for id in ids if id.isdigit()]
+        return {str(pk): obj for pk, obj in model.objects.in_bulk(ids).items()} if ids else {}
+
+    def _get_page_urls(self, ids):
+        pages = self._in_bulk(Page, ids)
+        if not pages:
+            return {}
+        # Like Page.localized, use live translations into the active locale if there are any
+        try:
+            active_locale = Locale.get_active()
+        except (LookupError, Locale.DoesNotExist):
+            return {id: escape(page.specific_deferred.url) for id, page in pages.items()}
+        foreign_pages = {page.translation_key: page for page in pages.values() if page.locale_id != active_locale.id}
+        translations = {}
+        if foreign_pages:
+            translations = {page.translation_key: page for page in Page.objects.filter(
+                translation_key__in=foreign_pages, locale=active_locale, live=True)}
+        return {id: escape(translations.get(page.translation_key, page).specific_deferred.url)
+                for id, page in pages.items()}
+
+    def expand_page_link(self, attrs):
+        url = self.page_urls.get(attrs.get('id'))
+        return f'<a href="{url}">' if url is not None else '<a>'
+
+    def expand_document_link(self, attrs):
+        document = self.documents.get(attrs.get('id'))
+        return f'<a href="{escape(document.url)}">' if document else '<a>'
+
+    def expand_image_embed(self, attrs):
+        image = self.images.get(attrs.get('id'))
+        if not image:
+            return '<img alt="">'
+        image_format = get_image_format(attrs['format'])
+        return image_format.image_to_html(image, attrs.get('alt', ''))
+
+    def expand_media_embed(self, attrs):
+        embed = self.embeds.get(attrs['url'])
+        if embed is None:
+            # Not in the database yet, so let Wagtail ask the embed finders
+            return self.expand_media_embed_fallback(attrs)
+        return render_to_string('wagtailembeds/embed_frontend.html', {'embed': embed})
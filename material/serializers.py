@@ -1,16 +1,94 @@
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db.models import Manager, prefetch_related_objects
+from drf_base64.fields import Base64ImageField
 from drf_base64.serializers import ModelSerializer as Base64ModelSerializer
 from rest_flex_fields.serializers import FlexFieldsSerializerMixin
 from rest_framework import serializers
 from wagtail.api.v2.serializers import PageSerializer
-from wagtail.images.api.fields import ImageRenditionField
-from wagtail.core.rich_text import expand_db_html
+from wagtail.images.api import fields as image_fields
+from wagtail.images.models import Filter, SourceImageIOError
+from wagtail.core.models import Site
+
+from material import avatars, models, renditions, richtext, uploads
+from material.blocks import prefetch_chooser_blocks
 
-from material import models
+
+def apply_representation_options(serializer):
+    """
+    Apply the `fields`, `omit` and `expand` options of a drf-flex-fields serializer, including those from query
+    parameters, to `serializer.fields`. drf-flex-fields only does this when serializing the first object, which is
+    too late for preparing the data.
+    """
+    if isinstance(serializer, FlexFieldsSerializerMixin) and not serializer._flex_fields_rep_applied:
+        serializer.apply_flex_fields(serializer.fields, serializer._flex_options_rep_only)
+        serializer._flex_fields_rep_applied = True
 
 
 class RichTextField(serializers.CharField):
+    """
+    Read-only field for rich text, which is expanded from its database representation using `material.richtext`.
+
+    Expansions prepared by RichTextListSerializer for the whole response are used if available.
+    """
     def to_representation(self, value):
-        return expand_db_html(value)
+        prepared = self.context.get('expanded_rich_text', {})
+        if value in prepared:
+            return prepared[value]
+        return richtext.expand(value, get_site_root_id(self.context.get('request')),
+                               get_rich_text_version(self.context))
+
+
+class RichTextListSerializer(serializers.ListSerializer):
+    """Expands the rich text fields of all objects at once before serializing them."""
+    def to_representation(self, data):
+        instances = list(data.all() if isinstance(data, Manager) else data)
+        fields = [field for field in self.child.fields.values() if isinstance(field, RichTextField)]
+        htmls = [field.get_attribute(instance) for instance in instances for field in fields]
+        expanded = richtext.expand_many([html for html in htmls if html],
+                                        get_site_root_id(self.context.get('request')),
+                                        get_rich_text_version(self.context))
+        self.context.setdefault('expanded_rich_text', {}).update(expanded)
+        return super().to_representation(instances)
+
+
+def get_rich_text_version(context):
+    """Return the rich text version, querying it only once per serializer context."""
+    if 'rich_text_version' not in context:
+        context['rich_text_version'] = richtext.get_version()
+    return context['rich_text_version']
+
+
+def get_site_root_id(request):
+    site = Site.find_for_request(request) if request else None
+    return site.root_page_id if site else None
+
+
+class ImageRenditionField(image_fields.ImageRenditionField):
+    """
+    Like Wagtail's ImageRenditionField, but looks the rendition up in `material.renditions.index` and in the image's
+    prefetched renditions before querying for it.
+    """
+    def to_representation(self, image):
+        representation = renditions.index.get(image, self.filter_spec)
+        if representation is not None:
+            return representation
+
+        rendition = None
+        prefetched_renditions = getattr(image, '_prefetched_objects_cache', {}).get('renditions')
+        if prefetched_renditions is not None:
+            focal_point_key = Filter(spec=self.filter_spec).get_cache_key(image)
+            rendition = next((r for r in prefetched_renditions
+                              if r.filter_spec == self.filter_spec and r.focal_point_key == focal_point_key), None)
+        if rendition is None:
+            try:
+                rendition = image.get_rendition(self.filter_spec)
+            except SourceImageIOError:
+                return OrderedDict([
+                    ('error', 'SourceImageIOError'),
+                ])
+        return renditions.index.add(image, rendition)
 
 
 class StaticPageSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
@@ -20,6 +98,7 @@ class StaticPageSerializer(FlexFieldsSerializerMixin, serializers.ModelSerialize
     class Meta:
         model = models.StaticPage
         fields = ['url', 'id', 'title_en', 'title_fi', 'body_en', 'body_fi']
+        list_serializer_class = RichTextListSerializer
 
 
 class MultipleChoiceAnswerSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
@@ -33,7 +112,7 @@ class MultipleChoiceQuestionSerializer(FlexFieldsSerializerMixin, serializers.Mo
         model = models.MultipleChoiceQuestion
         fields = ['url', 'id', 'text_en', 'text_fi', 'answers']
         expandable_fields = {
-            'answers': (MultipleChoiceAnswerSerializer, {'source': 'answers', 'many': True, 'omit': ['question']})
+            'answers': (MultipleChoiceAnswerSerializer, {'many': True, 'omit': ['question']})
         }
 
 
@@ -52,29 +131,70 @@ class OpenQuestionSerializer(serializers.ModelSerializer):
         fields = ['url', 'id', 'text_en', 'text_fi']
 
 
+class LessonListSerializer(serializers.ListSerializer):
+    """Resolves the chooser blocks in the bodies of all lessons at once before serializing them."""
+    def to_representation(self, data):
+        lessons = list(data.all() if isinstance(data, Manager) else data)
+        self.child.prefetch_bodies(lessons)
+        return super().to_representation(lessons)
+
+
 class LessonSerializer(FlexFieldsSerializerMixin, PageSerializer):
-    image = ImageRenditionField('fill-400x200')
+    image = ImageRenditionField(renditions.IMAGE_FILTER_SPEC)
 
     class Meta:
         model = models.Lesson
         fields = ['url', 'id', 'title_en', 'title_fi', 'description_en', 'description_fi', 'image', 'body_en',
                   'body_fi', 'block_ids_en', 'block_ids_fi']
+        list_serializer_class = LessonListSerializer
 
     # This hack is for getting PageSerializer to work, but I don't know exactly what it does :(
     meta_fields = []
     child_serializer_classes = {}
 
+    def prefetch_bodies(self, lessons):
+        """
+        Resolve the chooser blocks in both locales of the given lessons' bodies with one query per model, or fetch
+        the block IDs of lessons whose bodies have been deferred.
+
+        If quizzes are to be inlined, also fetch their questions and answers with one query each.
+        """
+        # We need to know now whether we'll output the bodies at all
+        apply_representation_options(self)
+        # block_ids_* also need the bodies but don't resolve chooser blocks
+        body_fields = [name for name in ('body_en', 'body_fi') if name in self.fields]
+        bodies = [getattr(lesson, name) for lesson in lessons for name in body_fields]
+        prefetch_chooser_blocks(bodies)
+        if 'block_ids_en' in self.fields or 'block_ids_fi' in self.fields:
+            # Lessons with deferred bodies take the block IDs from LessonBlock
+            prefetch_related_objects([lesson for lesson in lessons
+                                      if {'body_en', 'body_fi'} & lesson.get_deferred_fields()], 'body_blocks')
+        if self.context.get('inline_quizzes'):
+            quizzes = [child.value for body in bodies for child in body if isinstance(child.value, models.Quiz)]
+            prefetch_related_objects(quizzes, 'questions__answers')
+            # Used by QuizChooserBlock. Passing the parent keeps the query parameters of the lesson request from
+            # applying to the quizzes.
+            self.context.setdefault('quiz_serializer', QuizSerializer(context=self.context,
+                                                                      parent=self,
+                                                                      expand=['questions.answers']))
+
+    def to_representation(self, instance):
+        if not isinstance(self.parent, LessonListSerializer):
+            self.prefetch_bodies([instance])
+        return super().to_representation(instance)
+
 
 class CategorySerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
     description_en = RichTextField()
     description_fi = RichTextField()
-    image = ImageRenditionField('fill-400x200')
+    image = ImageRenditionField(renditions.IMAGE_FILTER_SPEC)
 
     class Meta:
         model = models.Category
         fields = ['url', 'id', 'title_en', 'title_fi', 'description_en', 'description_fi', 'image', 'lessons']
+        list_serializer_class = RichTextListSerializer
         expandable_fields = {
-            'lessons': (LessonSerializer, {'many': True, 'source': 'lessons'})
+            'lessons': (LessonSerializer, {'many': True})
         }
 
     lessons = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -91,6 +211,21 @@ class BlockCompletionSerializer(FlexFieldsSerializerMixin, serializers.ModelSeri
         return value
 
 
+class BlockCompletionBatchItemSerializer(serializers.Serializer):
+    """
+    Validates one item of a batch of block completions without touching the database. The user may be omitted and
+    defaults to the requesting user; the lessons are checked for existence by the view for the whole batch at once.
+    """
+    user = serializers.UUIDField(required=False)
+    lesson = serializers.IntegerField()
+    block = serializers.UUIDField()
+
+    def validate_user(self, value):
+        if value != self.context['request'].user.pk:
+            raise serializers.ValidationError("User specified in BlockCompletion object is not yourself")
+        return value
+
+
 class MultipleChoiceResponseSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.MultipleChoiceResponse
@@ -102,6 +237,47 @@ class MultipleChoiceResponseSerializer(FlexFieldsSerializerMixin, serializers.Mo
         return value
 
 
+class QuizSubmissionResponseSerializer(serializers.Serializer):
+    answer = serializers.IntegerField()
+    response = serializers.BooleanField()
+
+
+class QuizSubmissionSerializer(serializers.Serializer):
+    """
+    Validates responses to the multiple choice answers of the quiz given in the context as `quiz`.
+
+    All answers of the quiz are loaded with one query when validating and kept in `answers` for grading.
+    """
+    responses = QuizSubmissionResponseSerializer(many=True, allow_empty=False)
+
+    def validate_responses(self, value):
+        answers = (models.MultipleChoiceAnswer.objects.filter(question__quiz=self.context['quiz'])
+                   .order_by('question__sort_order', 'question_id', 'sort_order')
+                   .only('id', 'question_id', 'correct'))
+        self.answers = {answer.pk: answer for answer in answers}
+        foreign = sorted({item['answer'] for item in value} - self.answers.keys())
+        if foreign:
+            raise serializers.ValidationError(f"Answers {foreign} do not belong to this quiz")
+        return value
+
+    def grade(self, responses):
+        """
+        Grade the quiz given a dict mapping answer IDs to the user's responses. A question is answered correctly if
+        the user responded to each of its answers according to whether it is correct.
+        """
+        questions = defaultdict(list)
+        for answer in self.answers.values():
+            questions[answer.question_id].append(answer)
+        graded = [{'question': question_id,
+                   'correct': all(responses.get(answer.pk) == answer.correct for answer in answers)}
+                  for question_id, answers in questions.items()]
+        return {
+            'questions': graded,
+            'score': sum(question['correct'] for question in graded),
+            'max_score': len(graded),
+        }
+
+
 class OpenQuestionResponseSerializer(FlexFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.OpenQuestionResponse
@@ -157,10 +333,26 @@ class OrganizationSerializerWithSupervisors(FlexFieldsSerializerMixin, serialize
         }
 
 
+class LimitedBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField that enforces the limits of `material.uploads` before decoding the data and before Pillow decodes
+    the image.
+    """
+    def to_internal_value(self, data):
+        if isinstance(data, str) and len(data) > uploads.get_max_base64_length():
+            raise serializers.ValidationError(
+                f"The image must not be larger than {settings.MAX_IMAGE_UPLOAD_SIZE} bytes.")
+        data = self._decode(data)
+        if hasattr(data, 'read'):
+            uploads.validate_image(data)
+        return serializers.ImageField.to_internal_value(self, data)
+
+
 class UserSerializer(FlexFieldsSerializerMixin, Base64ModelSerializer):
     class Meta:
         model = models.User
-        fields = ['url', 'id', 'email', 'organization', 'username', 'name', 'avatar', 'is_supervisor', 'is_superuser']
+        fields = ['url', 'id', 'email', 'organization', 'username', 'name', 'avatar', 'avatar_urls', 'is_supervisor',
+                  'is_superuser']
         read_only_fields = ['is_supervisor', 'is_superuser']
         expandable_fields = {
             'organization': OrganizationSerializer,
@@ -169,6 +361,14 @@ class UserSerializer(FlexFieldsSerializerMixin, Base64ModelSerializer):
             'open_question_responses': (OpenQuestionResponseSerializer, {'source': 'openquestionresponse_set', 'many': True, 'omit': ['user']}),
         }
 
+    avatar = LimitedBase64ImageField(required=False, allow_null=True)
+
+    # URLs of the downscaled copies of the avatar by size, which are those of the original until they are ready
+    avatar_urls = serializers.SerializerMethodField()
+
+    def get_avatar_urls(self, user):
+        return avatars.get_urls(user, self.context.get('request'))
+
     def update(self, instance, validated_data):
         # Do not allow updating the organization
         validated_data.pop('organization', None)
@@ -178,8 +378,12 @@ class UserSerializer(FlexFieldsSerializerMixin, Base64ModelSerializer):
 class SupervisorListSerializer(serializers.ListSerializer):
     """Serializes models (such as User) that have an `is_supervisor` field"""
     # https://stackoverflow.com/questions/28163556/how-do-you-filter-a-nested-serializer-in-django-rest-framework
+    def filter_prefetch_queryset(self, queryset):
+        return queryset.filter(is_supervisor=True)
+
     def to_representation(self, data):
-        data = data.filter(is_supervisor=True)
+        # Filter in Python so that prefetched users are not fetched again
+        data = [user for user in (data.all() if isinstance(data, Manager) else data) if user.is_supervisor]
         return super().to_representation(data)
 
 
@@ -0,0 +1,254 @@
+import time
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from wagtail.core.models import Page
+from wagtail.core.signals import page_published, page_unpublished, post_page_move
+from wagtail.documents import get_document_model
+from wagtail.embeds.models import Embed
+from wagtail.images import get_image_model
+from wagtailmedia.models import get_media_model
+
+from material import (authentication, avatars, blobs, bundles, conditional, models, payloads, progress, renditions,
+                      richtext, snapshots, tasks, transcoding)
+
+
+# Payloads of deleted lessons are removed by the foreign key cascade, so we don't need a handler for deletion.
+
+@receiver(page_published, sender=models.Lesson)
+def refresh_lesson_payloads(sender, instance, **kwargs):
+    payloads.refresh_payloads(instance)
+
+
+@receiver(page_unpublished, sender=models.Lesson)
+def delete_lesson_payloads(sender, instance, **kwargs):
+    payloads.delete_payloads(instance)
+
+
+@receiver(post_page_move)
+def delete_moved_lesson_payloads(sender, instance, **kwargs):
+    # Moving a lesson or its category changes the lesson URL
+    payloads.delete_payloads_below(instance)
+
+
+# Lesson payloads contain URLs of images and media files without referencing them in a way we could query, so
+# changing any of these invalidates all payloads. This happens rarely enough that it's not worth being smarter.
+
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_media_model())
+@receiver(post_delete, sender=get_media_model())
+@receiver(post_save, sender=models.MediaStreams)
+@receiver(post_delete, sender=models.MediaStreams)
+def delete_all_lesson_payloads(sender, **kwargs):
+    payloads.delete_all_payloads()
+
+
+@receiver(post_save, sender=get_image_model())
+def generate_image_renditions(sender, instance, update_fields=None, **kwargs):
+    # Wagtail saves images again after uploading to fill in metadata like the file size
+    if update_fields is None or 'file' in update_fields:
+        tasks.run_in_background(renditions.generate_renditions, instance.pk)
+
+
+@receiver(page_published, sender=models.Category)
+@receiver(page_published, sender=models.Lesson)
+def generate_page_image_renditions(sender, instance, **kwargs):
+    if instance.image_id:
+        tasks.run_in_background(renditions.generate_renditions, instance.image_id)
+
+
+# Media items are transcoded in the background after uploading (see material/transcoding.py)
+
+@receiver(post_save, sender=get_media_model())
+def transcode_media(sender, instance, **kwargs):
+    if transcoding.needs_transcoding(instance):
+        tasks.run_in_worker(transcoding.transcode_media, instance.pk, instance.file.name)
+
+
+@receiver(post_delete, sender=get_media_model())
+def delete_media_streams(sender, instance, **kwargs):
+    tasks.run_in_background(transcoding.delete_streams, instance.pk)
+
+
+# Lessons contain the URLs and streams of media items (see material/conditional.py)
+
+@receiver(post_save, sender=get_media_model())
+@receiver(post_delete, sender=get_media_model())
+@receiver(post_save, sender=models.MediaStreams)
+@receiver(post_delete, sender=models.MediaStreams)
+def invalidate_media_version(sender, **kwargs):
+    conditional.bump_media_version()
+
+
+# Expanded rich text contains page URLs, document URLs, images and embeds
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=Embed)
+@receiver(post_delete, sender=Embed)
+def invalidate_rich_text(sender, **kwargs):
+    richtext.bump_version()
+
+
+# Home bundles contain pages, rich text, the URLs of images and media files, and organizations with their lessons
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_media_model())
+@receiver(post_delete, sender=get_media_model())
+@receiver(post_save, sender=models.MediaStreams)
+@receiver(post_delete, sender=models.MediaStreams)
+@receiver(post_save, sender=Embed)
+@receiver(post_delete, sender=Embed)
+@receiver(post_save, sender=models.Organization)
+@receiver(post_delete, sender=models.Organization)
+@receiver(m2m_changed, sender=models.Organization.lessons.through)
+def invalidate_bundles(sender, **kwargs):
+    bundles.bump_version()
+
+
+# Static API snapshots are rendered after the transaction has been committed, but the affected paths of deleted
+# objects must be determined right away.
+
+@receiver(page_published, sender=models.Category)
+@receiver(page_published, sender=models.Lesson)
+@receiver(page_published, sender=models.StaticPage)
+@receiver(page_unpublished, sender=models.Category)
+@receiver(page_unpublished, sender=models.Lesson)
+@receiver(page_unpublished, sender=models.StaticPage)
+@receiver(post_delete, sender=models.Category)
+@receiver(post_delete, sender=models.Lesson)
+@receiver(post_delete, sender=models.StaticPage)
+def update_page_snapshots(sender, instance, **kwargs):
+    if snapshots.is_enabled():
+        tasks.run_in_background(snapshots.update, snapshots.get_page_paths(instance))
+
+
+@receiver(post_page_move)
+@receiver(post_save, sender=get_document_model())
+@receiver(post_delete, sender=get_document_model())
+@receiver(post_save, sender=get_image_model())
+@receiver(post_delete, sender=get_image_model())
+@receiver(post_save, sender=get_media_model())
+@receiver(post_delete, sender=get_media_model())
+@receiver(post_save, sender=models.MediaStreams)
+@receiver(post_delete, sender=models.MediaStreams)
+@receiver(post_save, sender=Embed)
+@receiver(post_delete, sender=Embed)
+def update_all_page_snapshots(sender, **kwargs):
+    if snapshots.is_enabled():
+        tasks.run_in_background(snapshots.update_all_pages)
+
+
+@receiver(post_save, sender=models.Quiz)
+@receiver(post_delete, sender=models.Quiz)
+@receiver(post_save, sender=models.OpenQuestion)
+@receiver(post_delete, sender=models.OpenQuestion)
+def update_snippet_snapshots(sender, instance, **kwargs):
+    if snapshots.is_enabled():
+        basename = 'quiz' if sender is models.Quiz else 'openquestion'
+        tasks.run_in_background(snapshots.update, snapshots.get_paths(basename, [instance.pk]))
+
+
+# The rows of LessonBlock are removed by the foreign key cascade when a lesson is deleted.
+
+@receiver(post_save, sender=models.Lesson)
+def sync_lesson_body_blocks(sender, instance, update_fields=None, **kwargs):
+    # Saving a draft revision only updates some metadata of the page, not the body
+    if update_fields is None or any(field.startswith('body') for field in update_fields):
+        instance.sync_body_blocks()
+        progress.refresh([instance.pk])
+
+
+# Bulk operations on block completions don't send signals, so the views doing them update the progress themselves.
+
+@receiver(pre_save, sender=models.BlockCompletion)
+def remember_completed_block(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance._previous_completion = (sender.objects.filter(pk=instance.pk)
+                                         .values_list('user', 'lesson', 'block').first())
+
+
+@receiver(post_save, sender=models.BlockCompletion)
+def update_organization_progress(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        progress.record_completions(instance.user_id, instance.lesson_id, [instance.block], 1)
+        return
+    # Completions are rarely moved to another block, so we just recompute the affected rows
+    previous = getattr(instance, '_previous_completion', None)
+    if previous and previous != (instance.user_id, instance.lesson_id, instance.block):
+        progress.refresh_for_users({previous[1], instance.lesson_id}, {previous[0], instance.user_id})
+
+
+@receiver(pre_delete, sender=models.BlockCompletion)
+def prepare_organization_progress_removal(sender, instance, **kwargs):
+    progress.prepare_deletion(instance.user_id, instance.lesson_id, instance.block)
+
+
+@receiver(post_delete, sender=models.BlockCompletion)
+def remove_organization_progress(sender, instance, **kwargs):
+    progress.record_deletion(instance.user_id, instance.lesson_id)
+
+
+# Avatars are processed in the background after uploading (see material/avatars.py)
+
+@receiver(post_save, sender=models.User)
+def process_user_avatar(sender, instance, **kwargs):
+    if avatars.needs_processing(instance):
+        tasks.run_in_worker(avatars.process_avatar, instance.pk, instance.avatar.name)
+
+
+# Avatars and logos may be shared, so replaced and orphaned files are only deleted in the background if nobody else
+# uses them (see material/blobs.py)
+
+@receiver(pre_save, sender=models.User)
+@receiver(pre_save, sender=models.Organization)
+def delete_replaced_blob(sender, instance, raw=False, update_fields=None, **kwargs):
+    field = blobs.get_field(sender)
+    if raw or instance._state.adding or (update_fields is not None and field.name not in update_fields):
+        return
+    old_name = sender.objects.filter(pk=instance.pk).values_list(field.name, flat=True).first()
+    if old_name and old_name != getattr(instance, field.attname).name:
+        tasks.run_in_background(blobs.delete_unreferenced, field.storage, [old_name], time.time())
+
+
+@receiver(post_delete, sender=models.User)
+@receiver(post_delete, sender=models.Organization)
+def delete_orphaned_blob(sender, instance, **kwargs):
+    field = blobs.get_field(sender)
+    name = getattr(instance, field.attname).name
+    if name:
+        tasks.run_in_background(blobs.delete_unreferenced, field.storage, [name], time.time())
+
+
+# Cached tokens contain the user and their organization. Deleting a user or an organization deletes the tokens.
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    authentication.invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=models.User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    authentication.invalidate_user_tokens([instance])
+
+
+@receiver(post_save, sender=models.Organization)
+def invalidate_organization_tokens(sender, instance, **kwargs):
+    authentication.invalidate_user_tokens(instance.user_set.all())
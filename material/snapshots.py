@@ -0,0 +1,159 @@
+"""
+Static snapshots of the read-only content API.
+
+Most requests to the content endpoints are anonymous GET requests without query parameters, whose responses only
+change when editors publish pages or save snippets. If API_SNAPSHOT_ROOT is set, we write these responses to
+`<API_SNAPSHOT_ROOT>/<path>/index.json` so that the reverse proxy can serve them without reaching the backend (see
+the README). Lists are paginated, so only their first page is written.
+
+The signal handlers in `material.signals` re-render the routes affected by a change once the transaction has been
+committed, writing every file atomically. `resync` renders all routes into a new directory and then atomically
+points API_SNAPSHOT_ROOT, which is a symbolic link, to it; run it with `manage.py resyncsnapshot` after deploying
+and whenever the snapshot might have missed a change. Incremental updates made while resyncing may be lost.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.urls import get_script_prefix, resolve, reverse, set_script_prefix
+
+from material import models, payloads
+
+logger = logging.getLogger(__name__)
+
+# Route basenames (see hyve/urls.py) and the models they serve
+CONTENT_ROUTES = {
+    'category': models.Category,
+    'lesson': models.Lesson,
+    'staticpage': models.StaticPage,
+    'quiz': models.Quiz,
+    'openquestion': models.OpenQuestion,
+}
+
+
+def is_enabled():
+    return bool(settings.API_SNAPSHOT_ROOT)
+
+
+def get_list_path(basename):
+    return _strip_script_prefix(reverse(f'{basename}-list'))
+
+
+def get_detail_path(basename, pk):
+    return _strip_script_prefix(reverse(f'{basename}-detail', args=(pk,)))
+
+
+def _strip_script_prefix(url):
+    return '/' + url[len(get_script_prefix()):]
+
+
+def get_paths(basename, pks):
+    """Return the paths of the list and of the given objects of the route `basename`."""
+    return [get_list_path(basename)] + [get_detail_path(basename, pk) for pk in pks]
+
+
+def get_page_paths(page):
+    """Return the paths affected by publishing, unpublishing or deleting the specific page `page`."""
+    if isinstance(page, models.Lesson):
+        # Categories list the IDs of their lessons. The lesson may already have been deleted, so we don't use
+        # get_parent().
+        parent_ids = models.Category.objects.filter(path=page.path[:-page.steplen]).values_list('pk', flat=True)
+        return get_paths('lesson', [page.pk]) + get_paths('category', parent_ids)
+    for basename in ('category', 'staticpage'):
+        if isinstance(page, CONTENT_ROUTES[basename]):
+            return get_paths(basename, [page.pk])
+    return []
+
+
+def get_all_page_paths():
+    """Return the paths of all routes serving pages, e.g., after pages have been moved or images have changed."""
+    return [path for basename in ('category', 'lesson', 'staticpage')
+            for path in get_paths(basename, CONTENT_ROUTES[basename].objects.values_list('pk', flat=True))]
+
+
+def get_all_paths():
+    return [path for basename, model in CONTENT_ROUTES.items()
+            for path in get_paths(basename, model.objects.values_list('pk', flat=True))]
+
+
+def render(path):
+    """Return the body of the response to an anonymous GET request for `path`, or None unless it is a 200."""
+    request = payloads.InternalRequest(settings.API_SNAPSHOT_BASE_URL, path)
+    request.META['HTTP_ACCEPT'] = 'application/json'
+    # Generated URLs must contain the script prefix of the backend, also outside of requests
+    old_prefix = get_script_prefix()
+    set_script_prefix(settings.FORCE_SCRIPT_NAME or '/')
+    try:
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        response.render()
+    finally:
+        set_script_prefix(old_prefix)
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+def get_file_path(directory, path):
+    return os.path.join(directory, path.strip('/'), 'index.json')
+
+
+def write_path(directory, path):
+    """Render `path` into `directory`, or remove its file if it doesn't respond with 200 anymore."""
+    file_path = get_file_path(directory, path)
+    content = render(path)
+    if content is None:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    temp_path = f'{file_path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    # The web server must be able to read the file regardless of our umask
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, file_path)
+
+
+def update(paths):
+    """Re-render the given paths in the current snapshot, if there is one."""
+    if not is_enabled() or not os.path.isdir(settings.API_SNAPSHOT_ROOT):
+        return
+    directory = os.path.realpath(settings.API_SNAPSHOT_ROOT)
+    for path in dict.fromkeys(paths):
+        try:
+            write_path(directory, path)
+        except Exception:
+            logger.exception("Could not update the API snapshot of %s", path)
+
+
+def update_all_pages():
+    update(get_all_page_paths())
+
+
+def resync():
+    """Render all routes into a new directory, point API_SNAPSHOT_ROOT to it and delete the previous snapshot."""
+    root = os.path.abspath(settings.API_SNAPSHOT_ROOT)
+    if os.path.exists(root) and not os.path.islink(root):
+        raise ValueError(f"API_SNAPSHOT_ROOT must be a symbolic link or not exist, but {root} is not a link")
+    old_directory = os.path.realpath(root) if os.path.islink(root) else None
+
+    directory = tempfile.mkdtemp(prefix=f'{os.path.basename(root)}.', dir=os.path.dirname(root))
+    os.chmod(directory, 0o755)
+    try:
+        paths = get_all_paths()
+        for path in paths:
+            write_path(directory, path)
+        # Renaming a link over another one replaces it atomically
+        link = f'{root}.{uuid.uuid4().hex}.tmp'
+        os.symlink(directory, link)
+        os.replace(link, root)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    if old_directory and os.path.isdir(old_directory):
+        shutil.rmtree(old_directory, ignore_errors=True)
+    return len(paths)
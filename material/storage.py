@@ -1,3 +1,7 @@
+import hashlib
+import os
+import uuid
+
 from django.core.files.storage import FileSystemStorage
 
 
@@ -9,3 +13,37 @@ class OverwriteStorage(FileSystemStorage):
 
     def get_available_name(self, name, max_length=None):
         return name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Storage that names files by the SHA-256 hash of their content, keeping the directory and extension of the
+    requested name.
+
+    Since the content behind a name never changes, URLs can be cached forever, and saving the same content again
+    reuses the existing file. Files may thus be shared by several objects, so they must not be deleted just because one
+    of them doesn't use them anymore; see `material.blobs`.
+    """
+    def get_hashed_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        directory, basename = os.path.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        return os.path.join(directory, f'{sha256.hexdigest()}{extension}')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content and identical content may be saved under it any number of times
+        return name
+
+    def _save(self, name, content):
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            # Mark the file as used, so that it isn't deleted as unreferenced before the new reference is committed
+            os.utime(self.path(name))
+            return name
+        # Concurrent saves of the same content must not see a partial file under the final name
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(name))
+        return name
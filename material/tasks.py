@@ -0,0 +1,103 @@
+"""
+Minimal support for doing work outside of the request/response cycle.
+
+Tasks scheduled with `run_in_background` run in a small thread pool in the web server process once the current
+transaction has been committed. They are lost if the process exits before they are done, so everything scheduled this
+way must be cheap and safe to redo later, e.g., from a management command.
+
+Expensive tasks, such as processing avatars and transcoding media, are scheduled with `run_in_worker` instead. With
+TASK_QUEUE enabled, they are stored as `QueuedTask` rows, committed together with the rest of the request, and run by
+`manage.py runqueuedtasks` in a separate worker process, so that they neither compete with requests for CPU time nor
+get lost on restarts. A worker claims tasks for LEASE_DURATION, after which tasks of crashed workers are run again, and
+retries failed tasks with exponential backoff up to MAX_ATTEMPTS times (see `material.queues`).
+"""
+import importlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from material import models, queues
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10
+LEASE_DURATION = timedelta(hours=1)
+MAX_ATTEMPTS = 5
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_TASK_WORKERS, thread_name_prefix='background')
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", func.__qualname__)
+    finally:
+        # Database connections are per thread, and nobody else is going to close this one
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """Call `func(*args, **kwargs)` in a background thread after the current transaction has been committed."""
+    if settings.BACKGROUND_TASKS_SYNCHRONOUS:
+        transaction.on_commit(lambda: func(*args, **kwargs))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run, func, args, kwargs))
+
+
+def get_function_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def get_function(path):
+    module_name, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), name)
+
+
+def run_in_worker(func, *args):
+    """
+    Call `func(*args)` in a worker process (see `manage.py runqueuedtasks`) if TASK_QUEUE is enabled, else like
+    `run_in_background`. `func` must be a module-level function and `args` must be JSON-serializable.
+    """
+    if not settings.TASK_QUEUE:
+        run_in_background(func, *args)
+        return
+    models.QueuedTask.objects.create(function=get_function_path(func), args=list(args))
+
+
+def claim_queued(batch_size):
+    """Return up to `batch_size` queued tasks that are due, claiming them for LEASE_DURATION."""
+    return queues.claim(models.QueuedTask, batch_size, LEASE_DURATION)
+
+
+def run_task(task):
+    try:
+        get_function(task.function)(*task.args)
+    except Exception as e:
+        logger.exception("Queued task %s (%s) failed", task.pk, task.function)
+        queues.record_failure(task, e, MAX_ATTEMPTS)
+    else:
+        task.delete()
+
+
+def run_batch(batch_size=BATCH_SIZE):
+    """Run up to `batch_size` queued tasks that are due and return their number."""
+    tasks = claim_queued(batch_size)
+    for task in tasks:
+        run_task(task)
+    return len(tasks)
+
+
+def run_queued(batch_size=BATCH_SIZE):
+    """Run all queued tasks that are due in batches and return the number of tasks that were due."""
+    return queues.process_all(run_batch, batch_size)
@@ -1,7 +1,32 @@
 import pytest
+from django.core.cache import caches
 from rest_framework.test import APIClient
+from wagtail.core.blocks import StreamValue
+from wagtail.core.models import Site
 
-from material.models import Organization, User, Category, Lesson
+from material import renditions
+from material.models import (Organization, User, Category, Lesson, MultipleChoiceAnswer, MultipleChoiceQuestion,
+                             Quiz)
+
+
+@pytest.fixture(autouse=True)
+def stream_data_compat(monkeypatch):
+    # wagtail-modeltranslation still reads StreamValue.stream_data when saving pages, which Wagtail 2.15 removed
+    monkeypatch.setattr(StreamValue, 'stream_data', property(lambda self: self.raw_data), raising=False)
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    # Cached data refers to database rows, which don't survive from one test to another
+    for cache in caches.all():
+        cache.clear()
+    renditions.index.clear()
 
 
 @pytest.fixture
@@ -15,13 +40,18 @@ def api_client():
 
 
 @pytest.fixture
-def category(db):
-    return Category.objects.create(name_en='Category')
+def site_root(db):
+    return Site.objects.get(is_default_site=True).root_page
 
 
 @pytest.fixture
-def lesson(db):
-    return Lesson.objects.create(name_en='Lesson')
+def category(site_root):
+    return site_root.add_child(instance=Category(title='Category'))
+
+
+@pytest.fixture
+def lesson(category):
+    return category.add_child(instance=Lesson(title='Lesson'))
 
 
 @pytest.fixture
@@ -42,3 +72,15 @@ def superuser(db, organization):
 @pytest.fixture
 def supervisor(db, organization):
     return User.objects.create(email='supervisor@example.com', organization=organization, is_supervisor=True)
+
+
+@pytest.fixture
+def quiz(db):
+    """Quiz with two questions, each having three answers of which the first one is correct"""
+    quiz = Quiz.objects.create(internal_name='Quiz')
+    for i in range(2):
+        question = MultipleChoiceQuestion.objects.create(quiz=quiz, text_en=f'Question {i}', sort_order=i)
+        for j in range(3):
+            MultipleChoiceAnswer.objects.create(question=question, text_en=f'Answer {j}', correct=(j == 0),
+                                                sort_order=j)
+    return quiz
@@ -0,0 +1,68 @@
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from material.models import BlockCompletion, Lesson, User
+
+pytestmark = pytest.mark.django_db
+
+BATCH_URL = reverse('blockcompletion-batch')
+
+
+def test_batch_requires_authentication(api_client, lesson):
+    response = api_client.post(BATCH_URL, [{'lesson': lesson.id, 'block': str(uuid.uuid4())}], format='json')
+    assert response.status_code == 401
+
+
+def test_batch_creates_and_updates(api_client, user, category, lesson):
+    other_lesson = category.add_child(instance=Lesson(title='Other lesson'))
+    old_block, new_block = uuid.uuid4(), uuid.uuid4()
+    existing = BlockCompletion.objects.create(user=user, lesson=lesson, block=old_block)
+    api_client.force_authenticate(user=user)
+    response = api_client.post(BATCH_URL, [
+        {'lesson': other_lesson.id, 'block': str(old_block)},
+        {'lesson': lesson.id, 'block': str(new_block)},
+    ], format='json')
+    assert response.status_code == 200
+    assert [result['status'] for result in response.data] == [200, 201]
+    assert response.data[0]['data']['id'] == existing.id
+    assert response.data[0]['data']['lesson'] == other_lesson.id
+    assert response.data[1]['data']['block'] == str(new_block)
+    assert set(BlockCompletion.objects.filter(user=user).values_list('lesson', 'block')) == {
+        (other_lesson.id, old_block),
+        (lesson.id, new_block),
+    }
+
+
+def test_batch_reports_invalid_items(api_client, user, organization, lesson):
+    other_user = User.objects.create(email='other@example.com', organization=organization)
+    api_client.force_authenticate(user=user)
+    response = api_client.post(BATCH_URL, [
+        {'lesson': lesson.id + 1000, 'block': str(uuid.uuid4())},
+        {'lesson': lesson.id, 'block': 'not a UUID'},
+        {'user': str(other_user.id), 'lesson': lesson.id, 'block': str(uuid.uuid4())},
+        {'user': str(user.id), 'lesson': lesson.id, 'block': str(uuid.uuid4())},
+    ], format='json')
+    assert response.status_code == 200
+    assert [result['status'] for result in response.data] == [400, 400, 400, 201]
+    assert set(response.data[0]['errors']) == {'lesson'}
+    assert set(response.data[1]['errors']) == {'block'}
+    assert set(response.data[2]['errors']) == {'user'}
+    assert BlockCompletion.objects.get().user == user
+
+
+def test_batch_query_count_independent_of_size(api_client, user, lesson):
+    api_client.force_authenticate(user=user)
+    query_counts = []
+    for size in (1, 20):
+        BlockCompletion.objects.create(user=user, lesson=lesson, block=uuid.uuid4())
+        blocks = list(BlockCompletion.objects.values_list('block', flat=True)) + [uuid.uuid4() for _ in range(size)]
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.post(BATCH_URL, [{'lesson': lesson.id, 'block': str(block)} for block in blocks],
+                                       format='json')
+        assert response.status_code == 200
+        query_counts.append(len(context.captured_queries))
+    assert query_counts[0] == query_counts[1]
@@ -0,0 +1,147 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+
+from material import conditional, renditions
+from material.models import Category, Lesson
+
+pytestmark = pytest.mark.django_db
+
+
+def test_category_list(api_client, category, lesson):
+    response = api_client.get(reverse('category-list'))
+    assert response.status_code == 200
+    assert [(data['id'], data['lessons']) for data in response.data['results']] == [(category.id, [lesson.id])]
+
+
+def test_category_list_only_live_pages(api_client, site_root, category, lesson):
+    site_root.add_child(instance=Category(title='Draft category', live=False))
+    category.add_child(instance=Lesson(title='Draft lesson', live=False))
+    response = api_client.get(reverse('category-list'))
+    assert [(data['id'], data['lessons']) for data in response.data['results']] == [(category.id, [lesson.id])]
+
+
+def test_category_detail_only_live_lessons(api_client, category, lesson):
+    category.add_child(instance=Lesson(title='Draft lesson', live=False))
+    response = api_client.get(reverse('category-detail', args=(category.id,)))
+    assert response.data['lessons'] == [lesson.id]
+
+
+def test_category_list_does_not_load_unexpanded_lessons(api_client, category, lesson):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(reverse('category-list'))
+    assert response.data['results'][0]['lessons'] == [lesson.id]
+    assert not any('"body_en"' in query['sql'] for query in context.captured_queries)
+
+
+def test_category_list_paginated_by_cursor(api_client, site_root, category, lesson):
+    other_category = site_root.add_child(instance=Category(title='Other category'))
+    other_lesson = other_category.add_child(instance=Lesson(title='Other lesson'))
+    response = api_client.get(reverse('category-list') + '?page_size=1')
+    assert [(data['id'], data['lessons']) for data in response.data['results']] == [(category.id, [lesson.id])]
+    response = api_client.get(response.data['next'])
+    assert ([(data['id'], data['lessons']) for data in response.data['results']]
+            == [(other_category.id, [other_lesson.id])])
+    assert response.data['next'] is None
+
+
+def test_category_list_expand_lessons(api_client, category, lesson):
+    response = api_client.get(reverse('category-list') + '?expand=lessons&omit=lessons.body_en,lessons.body_fi')
+    assert response.status_code == 200
+    [expanded_lesson] = response.data['results'][0]['lessons']
+    assert expanded_lesson['id'] == lesson.id
+    assert expanded_lesson['title_en'] == lesson.title_en
+
+
+def test_category_list_query_count_independent_of_pages(api_client, site_root):
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(reverse('category-list') + '?expand=lessons&omit=lessons.body_en,lessons.body_fi')
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    category = site_root.add_child(instance=Category(title='Category 1'))
+    category.add_child(instance=Lesson(title='Lesson 1'))
+    # Warm up caches
+    count_queries()
+    small_count = count_queries()
+    for i in range(2, 5):
+        category = site_root.add_child(instance=Category(title=f'Category {i}'))
+        category.add_child(instance=Lesson(title=f'Lesson {i}a'))
+        category.add_child(instance=Lesson(title=f'Lesson {i}b'))
+    assert count_queries() == small_count
+
+
+@pytest.fixture
+def image(db):
+    return get_image_model().objects.create(title='Image', file=get_test_image_file())
+
+
+def test_category_publish_generates_renditions(settings, django_capture_on_commit_callbacks, category, image):
+    settings.BACKGROUND_TASKS_SYNCHRONOUS = True
+    renditions.index.clear()
+    category.image = image
+    with django_capture_on_commit_callbacks(execute=True):
+        category.save_revision().publish()
+    assert image.renditions.filter(filter_spec=renditions.IMAGE_FILTER_SPEC).exists()
+    assert renditions.index.is_complete(image)
+
+
+def test_category_list_images_from_rendition_index(api_client, site_root, image):
+    site_root.add_child(instance=Category(title='Category', image=image))
+    renditions.index.clear()
+    renditions.generate_renditions(image.id)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(reverse('category-list'))
+    assert response.data['results'][0]['image']['url'] == image.get_rendition(renditions.IMAGE_FILTER_SPEC).url
+    assert not any('wagtailimages_rendition' in query['sql'] for query in context.captured_queries)
+
+
+def test_category_list_not_modified(api_client, category, lesson):
+    category.save_revision().publish()
+    response = api_client.get(reverse('category-list'))
+    assert response.has_header('Last-Modified')
+    response = api_client.get(reverse('category-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+def test_category_list_ignores_if_modified_since(api_client, category, lesson):
+    category.save_revision().publish()
+    response = api_client.get(reverse('category-list'))
+    response = api_client.get(reverse('category-list'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('basename', ['category', 'lesson', 'quiz', 'staticpage', 'openquestion'])
+def test_detail_with_invalid_pk_not_found(api_client, basename):
+    response = api_client.get(reverse(f'{basename}-detail', args=('abc',)))
+    assert response.status_code == 404
+
+
+def test_category_list_modified_after_unpublish(api_client, category, lesson):
+    etag = api_client.get(reverse('category-list'))['ETag']
+    lesson.unpublish()
+    response = api_client.get(reverse('category-list'), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['results'][0]['lessons'] == []
+
+
+def test_media_version_not_process_local():
+    version = conditional.get_media_version()
+    # Clearing the cache is what another process with a local cache would see
+    cache.clear()
+    assert conditional.get_media_version() == version
+    conditional.bump_media_version()
+    assert conditional.get_media_version() != version
+
+
+def test_category_detail_modified_after_new_lesson(api_client, category, lesson):
+    url = reverse('category-detail', args=(category.id,))
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    category.add_child(instance=Lesson(title='New lesson'))
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
@@ -0,0 +1,270 @@
+import json
+import uuid
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from material import payloads
+from material.models import (BlockCompletion, Lesson, LessonPayload, MultipleChoiceAnswer, MultipleChoiceQuestion,
+                             OpenQuestion, Quiz)
+from material.pagination import PageCursorPagination
+
+pytestmark = pytest.mark.django_db
+
+
+def lesson_detail_url(lesson):
+    return reverse('lesson-detail', args=(lesson.id,))
+
+
+def test_lesson_detail_stores_payload(api_client, lesson):
+    response = api_client.get(lesson_detail_url(lesson))
+    assert response.status_code == 200
+    payload = LessonPayload.objects.get(lesson=lesson)
+    assert payload.base_url == 'http://testserver/'
+    assert payload.data == response.data
+
+
+def test_lesson_detail_served_from_payload(api_client, lesson):
+    api_client.get(lesson_detail_url(lesson))
+    # Change the title without sending any signals to check that the stored payload is served
+    Lesson.objects.filter(pk=lesson.pk).update(title_en='Changed')
+    response = api_client.get(lesson_detail_url(lesson))
+    assert response.data['title_en'] == 'Lesson'
+
+
+def test_lesson_detail_bypasses_payload_for_sparse_fields(api_client, lesson):
+    api_client.get(lesson_detail_url(lesson))
+    response = api_client.get(lesson_detail_url(lesson) + '?fields=id')
+    assert response.data == {'id': lesson.id}
+
+
+def test_lesson_detail_stores_payloads_for_limited_base_urls(api_client, lesson, settings):
+    settings.ALLOWED_HOSTS = ['*']
+    for i in range(payloads.MAX_BASE_URLS + 1):
+        response = api_client.get(lesson_detail_url(lesson), HTTP_HOST=f'host{i}.example.com')
+        assert response.status_code == 200
+    assert LessonPayload.objects.filter(lesson=lesson).count() == payloads.MAX_BASE_URLS
+    assert not LessonPayload.objects.filter(base_url=f'http://host{payloads.MAX_BASE_URLS}.example.com/').exists()
+
+
+def test_lesson_list_served_from_payloads(api_client, lesson):
+    api_client.get(lesson_detail_url(lesson))
+    Lesson.objects.filter(pk=lesson.pk).update(title_en='Changed')
+    response = api_client.get(reverse('lesson-list'))
+    assert response.status_code == 200
+    assert [data['title_en'] for data in response.data['results']] == ['Lesson']
+
+
+def test_lesson_publish_refreshes_payload(api_client, lesson):
+    api_client.get(lesson_detail_url(lesson))
+    lesson.title_en = 'Changed'
+    lesson.save_revision().publish()
+    assert LessonPayload.objects.get(lesson=lesson).data['title_en'] == 'Changed'
+    response = api_client.get(lesson_detail_url(lesson))
+    assert response.data['title_en'] == 'Changed'
+
+
+def test_lesson_unpublish_deletes_payload(api_client, lesson):
+    api_client.get(lesson_detail_url(lesson))
+    lesson.unpublish()
+    assert not LessonPayload.objects.filter(lesson=lesson).exists()
+    # Unpublished lessons are still served, but not stored
+    response = api_client.get(lesson_detail_url(lesson))
+    assert response.status_code == 200
+    assert not LessonPayload.objects.filter(lesson=lesson).exists()
+
+
+def chooser_body(quizzes, open_questions):
+    blocks = [{'type': 'quiz', 'value': quiz.id} for quiz in quizzes]
+    blocks += [{'type': 'open_question', 'value': question.id} for question in open_questions]
+    return json.dumps(blocks)
+
+
+def test_lesson_list_paginated_by_cursor(api_client, category):
+    lessons = [category.add_child(instance=Lesson(title=f'Lesson {i}')) for i in range(3)]
+    response = api_client.get(reverse('lesson-list') + '?page_size=2')
+    assert [data['id'] for data in response.data['results']] == [lessons[0].id, lessons[1].id]
+    # Removing a lesson from the first page must not shift the next page
+    lessons[0].delete()
+    response = api_client.get(response.data['next'])
+    assert [data['id'] for data in response.data['results']] == [lessons[2].id]
+
+
+def test_lesson_list_does_not_count(api_client, lesson):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(reverse('lesson-list'))
+    assert response.data['next'] is None
+    assert not any('COUNT(' in query['sql'].upper() for query in context.captured_queries)
+
+
+def test_lesson_list_page_size_capped(api_client, category, monkeypatch):
+    for i in range(3):
+        category.add_child(instance=Lesson(title=f'Lesson {i}'))
+    monkeypatch.setattr(PageCursorPagination, 'max_page_size', 2)
+    response = api_client.get(reverse('lesson-list') + '?page_size=1000')
+    assert len(response.data['results']) == 2
+    assert response.data['next'] is not None
+
+
+def count_queries(api_client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(url)
+    assert response.status_code == 200
+    return len(context.captured_queries)
+
+
+def test_lesson_detail_query_count_independent_of_chooser_blocks(api_client, category):
+    quizzes = [Quiz.objects.create(internal_name=f'Quiz {i}') for i in range(5)]
+    open_questions = [OpenQuestion.objects.create(internal_name=f'Question {i}') for i in range(5)]
+    small_lesson = category.add_child(instance=Lesson(title='Small', body_en=chooser_body(quizzes[:1], open_questions[:1])))
+    large_lesson = category.add_child(instance=Lesson(title='Large',
+                                                      body_en=chooser_body(quizzes, open_questions),
+                                                      body_fi=chooser_body(quizzes[::-1], open_questions[:2])))
+    url = '?fields=body_en,body_fi'
+    # Warm up caches
+    count_queries(api_client, lesson_detail_url(small_lesson) + url)
+    small_count = count_queries(api_client, lesson_detail_url(small_lesson) + url)
+    large_count = count_queries(api_client, lesson_detail_url(large_lesson) + url)
+    assert large_count == small_count
+
+
+def test_lesson_list_resolves_chooser_blocks(api_client, category):
+    quiz = Quiz.objects.create(internal_name='Quiz')
+    open_question = OpenQuestion.objects.create(internal_name='Question')
+    category.add_child(instance=Lesson(title='Lesson', body_en=chooser_body([quiz], [open_question])))
+    response = api_client.get(reverse('lesson-list'))
+    values = [block['value'] for block in response.data['results'][0]['body_en']]
+    assert values == [quiz.id, open_question.id]
+
+
+def create_quiz(name, num_questions=2, num_answers=3):
+    quiz = Quiz.objects.create(internal_name=name)
+    for i in range(num_questions):
+        question = MultipleChoiceQuestion.objects.create(quiz=quiz, text_en=f'Question {i}')
+        for j in range(num_answers):
+            MultipleChoiceAnswer.objects.create(question=question, text_en=f'Answer {j}', correct=(j == 0))
+    return quiz
+
+
+def test_lesson_detail_inline_quizzes(api_client, category):
+    quiz = create_quiz('Quiz')
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=chooser_body([quiz], [])))
+    response = api_client.get(lesson_detail_url(lesson) + '?inline_quizzes=true')
+    inlined_quiz = response.data['body_en'][0]['value']
+    expected = api_client.get(reverse('quiz-detail', args=(quiz.id,)) + '?expand=questions.answers').data
+    assert inlined_quiz == expected
+    assert not LessonPayload.objects.exists()
+
+
+def test_lesson_detail_inline_quizzes_query_count_independent_of_quizzes(api_client, category):
+    quizzes = [create_quiz(f'Quiz {i}') for i in range(3)]
+    small_lesson = category.add_child(instance=Lesson(title='Small', body_en=chooser_body(quizzes[:1], [])))
+    large_lesson = category.add_child(instance=Lesson(title='Large', body_en=chooser_body(quizzes, []),
+                                                      body_fi=chooser_body(quizzes, [])))
+    url = '?inline_quizzes=true'
+    # Warm up caches
+    count_queries(api_client, lesson_detail_url(small_lesson) + url)
+    small_count = count_queries(api_client, lesson_detail_url(small_lesson) + url)
+    large_count = count_queries(api_client, lesson_detail_url(large_lesson) + url)
+    assert large_count == small_count
+
+
+def test_lesson_detail_inline_quizzes_ignores_lesson_fields(api_client, category):
+    quiz = create_quiz('Quiz')
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=chooser_body([quiz], [])))
+    response = api_client.get(lesson_detail_url(lesson) + '?inline_quizzes=true&fields=body_en')
+    assert response.data['body_en'][0]['value']['id'] == quiz.id
+
+
+def test_lesson_detail_not_modified(api_client, lesson):
+    response = api_client.get(lesson_detail_url(lesson))
+    etag = response['ETag']
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(lesson_detail_url(lesson), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    assert not any('material_lessonpayload' in query['sql'] for query in context.captured_queries)
+
+
+def test_lesson_detail_modified_after_publish(api_client, lesson):
+    etag = api_client.get(lesson_detail_url(lesson))['ETag']
+    lesson.title_en = 'Changed'
+    lesson.save_revision().publish()
+    response = api_client.get(lesson_detail_url(lesson), HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['title_en'] == 'Changed'
+    assert response['ETag'] != etag
+
+
+def test_lesson_detail_etag_depends_on_query(api_client, lesson):
+    etag = api_client.get(lesson_detail_url(lesson))['ETag']
+    response = api_client.get(lesson_detail_url(lesson) + '?fields=id', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+
+def test_lesson_detail_inline_quizzes_modified_after_quiz_change(api_client, category):
+    quiz = create_quiz('Quiz')
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=chooser_body([quiz], [])))
+    url = lesson_detail_url(lesson) + '?inline_quizzes=true'
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    answer = MultipleChoiceAnswer.objects.filter(question__quiz=quiz).first()
+    answer.text_en = 'Changed'
+    answer.save()
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+def page_breaks(block_ids):
+    return json.dumps([{'type': 'page_break', 'value': None, 'id': str(block_id)} for block_id in block_ids])
+
+
+def test_lesson_progress(api_client, user, category, django_assert_num_queries):
+    blocks_en = [uuid.uuid4() for _ in range(3)]
+    blocks_fi = [uuid.uuid4()]
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=page_breaks(blocks_en),
+                                                body_fi=page_breaks(blocks_fi)))
+    category.add_child(instance=Lesson(title='Draft', body_en=page_breaks([uuid.uuid4()]), live=False))
+    for block in blocks_en[:2] + [uuid.uuid4()]:
+        BlockCompletion.objects.create(user=user, lesson=lesson, block=block)
+    api_client.force_authenticate(user=user)
+    with django_assert_num_queries(1):
+        response = api_client.get(reverse('lesson-progress'))
+    assert response.status_code == 200
+    assert response.data == [{'lesson': lesson.id, 'completed': {'en': 2, 'fi': 0}, 'total': {'en': 3, 'fi': 1}}]
+
+
+def test_lesson_progress_follows_published_body(api_client, user, lesson):
+    block = uuid.uuid4()
+    lesson.body_en = page_breaks([block])
+    lesson.save_revision().publish()
+    BlockCompletion.objects.create(user=user, lesson=lesson, block=block)
+    api_client.force_authenticate(user=user)
+    response = api_client.get(reverse('lesson-progress'))
+    assert response.data == [{'lesson': lesson.id, 'completed': {'en': 1}, 'total': {'en': 1}}]
+
+
+def loads_bodies(queries):
+    return any('"body_en"' in query['sql'] or '"body_fi"' in query['sql'] for query in queries)
+
+
+def test_lesson_list_does_not_load_omitted_bodies(api_client, category):
+    blocks = [uuid.uuid4() for _ in range(2)]
+    category.add_child(instance=Lesson(title='Lesson', body_en=page_breaks(blocks)))
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(reverse('lesson-list') + '?omit=body_en,body_fi')
+    assert response.status_code == 200
+    assert not loads_bodies(context.captured_queries)
+    [data] = response.data['results']
+    assert 'body_en' not in data
+    assert data['block_ids_en'] == [str(block) for block in blocks]
+    assert data['block_ids_fi'] == []
+
+
+def test_lesson_detail_loads_only_requested_fields(api_client, lesson):
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(lesson_detail_url(lesson) + '?fields=id,title_en')
+    assert response.data == {'id': lesson.id, 'title_en': lesson.title_en}
+    assert not loads_bodies(context.captured_queries)
+    assert not any('"description_en"' in query['sql'] for query in context.captured_queries)
@@ -1,7 +1,10 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from material.models import User, Organization
+from material import bundles
+from material.models import Category, ContentVersion, Lesson, StaticPage, User, Organization
 
 
 def member_list_url(organization):
@@ -53,3 +56,95 @@ def test_organization_member_list_all_members_if_superuser(api_client, organizat
     assert response.status_code == 200
     member_set = {user['id'] for user in response.data['users']}
     assert member_set == {str(user.id), str(supervisor.id)}
+
+
+@pytest.mark.django_db
+def test_organization_detail_does_not_load_lesson_bodies(api_client, organization, lesson):
+    organization.lessons.add(lesson)
+    with CaptureQueriesContext(connection) as context:
+        response = api_client.get(reverse('organization-detail', args=(organization.id,)))
+    [data] = response.data['lessons']
+    assert data['id'] == lesson.id
+    assert data['block_ids_en'] == []
+    assert not any('"body_en"' in query['sql'] for query in context.captured_queries)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('is_supervisor', [True, False])
+def test_organization_member_list_query_count_independent_of_size(api_client, organization, user, is_supervisor):
+    user.is_supervisor = is_supervisor
+    user.save()
+    api_client.force_authenticate(user=user)
+    query_counts = []
+    for i in range(2):
+        User.objects.create(email=f'member{i}@example.com', organization=organization, is_supervisor=(i == 0))
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(member_list_url(organization))
+        assert response.status_code == 200
+        query_counts.append(len(context.captured_queries))
+    assert len(response.data['users']) == (3 if is_supervisor else 1)
+    assert query_counts[0] == query_counts[1]
+
+
+def bundle_url(organization):
+    return reverse('organization-bundle', args=(organization.id,))
+
+
+@pytest.mark.django_db
+def test_organization_bundle(api_client, organization, site_root, category, lesson):
+    organization.lessons.add(lesson)
+    category.add_child(instance=Lesson(title='Unassigned lesson'))
+    site_root.add_child(instance=Category(title='Category without assigned lessons'))
+    static_page = site_root.add_child(instance=StaticPage(title='About'))
+    response = api_client.get(bundle_url(organization))
+    assert response.status_code == 200
+    assert response.data['organization']['id'] == str(organization.id)
+    [category_data] = response.data['categories']
+    assert category_data['id'] == category.id
+    assert category_data['lessons'] == [api_client.get(reverse('lesson-detail', args=(lesson.id,))).data]
+    assert [page['id'] for page in response.data['static_pages']] == [static_page.id]
+
+
+@pytest.mark.django_db
+def test_organization_bundle_served_from_cache(api_client, organization, lesson, django_assert_num_queries):
+    organization.lessons.add(lesson)
+    expected = api_client.get(bundle_url(organization)).data
+    # Only the bundle version is queried
+    with django_assert_num_queries(1):
+        response = api_client.get(bundle_url(organization))
+    assert response.data == expected
+
+
+@pytest.mark.django_db
+def test_organization_bundle_follows_content_changes(api_client, organization, category, lesson):
+    api_client.get(bundle_url(organization))
+    organization.lessons.add(lesson)
+    [category_data] = api_client.get(bundle_url(organization)).data['categories']
+    assert [data['id'] for data in category_data['lessons']] == [lesson.id]
+    lesson.title = 'New title'
+    lesson.save_revision().publish()
+    [category_data] = api_client.get(bundle_url(organization)).data['categories']
+    assert category_data['lessons'][0]['title_en'] == 'New title'
+
+
+@pytest.mark.django_db
+def test_organization_bundle_invalidated_by_other_processes(api_client, organization):
+    api_client.get(bundle_url(organization))
+    # Another process changing the organization bumps the version without touching our cache
+    Organization.objects.filter(pk=organization.pk).update(name='New name')
+    ContentVersion.objects.filter(name=bundles.VERSION).update(version='other')
+    response = api_client.get(bundle_url(organization))
+    assert response.data['organization']['name'] == 'New name'
+
+
+@pytest.mark.django_db
+def test_organization_bundle_ignores_query_parameters(api_client, organization, lesson):
+    organization.lessons.add(lesson)
+    response = api_client.get(bundle_url(organization) + '?fields=id')
+    assert 'name' in response.data['organization']
+
+
+@pytest.mark.django_db
+def test_organization_bundle_not_found(api_client):
+    response = api_client.get(reverse('organization-bundle', args=('00000000-0000-0000-0000-000000000000',)))
+    assert response.status_code == 404
@@ -0,0 +1,90 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from material.models import MultipleChoiceAnswer, MultipleChoiceQuestion, MultipleChoiceResponse, Quiz
+
+pytestmark = pytest.mark.django_db
+
+
+def submit_url(quiz):
+    return reverse('quiz-submit', args=(quiz.id,))
+
+
+def all_responses(quiz, correct):
+    answers = MultipleChoiceAnswer.objects.filter(question__quiz=quiz)
+    return [{'answer': answer.id, 'response': answer.correct == correct} for answer in answers]
+
+
+def test_submit_requires_authentication(api_client, quiz):
+    response = api_client.post(submit_url(quiz), {'responses': all_responses(quiz, True)}, format='json')
+    assert response.status_code == 401
+
+
+def test_submit_saves_and_grades(api_client, user, quiz):
+    api_client.force_authenticate(user=user)
+    response = api_client.post(submit_url(quiz), {'responses': all_responses(quiz, True)}, format='json')
+    assert response.status_code == 200
+    assert response.data['score'] == response.data['max_score'] == 2
+    assert [question['question'] for question in response.data['questions']] == list(
+        quiz.questions.order_by('sort_order').values_list('id', flat=True))
+    assert len(response.data['responses']) == 6
+    assert MultipleChoiceResponse.objects.filter(user=user).count() == 6
+
+
+def test_resubmit_updates_responses(api_client, user, quiz):
+    api_client.force_authenticate(user=user)
+    api_client.post(submit_url(quiz), {'responses': all_responses(quiz, True)}, format='json')
+    [first_question, _] = quiz.questions.order_by('sort_order')
+    wrong = [item for item in all_responses(quiz, False) if item['answer'] in
+             first_question.answers.values_list('id', flat=True)]
+    response = api_client.post(submit_url(quiz), {'responses': wrong}, format='json')
+    assert response.status_code == 200
+    # The second question is graded using the responses of the first submission
+    assert [question['correct'] for question in response.data['questions']] == [False, True]
+    assert response.data['score'] == 1
+    assert MultipleChoiceResponse.objects.filter(user=user).count() == 6
+
+
+def test_submit_rejects_answers_of_other_quizzes(api_client, user, quiz):
+    other_quiz = Quiz.objects.create(internal_name='Other quiz')
+    api_client.force_authenticate(user=user)
+    other_question = MultipleChoiceQuestion.objects.create(quiz=other_quiz)
+    other_answer = MultipleChoiceAnswer.objects.create(question=other_question, correct=True)
+    responses = all_responses(quiz, True) + [{'answer': other_answer.id, 'response': True}]
+    response = api_client.post(submit_url(quiz), {'responses': responses}, format='json')
+    assert response.status_code == 400
+    assert 'responses' in response.data
+    assert not MultipleChoiceResponse.objects.exists()
+
+
+def test_submit_query_count_independent_of_size(api_client, user, quiz):
+    api_client.force_authenticate(user=user)
+    responses = all_responses(quiz, True)
+    query_counts = []
+    for items in (responses[:1], responses):
+        MultipleChoiceResponse.objects.all().delete()
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.post(submit_url(quiz), {'responses': items}, format='json')
+        assert response.status_code == 200
+        query_counts.append(len(context.captured_queries))
+    assert query_counts[0] == query_counts[1]
+
+
+def test_list_expanded_query_count_independent_of_size(api_client, quiz):
+    url = reverse('quiz-list') + '?expand=questions.answers'
+    query_counts = []
+    # Create the rich text version
+    api_client.get(url)
+    for i in range(2):
+        question = MultipleChoiceQuestion.objects.create(quiz=Quiz.objects.create(internal_name=f'Quiz {i}'))
+        MultipleChoiceAnswer.objects.create(question=question, correct=True)
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(url)
+        assert response.status_code == 200
+        query_counts.append(len(context.captured_queries))
+    [data] = [data for data in response.data['results'] if data['id'] == quiz.id]
+    assert [len(question['answers']) for question in data['questions']] == [3, 3]
+    assert 'question' not in data['questions'][0]['answers'][0]
+    assert query_counts[0] == query_counts[1]
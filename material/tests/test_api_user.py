@@ -1,7 +1,9 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from material.models import User, Organization
+from material.models import BlockCompletion, MultipleChoiceResponse, User, Organization
 
 pytestmark = pytest.mark.django_db
 
@@ -16,7 +18,7 @@ def test_user_list_admin(api_client, admin, user):
     api_client.force_authenticate(user=admin)
     response = api_client.get(reverse('user-list'))
     assert response.status_code == 200
-    user_ids = {data['id'] for data in response.data}
+    user_ids = {data['id'] for data in response.data['results']}
     assert user_ids == {str(admin.id), str(user.id)}
 
 
@@ -27,7 +29,7 @@ def test_user_list_unauthorized_user(api_client, user):
     api_client.force_authenticate(user=user)
     response = api_client.get(reverse('user-list'))
     assert response.status_code == 200
-    user_ids = {data['id'] for data in response.data}
+    user_ids = {data['id'] for data in response.data['results']}
     assert user_ids == {str(user.id)}
 
 
@@ -116,6 +118,7 @@ def test_user_detail(api_client, user):
     assert response.status_code == 200
     expected_result = {
         'avatar': None,
+        'avatar_urls': None,
         'email': user.email,
         'id': str(user.id),
         'is_superuser': False,
@@ -216,3 +219,22 @@ def test_user_change_promotion_to_supervisor_ineffective(api_client, user):
     response = api_client.put(url, new_data, format='json')
     assert response.status_code == 200
     assert not response.data['is_supervisor']
+
+
+def test_user_list_expanded_query_count_independent_of_size(api_client, admin, user, lesson, quiz):
+    api_client.force_authenticate(user=admin)
+    answers = list(quiz.questions.first().answers.all())
+    url = reverse('user-list') + '?expand=organization,block_completions,multiple_choice_responses'
+    query_counts = []
+    for i in range(2):
+        member = User.objects.create(email=f'member{i}@example.com', organization=user.organization)
+        BlockCompletion.objects.create(user=member, lesson=lesson, block=f'00000000-0000-0000-0000-00000000000{i}')
+        MultipleChoiceResponse.objects.create(user=member, answer=answers[i], response=True)
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(url)
+        assert response.status_code == 200
+        query_counts.append(len(context.captured_queries))
+    members = [data for data in response.data['results'] if data['block_completions']]
+    assert len(members) == 2
+    assert all(len(data['multiple_choice_responses']) == 1 for data in members)
+    assert query_counts[0] == query_counts[1]
@@ -0,0 +1,75 @@
+import pytest
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from material.authentication import CachedTokenAuthentication
+
+pytestmark = pytest.mark.django_db
+
+
+def use_token_cache(settings, backend, location=''):
+    settings.CACHES = {**settings.CACHES, 'tokens': {'BACKEND': backend, 'LOCATION': location}}
+
+
+@pytest.fixture(autouse=True)
+def shared_token_cache(settings, tmp_path):
+    # Shared by all processes on the same machine
+    use_token_cache(settings, 'django.core.cache.backends.filebased.FileBasedCache', str(tmp_path / 'tokens'))
+
+
+@pytest.fixture
+def token(user):
+    return Token.objects.create(user=user)
+
+
+def authenticate(token):
+    return CachedTokenAuthentication().authenticate_credentials(token.key)
+
+
+def me(api_client, token):
+    return api_client.get(reverse('user-me'), HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def test_cached_token_needs_no_queries(token, django_assert_num_queries):
+    authenticate(token)
+    with django_assert_num_queries(0):
+        user, _ = authenticate(token)
+        assert user == token.user
+        assert user.organization == token.user.organization
+
+
+def test_cached_token_invalid_after_logout(api_client, token):
+    assert me(api_client, token).status_code == 200
+    response = api_client.post(reverse('logout'), HTTP_AUTHORIZATION=f'Token {token.key}')
+    assert response.status_code == 204
+    assert me(api_client, token).status_code == 401
+
+
+def test_cached_token_invalid_after_deactivation(api_client, user, token):
+    assert me(api_client, token).status_code == 200
+    user.is_active = False
+    user.save()
+    assert me(api_client, token).status_code == 401
+
+
+def test_cached_user_updated_after_password_change(user, token):
+    authenticate(token)
+    user.set_password('new password')
+    user.save()
+    cached_user, _ = authenticate(token)
+    assert cached_user.check_password('new password')
+
+
+def test_cached_user_updated_after_organization_change(organization, token):
+    authenticate(token)
+    organization.name = 'Renamed organization'
+    organization.save()
+    cached_user, _ = authenticate(token)
+    assert cached_user.organization.name == 'Renamed organization'
+
+
+def test_tokens_not_cached_in_process_local_cache(settings, token, django_assert_num_queries):
+    use_token_cache(settings, 'django.core.cache.backends.locmem.LocMemCache')
+    authenticate(token)
+    with django_assert_num_queries(1):
+        authenticate(token)
@@ -0,0 +1,57 @@
+import io
+
+import pytest
+from django.urls import reverse
+from django.core.files.base import ContentFile
+from PIL import Image
+
+from material import avatars
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def synchronous_tasks(settings):
+    settings.BACKGROUND_TASKS_SYNCHRONOUS = True
+
+
+def photo(width=800, height=600, color='red'):
+    exif = Image.Exif()
+    exif[0x010f] = 'Camera maker'
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(output, format='JPEG', exif=exif)
+    return ContentFile(output.getvalue(), name='photo.jpg')
+
+
+def test_avatar_urls_fall_back_to_original(user):
+    user.avatar.save('photo.jpg', photo(), save=False)
+    urls = avatars.get_urls(user)
+    assert set(urls) == set(avatars.get_variant_keys())
+    assert set(urls.values()) == {user.avatar.url}
+
+
+def test_avatar_processed_after_upload(api_client, user, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        user.avatar.save('photo.jpg', photo())
+    user.refresh_from_db()
+    assert user.avatar_variants['source'] == user.avatar.name
+    with user.avatar.open() as f:
+        assert not Image.open(f).getexif()
+    for size_name, size in avatars.SIZES.items():
+        with avatars.get_storage().open(user.avatar_variants[size_name]) as f:
+            assert Image.open(f).size == (size, size * 3 // 4)
+    api_client.force_authenticate(user=user)
+    data = api_client.get(reverse('user-detail', args=(user.id,))).data
+    assert data['avatar_urls']['small'].endswith(user.avatar_variants['small'])
+    assert user.avatar_variants['small'].startswith(avatars.get_variant_directory(user.avatar.name))
+    assert data['avatar'].endswith(user.avatar.name)
+
+
+def test_stale_variants_are_discarded(user):
+    user.avatar.save('photo.jpg', photo())
+    old_name = user.avatar.name
+    user.avatar.save('photo.jpg', photo(color='blue'))
+    avatars.process_avatar(user.pk, old_name)
+    user.refresh_from_db()
+    assert user.avatar_variants == {}
+    assert avatars.get_storage().listdir(avatars.VARIANT_DIRECTORY) == ([], [])
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+from django.core.files.base import ContentFile
+
+from material import blobs
+from material.models import Organization
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def synchronous_tasks(settings):
+    settings.BACKGROUND_TASKS_SYNCHRONOUS = True
+
+
+def storage():
+    return blobs.get_field(Organization).storage
+
+
+def age(name, seconds):
+    path = storage().path(name)
+    mtime = os.path.getmtime(path) - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_same_content_same_name():
+    first = storage().save('logos/a.PNG', ContentFile(b'content'))
+    second = storage().save('logos/b.png', ContentFile(b'content'))
+    third = storage().save('logos/c.png', ContentFile(b'other content'))
+    assert first == second == 'logos/ed7002b439e9ac845f22357d822bac1444730fbdb6016d3ec9432297b9ec9f73.png'
+    assert third != first
+    assert sorted(storage().listdir('logos')[1]) == sorted([os.path.basename(first), os.path.basename(third)])
+
+
+def test_replaced_blob_deleted_unless_shared(django_capture_on_commit_callbacks):
+    organizations = [Organization.objects.create(name=str(i)) for i in range(2)]
+    for organization in organizations:
+        organization.logo.save('a.png', ContentFile(b'shared'))
+    shared = organizations[0].logo.name
+    age(shared, 60)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        organizations[0].logo.save('b.png', ContentFile(b'own'))
+    assert storage().exists(shared)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        organizations[1].delete()
+    assert not storage().exists(shared)
+    assert storage().exists(organizations[0].logo.name)
+
+
+def test_recently_saved_blob_kept(organization, django_capture_on_commit_callbacks):
+    organization.logo.save('a.png', ContentFile(b'logo'))
+    old_name = organization.logo.name
+    with django_capture_on_commit_callbacks(execute=True):
+        # Saving the same content again in the meantime marks the file as used
+        organization.logo.save('b.png', ContentFile(b'new logo'))
+        storage().save('logos/c.png', ContentFile(b'logo'))
+    assert storage().exists(old_name)
+
+    assert blobs.collect_garbage() == 0
+    age(old_name, blobs.GRACE_PERIOD + 1)
+    assert blobs.collect_garbage() == 1
+    assert not storage().exists(old_name)
+    assert Organization.objects.get().logo.storage.exists(organization.logo.name)
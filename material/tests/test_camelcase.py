@@ -0,0 +1,64 @@
+import datetime
+import decimal
+import io
+import uuid
+from collections import OrderedDict
+
+import pytest
+from django.utils.translation import gettext_lazy
+from djangorestframework_camel_case.parser import CamelCaseJSONParser as LibraryParser
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer as LibraryRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict
+
+from material.camelcase import CamelCaseJSONParser, CamelCaseJSONRenderer, camelize
+
+SAMPLES = [
+    None,
+    {},
+    [],
+    'text',
+    {'block_ids_en': ['a', 'b'], 'body_fi': [{'type': 'lesson_content', 'value': '<p>x</p>'}]},
+    OrderedDict([('text_en', 'é 😀     "quoted" \\ / \x00 \x1f \x7f \b\f\n\r\t'), ('id', 1)]),
+    ReturnDict([('is_supervisor', True), ('organization', uuid.UUID('12345678-1234-5678-1234-567812345678'))],
+               serializer=None),
+    {'nested_list': [[1, 2], (3, 4), {'a_b': None}], 'big_int': 2 ** 70, 'negative_int': -2 ** 63},
+    {'float_value': 1e16, 'small_float': 1e-7, 'pi': 3.14159},
+    {'lazy_key': gettext_lazy('Lazy'), gettext_lazy('lazy_text'): 1},
+    {1: 'int key', True: 'bool key', 'with_2_numbers_3': 'x', '_leading': 1, 'trailing_': 2, 'double__under': 3},
+    {'timestamp': datetime.datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+     'date': datetime.date(2026, 1, 2), 'decimal': decimal.Decimal('1.50')},
+    {'lone_surrogate': '\ud800'},
+]
+
+
+@pytest.mark.parametrize('data', SAMPLES)
+def test_renderer_output_identical_to_library(data):
+    try:
+        expected = LibraryRenderer().render(data)
+    except UnicodeEncodeError:
+        with pytest.raises(UnicodeEncodeError):
+            CamelCaseJSONRenderer().render(data)
+        return
+    assert CamelCaseJSONRenderer().render(data) == expected
+
+
+def test_renderer_indent_identical_to_library():
+    data = {'text_en': 'x', 'items': [1, 2]}
+    media_type = 'application/json; indent=4'
+    assert CamelCaseJSONRenderer().render(data, media_type) == LibraryRenderer().render(data, media_type)
+
+
+def test_camelize_detects_encodable_data():
+    assert camelize({'a_b': [1, 'x', None, True]}) == ({'aB': [1, 'x', None, True]}, True)
+    assert not camelize({'a': 1.5})[1]
+    assert not camelize({'a': 2 ** 64})[1]
+    assert not camelize({1: 'a'})[1]
+
+
+@pytest.mark.parametrize('content', [
+    b'{"blockIdsEn": ["a"], "nested": [{"isSupervisor": true, "value2X": 1.5}], "HTMLText": null}',
+    b'[]',
+    '{"text": "é"}'.encode(),
+])
+def test_parser_output_identical_to_library(content):
+    assert CamelCaseJSONParser().parse(io.BytesIO(content)) == LibraryParser().parse(io.BytesIO(content))
@@ -0,0 +1,117 @@
+import os
+
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404
+from django.test import RequestFactory
+from wagtailmedia.models import get_media_model
+
+from material import media
+from material.models import MediaStreams
+
+pytestmark = pytest.mark.django_db
+
+CONTENT = bytes(range(256)) * 1000
+
+
+@pytest.fixture(autouse=True)
+def video_file(settings, media_root):
+    settings.MEDIA_ACCEL = ''
+    settings.TRANSCODE_MEDIA = False
+    os.makedirs(media_root / 'media')
+    (media_root / 'media' / 'video.mp4').write_bytes(CONTENT)
+
+
+@pytest.fixture(autouse=True)
+def video(video_file):
+    return get_media_model().objects.create(title='Video', type='video', file='media/video.mp4')
+
+
+def get(path='media/video.mp4', user=None, **headers):
+    request = RequestFactory().get(f'/media/{path}', **headers)
+    request.user = user or AnonymousUser()
+    return media.serve(request, path)
+
+
+def test_whole_file():
+    response = get()
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'video/mp4'
+    assert response['Accept-Ranges'] == 'bytes'
+    assert b''.join(response.streaming_content) == CONTENT
+
+
+@pytest.mark.parametrize('header, start, end', [
+    ('bytes=100-199', 100, 199),
+    ('bytes=1000-', 1000, len(CONTENT) - 1),
+    ('bytes=-10', len(CONTENT) - 10, len(CONTENT) - 1),
+    ('bytes=200000-999999999', 200000, len(CONTENT) - 1),
+])
+def test_range(header, start, end):
+    response = get(HTTP_RANGE=header)
+    assert response.status_code == 206
+    assert response['Content-Range'] == f'bytes {start}-{end}/{len(CONTENT)}'
+    assert response['Content-Length'] == str(end - start + 1)
+    assert b''.join(response.streaming_content) == CONTENT[start:end + 1]
+
+
+def test_unsatisfiable_range():
+    response = get(HTTP_RANGE=f'bytes={len(CONTENT)}-')
+    assert response.status_code == 416
+    assert response['Content-Range'] == f'bytes */{len(CONTENT)}'
+
+
+def test_range_of_outdated_file():
+    response = get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Wed, 21 Oct 2015 07:28:00 GMT')
+    assert response.status_code == 200
+
+
+def test_not_modified():
+    response = get()
+    assert get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+
+
+@pytest.mark.parametrize('path', ['media/missing.mp4', '../media/video.mp4', 'media/.hidden', 'media/video.mp4.tmp',
+                                  'media'])
+def test_not_found(tmp_path, path):
+    (tmp_path / 'media' / '.hidden').write_bytes(b'')
+    (tmp_path / 'media' / 'video.mp4.tmp').write_bytes(b'')
+    with pytest.raises(Http404):
+        get(path)
+
+
+def test_x_accel_redirect(settings):
+    settings.MEDIA_ACCEL = 'x-accel-redirect'
+    response = get('media/video.mp4')
+    assert response['X-Accel-Redirect'] == '/protected-media/media/video.mp4'
+    assert response['Content-Type'] == 'video/mp4'
+    assert response.content == b''
+
+
+def test_x_sendfile(settings, tmp_path):
+    settings.MEDIA_ACCEL = 'x-sendfile'
+    response = get('media/video.mp4')
+    assert response['X-Sendfile'] == str(tmp_path / 'media' / 'video.mp4')
+
+
+def test_unreferenced_file_only_served_to_superusers(tmp_path, admin):
+    (tmp_path / 'media' / 'orphaned.mp4').write_bytes(CONTENT)
+    with pytest.raises(Http404):
+        get('media/orphaned.mp4')
+    assert get('media/orphaned.mp4', user=admin).status_code == 200
+
+
+def test_avatars_cached_forever(tmp_path, admin):
+    os.makedirs(tmp_path / 'avatars')
+    (tmp_path / 'avatars' / 'abc.png').write_bytes(CONTENT)
+    assert get('avatars/abc.png', user=admin)['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert not get().has_header('Cache-Control')
+
+
+def test_streams_of_existing_media_item(tmp_path, video):
+    os.makedirs(tmp_path / 'streams' / str(video.pk) / 'a')
+    (tmp_path / 'streams' / str(video.pk) / 'a' / '360p.m3u8').write_text('#EXTM3U\n')
+    with pytest.raises(Http404):
+        get(f'streams/{video.pk}/a/360p.m3u8')
+    MediaStreams.objects.create(media=video, source=video.file.name, playlist=f'streams/{video.pk}/a/index.m3u8')
+    assert get(f'streams/{video.pk}/a/360p.m3u8').status_code == 200
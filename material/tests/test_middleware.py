@@ -0,0 +1,50 @@
+import gzip
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from material import middleware
+
+
+def compress(accept_encoding, monkeypatch, brotli=None):
+    monkeypatch.setattr(middleware, 'brotli', brotli)
+    content = b'{"text":"' + b'x' * 1000 + b'"}'
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = '"abc"'
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+    return content, middleware.CompressionMiddleware(lambda request: response)(request)
+
+
+def test_gzip(monkeypatch):
+    content, response = compress('gzip, br', monkeypatch)
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == content
+    assert response['ETag'] == 'W/"abc"'
+
+
+def test_brotli(monkeypatch):
+    class FakeBrotli:
+        @staticmethod
+        def compress(content):
+            return b'compressed'
+
+    _, response = compress('gzip, br', monkeypatch, brotli=FakeBrotli)
+    assert response['Content-Encoding'] == 'br'
+    assert response.content == b'compressed'
+    assert response['Vary'] == 'Accept-Encoding'
+
+
+def test_no_compression_if_not_accepted(monkeypatch):
+    content, response = compress('identity', monkeypatch)
+    assert not response.has_header('Content-Encoding')
+    assert response.content == content
+
+
+def test_no_compression_of_ranges(monkeypatch):
+    content = b'x' * 1000
+    response = HttpResponse(content)
+    response['Accept-Ranges'] = 'bytes'
+    request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+    response = middleware.CompressionMiddleware(lambda request: response)(request)
+    assert not response.has_header('Content-Encoding')
+    assert response.content == content
@@ -0,0 +1,151 @@
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core import mail
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from material import outbox, queues
+from material.models import QueuedEmail
+
+pytestmark = pytest.mark.django_db
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough of an SMTP server for Django's SMTP backend, rejecting recipients listed in `server.rejected`."""
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            command = line[:4].upper()
+            if not line or command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            if command in ('EHLO', 'HELO', 'RSET', 'NOOP'):
+                self.reply('250 localhost')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                if address in self.server.rejected:
+                    self.reply('451 Try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 Go ahead')
+                data = []
+                for data_line in iter(self.rfile.readline, b'.\r\n'):
+                    data.append(data_line)
+                self.server.messages.append((recipients, b''.join(data).decode()))
+                self.reply('250 OK')
+            else:
+                self.reply('502 Not implemented')
+
+
+@pytest.fixture
+def smtp_server(settings):
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.messages = []
+    server.rejected = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    settings.EMAIL_BACKEND = 'material.outbox.OutboxBackend'
+    settings.OUTBOX_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST, settings.EMAIL_PORT = server.server_address
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def queue(*recipients):
+    for recipient in recipients:
+        message = mail.EmailMultiAlternatives('Subject', 'Body', 'from@example.com', [recipient])
+        message.attach_alternative('<p>Body</p>', 'text/html')
+        message.send()
+
+
+def test_sending_only_queues(smtp_server):
+    queue('a@example.com')
+    assert QueuedEmail.objects.count() == 1
+    assert smtp_server.messages == []
+
+
+def test_batch_sent_over_one_connection(smtp_server):
+    queue('a@example.com', 'b@example.com', 'c@example.com')
+    assert outbox.send_queued() == 3
+    assert smtp_server.connections == 1
+    assert [recipients for recipients, _ in smtp_server.messages] == [['a@example.com'], ['b@example.com'],
+                                                                     ['c@example.com']]
+    assert 'text/html' in smtp_server.messages[0][1]
+    assert not QueuedEmail.objects.exists()
+
+
+def test_sendqueuedmail_command(smtp_server):
+    queue('a@example.com')
+    out = StringIO()
+    call_command('sendqueuedmail', stdout=out)
+    assert out.getvalue() == "Processed 1 queued emails\n"
+    assert not QueuedEmail.objects.exists()
+
+
+def test_failed_email_retried_with_backoff(smtp_server):
+    smtp_server.rejected.add('b@example.com')
+    queue('a@example.com', 'b@example.com', 'c@example.com')
+    assert outbox.send_queued() == 3
+    assert len(smtp_server.messages) == 2
+    email = QueuedEmail.objects.get()
+    assert email.attempts == 1
+    assert 'SMTPRecipientsRefused' in email.last_error
+    assert email.next_attempt_at > timezone.now() + queues.RETRY_DELAY - timedelta(seconds=10)
+
+    # Not due yet
+    assert outbox.send_queued() == 0
+    smtp_server.rejected.clear()
+    QueuedEmail.objects.update(next_attempt_at=timezone.now())
+    assert outbox.send_queued() == 1
+    assert smtp_server.messages[-1][0] == ['b@example.com']
+    assert not QueuedEmail.objects.exists()
+
+
+def test_claimed_emails_skipped_until_lease_expires(smtp_server):
+    queue('a@example.com')
+    [email] = outbox.claim_batch(10)
+    assert outbox.send_queued() == 0
+    QueuedEmail.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+    assert outbox.send_queued() == 1
+    assert smtp_server.messages[0][0] == ['a@example.com']
+
+
+def test_given_up_after_max_attempts(smtp_server):
+    smtp_server.rejected.add('a@example.com')
+    queue('a@example.com')
+    for _ in range(outbox.MAX_ATTEMPTS):
+        QueuedEmail.objects.update(next_attempt_at=timezone.now())
+        outbox.send_queued()
+    email = QueuedEmail.objects.get()
+    assert email.attempts == outbox.MAX_ATTEMPTS
+    assert email.next_attempt_at is None
+
+
+def test_password_reset_queued(smtp_server, api_client, user, organization):
+    organization.password_reset_url = 'https://example.com/reset/{uid}/{token}'
+    organization.save()
+    response = api_client.post(reverse('user-reset-password'), {'email': user.email, 'organization': organization.id},
+                               format='json')
+    assert response.status_code == 204
+    assert smtp_server.messages == []
+    assert outbox.send_queued() == 1
+    assert smtp_server.messages[0][0] == [user.email]
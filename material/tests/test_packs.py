@@ -0,0 +1,123 @@
+import gzip
+import json
+from io import StringIO
+
+import pytest
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+
+from material import packs
+from material.models import Lesson, OpenQuestion
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def base_url(settings):
+    settings.CONTENT_PACK_BASE_URL = 'https://api.example.com/'
+    settings.ALLOWED_HOSTS = ['testserver', 'api.example.com']
+
+
+def read_pack(organization, version):
+    with default_storage.open(packs.get_name(organization.pk, version)) as f:
+        return json.loads(gzip.decompress(f.read()))
+
+
+def test_write_pack(organization, category, quiz):
+    open_question = OpenQuestion.objects.create(internal_name='Question')
+    body = [{'type': 'quiz', 'value': quiz.id}, {'type': 'open_question', 'value': open_question.id}]
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=json.dumps(body)))
+    category.add_child(instance=Lesson(title='Unassigned lesson'))
+    organization.lessons.add(lesson)
+    version, written = packs.write_pack(organization)
+    assert written
+    data = read_pack(organization, version)
+    assert data['version'] == version
+    [category_data] = data['categories']
+    assert [lesson_data['id'] for lesson_data in category_data['lessons']] == [lesson.id]
+    [quiz_data] = data['quizzes']
+    assert [len(question['answers']) for question in quiz_data['questions']] == [3, 3]
+    assert [question['id'] for question in data['open_questions']] == [open_question.id]
+    assert data['organization']['url'].startswith('https://api.example.com/')
+
+
+def test_write_pack_skips_unchanged_packs(organization, lesson):
+    organization.lessons.add(lesson)
+    version, _ = packs.write_pack(organization)
+    assert packs.write_pack(organization) == (version, False)
+
+
+def test_write_pack_replaces_pack_after_assigned_lessons_change(organization, category, lesson):
+    organization.lessons.add(lesson)
+    old_version, _ = packs.write_pack(organization)
+    organization.lessons.add(category.add_child(instance=Lesson(title='New lesson')))
+    version, written = packs.write_pack(organization)
+    assert written and version != old_version
+    assert len(read_pack(organization, version)['categories'][0]['lessons']) == 2
+    assert not default_storage.exists(packs.get_name(organization.pk, old_version))
+
+
+def test_rewrite_media_urls():
+    data = {
+        'file': 'https://api.example.com/media/media/video.mp4',
+        'image': {'url': '/media/images/image.jpg'},
+        'html': ['<p>Text about /media/ <img src="/media/images/image.jpg"></p>'],
+    }
+    paths = packs.rewrite_media_urls(data, 'https://api.example.com/media/')
+    assert paths == ['images/image.jpg', 'media/video.mp4']
+    assert data == {
+        'file': 'media/video.mp4',
+        'image': {'url': 'images/image.jpg'},
+        'html': ['<p>Text about /media/ <img src="images/image.jpg"></p>'],
+    }
+
+
+def test_buildpacks_command(organization, lesson):
+    organization.lessons.add(lesson)
+    out = StringIO()
+    call_command('buildpacks', stdout=out)
+    call_command('buildpacks', str(organization.pk), stdout=out)
+    assert out.getvalue().splitlines()[0].startswith('Built: ')
+    assert out.getvalue().splitlines()[1].startswith('Unchanged: ')
+
+
+def test_pack_endpoint(api_client, organization, lesson):
+    organization.lessons.add(lesson)
+    response = api_client.get(reverse('organization-pack', args=(organization.id,)))
+    assert response.status_code == 200
+    name = packs.get_name(organization.pk, response.data['version'])
+    assert response.data['url'] == f'http://testserver/media/{name}'
+    assert response.data['size'] == default_storage.size(name)
+
+
+def test_get_pack_builds_only_after_changes(monkeypatch, organization, quiz, lesson):
+    organization.lessons.add(lesson)
+    version, written = packs.get_pack(organization)
+    assert written
+    builds = []
+    build_pack = packs.build_pack
+    monkeypatch.setattr(packs, 'build_pack',
+                        lambda organization: builds.append(organization) or build_pack(organization))
+    assert packs.get_pack(organization) == (version, False)
+    assert not builds
+    quiz.save()
+    assert packs.get_pack(organization) == (version, False)
+    assert len(builds) == 1
+
+
+def test_buildpacks_command_skips_unchanged_content(monkeypatch, organization, lesson):
+    organization.lessons.add(lesson)
+    call_command('buildpacks', stdout=StringIO())
+    monkeypatch.setattr(packs, 'build_pack', lambda organization: pytest.fail("Pack built again"))
+    out = StringIO()
+    call_command('buildpacks', stdout=out)
+    assert out.getvalue().startswith('Unchanged: ')
+
+
+def test_write_pack_keeps_temporary_files_of_other_builds(organization, lesson):
+    organization.lessons.add(lesson)
+    temp_name = f'{packs.get_directory(organization.pk)}/other.json.gz.0123.tmp'
+    default_storage.save(temp_name, StringIO('partial'))
+    packs.write_pack(organization)
+    assert default_storage.exists(temp_name)
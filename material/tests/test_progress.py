@@ -0,0 +1,114 @@
+import json
+import uuid
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from material.models import BlockCompletion, Lesson, OrganizationLessonProgress, User
+
+pytestmark = pytest.mark.django_db
+
+
+def page_breaks(block_ids):
+    return json.dumps([{'type': 'page_break', 'value': None, 'id': str(block_id)} for block_id in block_ids])
+
+
+@pytest.fixture
+def blocks():
+    return [uuid.uuid4() for _ in range(2)]
+
+
+@pytest.fixture
+def lesson_with_blocks(category, blocks):
+    return category.add_child(instance=Lesson(title='Lesson', body_en=page_breaks(blocks)))
+
+
+@pytest.fixture
+def member(organization):
+    return User.objects.create(email='member@example.com', organization=organization)
+
+
+def progress_row(organization, lesson):
+    row = OrganizationLessonProgress.objects.get(organization=organization, lesson=lesson)
+    return row.completed_blocks, row.members_started, row.members_finished
+
+
+def test_progress_follows_completions(organization, user, member, lesson_with_blocks, blocks):
+    completion = BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[0])
+    assert progress_row(organization, lesson_with_blocks) == (1, 1, 0)
+    BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[1])
+    BlockCompletion.objects.create(user=member, lesson=lesson_with_blocks, block=blocks[1])
+    assert progress_row(organization, lesson_with_blocks) == (3, 2, 1)
+    completion.delete()
+    assert progress_row(organization, lesson_with_blocks) == (2, 2, 0)
+
+
+def test_progress_follows_deleted_member(organization, user, member, lesson_with_blocks, blocks):
+    for block in blocks:
+        BlockCompletion.objects.create(user=member, lesson=lesson_with_blocks, block=block)
+    BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[0])
+    member.delete()
+    assert progress_row(organization, lesson_with_blocks) == (1, 1, 0)
+
+
+def test_progress_updates_match_rebuild(organization, user, member, lesson_with_blocks, blocks):
+    BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[0])
+    BlockCompletion.objects.create(user=member, lesson=lesson_with_blocks, block=uuid.uuid4())
+    completion = BlockCompletion.objects.create(user=member, lesson=lesson_with_blocks, block=blocks[1])
+    completion.block = blocks[0]
+    completion.save()
+    updated = progress_row(organization, lesson_with_blocks)
+    call_command('rebuildprogress', stdout=StringIO())
+    assert progress_row(organization, lesson_with_blocks) == updated == (2, 2, 0)
+
+
+def test_progress_with_block_in_several_languages(organization, user, category, blocks):
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=page_breaks(blocks),
+                                                body_fi=page_breaks(blocks[:1])))
+    BlockCompletion.objects.create(user=user, lesson=lesson, block=blocks[0])
+    # The block is completed once, which finishes the lesson in Finnish
+    updated = progress_row(organization, lesson)
+    call_command('rebuildprogress', stdout=StringIO())
+    assert progress_row(organization, lesson) == updated == (1, 1, 1)
+
+
+def test_progress_follows_lesson_body(organization, user, lesson_with_blocks, blocks):
+    BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[0])
+    lesson_with_blocks.body_en = page_breaks(blocks[:1])
+    lesson_with_blocks.save_revision().publish()
+    assert progress_row(organization, lesson_with_blocks) == (1, 1, 1)
+
+
+def test_progress_from_batch(api_client, organization, user, lesson_with_blocks, blocks):
+    api_client.force_authenticate(user=user)
+    response = api_client.post(reverse('blockcompletion-batch'),
+                               [{'lesson': lesson_with_blocks.id, 'block': str(block)} for block in blocks],
+                               format='json')
+    assert response.status_code == 200
+    assert progress_row(organization, lesson_with_blocks) == (2, 1, 1)
+
+
+def test_rebuild_command(organization, user, lesson_with_blocks, blocks):
+    BlockCompletion.objects.bulk_create([BlockCompletion(user=user, lesson=lesson_with_blocks, block=block)
+                                         for block in blocks])
+    assert not OrganizationLessonProgress.objects.exists()
+    call_command('rebuildprogress', stdout=StringIO())
+    assert progress_row(organization, lesson_with_blocks) == (2, 1, 1)
+
+
+def test_dashboard(api_client, organization, user, supervisor, lesson_with_blocks, blocks):
+    BlockCompletion.objects.create(user=user, lesson=lesson_with_blocks, block=blocks[0])
+    api_client.force_authenticate(user=supervisor)
+    response = api_client.get(reverse('organization-progress', args=(organization.id,)))
+    assert response.status_code == 200
+    assert response.data['members'] == organization.user_set.count()
+    assert response.data['lessons'] == [{'lesson': lesson_with_blocks.id, 'completed_blocks': 1,
+                                         'members_started': 1, 'members_finished': 0}]
+
+
+def test_dashboard_only_for_supervisors(api_client, organization, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.get(reverse('organization-progress', args=(organization.id,)))
+    assert response.status_code == 403
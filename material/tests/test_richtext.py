@@ -0,0 +1,69 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.core.rich_text import expand_db_html
+from wagtail.embeds.embeds import get_embed_hash
+from wagtail.embeds.models import Embed
+
+from material import richtext
+from material.models import ContentVersion, StaticPage
+
+pytestmark = pytest.mark.django_db
+
+
+def page_links(pages):
+    return ''.join(f'<p><a linktype="page" id="{page.id}">{page.title}</a></p>' for page in pages)
+
+
+def test_expand_same_as_wagtail(site_root, category, lesson):
+    html = page_links([category, lesson]) + '<p><a linktype="page" id="0">Missing</a></p><a href="https://x.fi">x</a>'
+    assert richtext.expand(html) == expand_db_html(html)
+
+
+def test_expand_cached(site_root, category):
+    html = page_links([category])
+    expanded = richtext.expand(html)
+    version = richtext.get_version()
+    with CaptureQueriesContext(connection) as context:
+        assert richtext.expand(html, version=version) == expanded
+    assert not context.captured_queries
+
+
+def test_expand_invalidated_by_other_processes():
+    url = 'https://example.com/video'
+    Embed.objects.create(url=url, hash=get_embed_hash(url), html='<p>Old</p>', max_width=None)
+    html = f'<embed embedtype="media" url="{url}"/>'
+    assert 'Old' in richtext.expand(html)
+    # Another process changes the embed and bumps the version without touching our cache
+    Embed.objects.filter(url=url).update(html='<p>New</p>')
+    assert 'Old' in richtext.expand(html)
+    ContentVersion.objects.filter(name=richtext.VERSION).update(version='other')
+    assert 'New' in richtext.expand(html)
+
+
+def test_expand_invalidated_on_publish(site_root, category):
+    html = page_links([category])
+    richtext.expand(html)
+    version = richtext.get_version()
+    category.save_revision().publish()
+    assert richtext.get_version() != version
+
+
+def test_expand_many_query_count_independent_of_links(site_root):
+    pages = [site_root.add_child(instance=StaticPage(title=f'Page {i}')) for i in range(6)]
+    # Warm up caches unrelated to rich text
+    richtext.expand_many([page_links(pages[5:])])
+    with CaptureQueriesContext(connection) as context:
+        richtext.expand_many([page_links(pages[:1])])
+    small_count = len(context.captured_queries)
+    with CaptureQueriesContext(connection) as context:
+        richtext.expand_many([page_links(pages[1:3]), page_links(pages[3:])])
+    assert len(context.captured_queries) == small_count
+
+
+def test_static_page_list_expands_links(api_client, site_root, category):
+    site_root.add_child(instance=StaticPage(title='Page', body_en=page_links([category])))
+    response = api_client.get(reverse('staticpage-list'))
+    assert response.status_code == 200
+    assert response.data['results'][0]['body_en'] == expand_db_html(page_links([category]))
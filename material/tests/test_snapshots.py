@@ -0,0 +1,70 @@
+import json
+import os
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from material import snapshots
+from material.models import Lesson, OpenQuestion
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def snapshot_root(settings, tmp_path):
+    settings.API_SNAPSHOT_ROOT = str(tmp_path / 'snapshot')
+    settings.API_SNAPSHOT_BASE_URL = 'http://testserver/'
+    settings.BACKGROUND_TASKS_SYNCHRONOUS = True
+    return settings.API_SNAPSHOT_ROOT
+
+
+def read_snapshot(root, url):
+    with open(snapshots.get_file_path(root, url)) as f:
+        return json.load(f)
+
+
+def test_resync_writes_all_routes(api_client, snapshot_root, lesson):
+    out = StringIO()
+    call_command('resyncsnapshot', stdout=out)
+    assert os.path.islink(snapshot_root)
+    for url in (reverse('lesson-list'), reverse('lesson-detail', args=(lesson.id,)),
+                reverse('category-detail', args=(lesson.get_parent().id,)), reverse('quiz-list')):
+        assert read_snapshot(snapshot_root, url) == json.loads(api_client.get(url).content)
+
+
+def test_resync_swaps_directory(snapshot_root, lesson):
+    snapshots.resync()
+    old_directory = os.path.realpath(snapshot_root)
+    snapshots.resync()
+    assert os.path.realpath(snapshot_root) != old_directory
+    assert not os.path.exists(old_directory)
+    assert os.path.exists(snapshots.get_file_path(snapshot_root, reverse('lesson-detail', args=(lesson.id,))))
+
+
+def test_publish_updates_snapshot(snapshot_root, django_capture_on_commit_callbacks, category):
+    snapshots.resync()
+    with django_capture_on_commit_callbacks(execute=True):
+        lesson = category.add_child(instance=Lesson(title='Lesson'))
+        lesson.save_revision().publish()
+    assert read_snapshot(snapshot_root, reverse('lesson-detail', args=(lesson.id,)))['id'] == lesson.id
+    assert read_snapshot(snapshot_root, reverse('category-detail', args=(category.id,)))['lessons'] == [lesson.id]
+
+
+def test_snippet_changes_update_snapshot(snapshot_root, django_capture_on_commit_callbacks):
+    snapshots.resync()
+    with django_capture_on_commit_callbacks(execute=True):
+        open_question = OpenQuestion.objects.create(internal_name='Question', text='Text')
+    url = reverse('openquestion-detail', args=(open_question.id,))
+    assert read_snapshot(snapshot_root, url)['textEn'] == 'Text'
+    with django_capture_on_commit_callbacks(execute=True):
+        open_question.delete()
+    assert not os.path.exists(snapshots.get_file_path(snapshot_root, url))
+    assert read_snapshot(snapshot_root, reverse('openquestion-list'))['results'] == []
+
+
+def test_no_updates_without_snapshot(snapshot_root, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        OpenQuestion.objects.create(internal_name='Question')
+    assert not os.path.exists(snapshot_root)
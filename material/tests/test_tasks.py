@@ -0,0 +1,72 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from material import tasks
+from material.models import QueuedTask
+
+pytestmark = pytest.mark.django_db
+
+calls = []
+
+
+def record(*args):
+    calls.append(args)
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+@pytest.fixture(autouse=True)
+def task_queue(settings):
+    settings.TASK_QUEUE = True
+    calls.clear()
+
+
+def test_run_in_worker_queues_task():
+    tasks.run_in_worker(record, 1, 'a')
+    task = QueuedTask.objects.get()
+    assert (task.function, task.args) == (f'{__name__}.record', [1, 'a'])
+    assert not calls
+    assert tasks.run_queued() == 1
+    assert calls == [(1, 'a')]
+    assert not QueuedTask.objects.exists()
+
+
+def test_run_in_worker_without_queue(settings, django_capture_on_commit_callbacks):
+    settings.TASK_QUEUE = False
+    settings.BACKGROUND_TASKS_SYNCHRONOUS = True
+    with django_capture_on_commit_callbacks(execute=True):
+        tasks.run_in_worker(record, 1)
+    assert calls == [(1,)]
+    assert not QueuedTask.objects.exists()
+
+
+def test_failed_task_retried_later():
+    tasks.run_in_worker(fail, 'broken')
+    assert tasks.run_queued() == 1
+    task = QueuedTask.objects.get()
+    assert task.attempts == 1
+    assert task.last_error == 'ValueError: broken'
+    assert task.next_attempt_at > timezone.now()
+    assert tasks.run_queued() == 0
+
+
+def test_claimed_task_skipped_until_lease_expires():
+    tasks.run_in_worker(record, 1)
+    [task] = tasks.claim_queued(10)
+    assert tasks.claim_queued(10) == []
+    QueuedTask.objects.update(claimed_until=timezone.now() - timedelta(seconds=1))
+    assert [claimed.pk for claimed in tasks.claim_queued(10)] == [task.pk]
+
+
+def test_runqueuedtasks_command():
+    tasks.run_in_worker(record, 1)
+    out = StringIO()
+    call_command('runqueuedtasks', stdout=out)
+    assert out.getvalue() == "Processed 1 queued tasks\n"
+    assert calls == [(1,)]
@@ -0,0 +1,121 @@
+import json
+import shutil
+import subprocess
+
+import pytest
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from wagtailmedia.models import get_media_model
+
+from material import transcoding
+from material.models import Lesson, MediaStreams
+
+pytestmark = pytest.mark.django_db
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None,
+                                     reason="ffmpeg is not installed")
+
+
+@pytest.fixture(autouse=True)
+def no_transcoding(settings):
+    settings.TRANSCODE_MEDIA = False
+
+
+def create_media(content=b'video', media_type='video'):
+    return get_media_model().objects.create(title='Video', type=media_type, file=ContentFile(content, name='v.mp4'))
+
+
+def get_media_block(api_client, category, media):
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=json.dumps([
+        {'type': 'media', 'value': media.id},
+    ])))
+    response = api_client.get(reverse('lesson-detail', args=(lesson.id,)) + '?fields=body_en')
+    return response.data['body_en'][0]['value']
+
+
+def test_original_until_transcoded(api_client, category):
+    media = create_media()
+    value = get_media_block(api_client, category, media)
+    assert value['file'] == f'http://testserver{media.file.url}'
+    assert value['hls'] is None
+    assert value['variants'] == []
+
+
+def test_streams_of_current_file(api_client, category):
+    media = create_media()
+    directory = transcoding.get_directory(media.pk, media.file.name)
+    MediaStreams.objects.create(media=media, source=media.file.name, playlist=f'{directory}/index.m3u8',
+                                poster=f'{directory}/poster.jpg', variants=[
+                                    {'playlist': f'{directory}/360p.m3u8', 'bandwidth': 952000, 'width': 640,
+                                     'height': 360},
+                                ])
+    value = get_media_block(api_client, category, media)
+    assert value['hls'] == f'http://testserver/media/{directory}/index.m3u8'
+    assert value['poster'] == f'http://testserver/media/{directory}/poster.jpg'
+    assert value['variants'] == [{'url': f'http://testserver/media/{directory}/360p.m3u8', 'bandwidth': 952000,
+                                  'width': 640, 'height': 360}]
+
+
+def test_streams_of_replaced_file_ignored(api_client, category):
+    media = create_media()
+    MediaStreams.objects.create(media=media, source='media/old.mp4', playlist='streams/old/index.m3u8')
+    assert get_media_block(api_client, category, media)['hls'] is None
+
+
+@requires_ffmpeg
+def test_transcode_video(tmp_path):
+    source = tmp_path / 'source.mp4'
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=size=1280x720:duration=2', '-f', 'lavfi',
+                    '-i', 'sine=duration=2', '-shortest', str(source)], check=True)
+    media = create_media(source.read_bytes())
+    transcoding.transcode_media(media.pk, media.file.name)
+    streams = MediaStreams.objects.get(media=media)
+    assert [(variant['width'], variant['height']) for variant in streams.variants] == [(640, 360), (1280, 720)]
+    assert (tmp_path / streams.poster).exists()
+    playlist = (tmp_path / streams.playlist).read_text()
+    assert '#EXT-X-STREAM-INF:BANDWIDTH=' in playlist
+    assert '720p.m3u8' in playlist
+
+
+def test_delete_streams(tmp_path):
+    for name in ('a', 'b', '.in-progress'):
+        (tmp_path / 'streams' / '1' / name).mkdir(parents=True)
+    transcoding.delete_streams(1, keep='streams/1/a')
+    assert sorted(path.name for path in (tmp_path / 'streams' / '1').iterdir()) == ['.in-progress', 'a']
+    transcoding.delete_streams(1)
+    assert not (tmp_path / 'streams' / '1').exists()
+
+
+def test_lesson_modified_after_transcoding(api_client, category):
+    media = create_media()
+    lesson = category.add_child(instance=Lesson(title='Lesson', body_en=json.dumps([
+        {'type': 'media', 'value': media.id},
+    ])))
+    url = reverse('lesson-detail', args=(lesson.id,))
+    etag = api_client.get(url)['ETag']
+    assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    MediaStreams.objects.create(media=media, source=media.file.name, playlist='streams/1/a/index.m3u8')
+    response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data['body_en'][0]['value']['hls'] == 'http://testserver/media/streams/1/a/index.m3u8'
+
+
+def test_claim(tmp_path):
+    with transcoding.claim(1, 'media/v.mp4') as claimed:
+        assert claimed
+        with transcoding.claim(1, 'media/v.mp4') as claimed_again:
+            assert not claimed_again
+        with transcoding.claim(1, 'media/other.mp4') as claimed_other:
+            assert claimed_other
+    assert list((tmp_path / 'streams' / '1').iterdir()) == []
+    with transcoding.claim(1, 'media/v.mp4') as claimed:
+        assert claimed
+
+
+def test_transcode_media_skips_claimed_file(monkeypatch):
+    media = create_media()
+    calls = []
+    monkeypatch.setattr(transcoding, 'probe', lambda path: calls.append(path))
+    with transcoding.claim(media.pk, media.file.name):
+        transcoding.transcode_media(media.pk, media.file.name)
+    assert calls == []
@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import io
+
+import pytest
+from django.urls import reverse
+from PIL import Image
+
+from material.models import User
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def upload_limits(settings):
+    settings.MAX_IMAGE_UPLOAD_SIZE = 10000
+    settings.MAX_IMAGE_UPLOAD_PIXELS = 200 * 200
+
+
+def png(width=100, height=100):
+    output = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(output, format='PNG')
+    return output.getvalue()
+
+
+def avatar_url(user):
+    return reverse('user-avatar', args=(user.id,))
+
+
+def test_upload_avatar_raw(api_client, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.put(avatar_url(user), png(), content_type='image/png')
+    assert response.status_code == 200
+    user.refresh_from_db()
+    assert user.avatar.name.endswith('.png')
+    assert response.data['avatar'].endswith(user.avatar.url)
+
+
+@pytest.mark.parametrize('prefix', ['', 'data:image/png;base64,'])
+def test_upload_avatar_base64(api_client, user, prefix):
+    api_client.force_authenticate(user=user)
+    body = prefix + base64.encodebytes(png()).decode()
+    response = api_client.put(avatar_url(user), body, content_type='text/plain')
+    assert response.status_code == 200
+    user.refresh_from_db()
+    with user.avatar.open() as f:
+        assert f.read() == png()
+
+
+def test_upload_avatar_multipart(api_client, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.put(avatar_url(user), {'file': io.BytesIO(png())}, format='multipart')
+    assert response.status_code == 200
+    user.refresh_from_db()
+    assert user.avatar
+
+
+@pytest.mark.parametrize('format', ['raw', 'base64', 'multipart'])
+def test_upload_too_large(api_client, user, format):
+    api_client.force_authenticate(user=user)
+    content = bytes(20000)
+    if format == 'raw':
+        response = api_client.put(avatar_url(user), content, content_type='image/png')
+    elif format == 'base64':
+        response = api_client.put(avatar_url(user), base64.b64encode(content), content_type='text/plain')
+    else:
+        response = api_client.put(avatar_url(user), {'file': io.BytesIO(content)}, format='multipart')
+    assert response.status_code == 413
+    user.refresh_from_db()
+    assert not user.avatar
+
+
+def test_upload_too_many_pixels(api_client, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.put(avatar_url(user), png(300, 300), content_type='image/png')
+    assert response.status_code == 400
+    assert 'pixels' in str(response.data['file'])
+
+
+def test_upload_invalid_image(api_client, user):
+    api_client.force_authenticate(user=user)
+    response = api_client.put(avatar_url(user), b'not an image', content_type='image/png')
+    assert response.status_code == 400
+
+
+def test_upload_avatar_of_other_user(api_client, user, organization):
+    other = User.objects.create(email='other@example.com', organization=organization)
+    api_client.force_authenticate(user=user)
+    response = api_client.put(avatar_url(other), png(), content_type='image/png')
+    assert response.status_code in (403, 404)
+
+
+def test_delete_avatar(api_client, user):
+    api_client.force_authenticate(user=user)
+    api_client.put(avatar_url(user), png(), content_type='image/png')
+    response = api_client.delete(avatar_url(user))
+    assert response.status_code == 200
+    assert response.data['avatar'] is None
+
+
+def test_avatar_base64_json_limits(api_client, user):
+    api_client.force_authenticate(user=user)
+    url = reverse('user-detail', args=(user.id,))
+    data = {'avatar': 'data:image/png;base64,' + base64.b64encode(png(300, 300)).decode()}
+    response = api_client.patch(url, data, format='json')
+    assert response.status_code == 400
+    data = {'avatar': 'data:image/png;base64,' + base64.b64encode(bytes(20000)).decode()}
+    response = api_client.patch(url, data, format='json')
+    assert response.status_code == 400
+
+
+def test_upload_logo(api_client, supervisor, organization):
+    api_client.force_authenticate(user=supervisor)
+    url = reverse('organization-logo', args=(organization.id,))
+    response = api_client.put(url, png(), content_type='image/png')
+    assert response.status_code == 200
+    organization.refresh_from_db()
+    assert organization.logo.name == f'logos/{hashlib.sha256(png()).hexdigest()}.png'
+    assert response.data['logo'] == f'http://testserver{organization.logo.url}'
+
+
+def test_upload_logo_requires_supervisor(api_client, user, organization):
+    api_client.force_authenticate(user=user)
+    response = api_client.put(reverse('organization-logo', args=(organization.id,)), png(), content_type='image/png')
+    assert response.status_code == 403
@@ -0,0 +1,271 @@
+"""
+Adaptive streaming renditions of lesson videos and audio, generated in the background with ffmpeg.
+
+Learners on mobile connections shouldn't have to download the uploaded originals. When a media item is saved with a
+new file, a background task (see `material.tasks`) transcodes it into HLS renditions at the bitrates of
+`VIDEO_RENDITIONS` or `AUDIO_RENDITIONS`, writes a master playlist referring to them and, for videos, extracts a poster
+frame. The results are written to a new directory below MEDIA_ROOT for every file, so their URLs never change, and
+recorded in `MediaStreams`. Until then, `MediaChooserBlock` only returns the original.
+"""
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.db import transaction
+from wagtailmedia.models import get_media_model
+
+from material import models
+
+DIRECTORY = 'streams'
+# Name: (height, video bitrate in kbit/s, audio bitrate in kbit/s). Renditions taller than the original are skipped.
+VIDEO_RENDITIONS = {
+    '360p': (360, 800, 96),
+    '720p': (720, 2800, 128),
+    '1080p': (1080, 5000, 192),
+}
+# Name: audio bitrate in kbit/s
+AUDIO_RENDITIONS = {
+    '64k': 64,
+    '128k': 128,
+}
+# Target duration of the HLS segments in seconds
+SEGMENT_DURATION = 6
+# Peak bitrate relative to the average bitrate of the video encoder
+MAX_RATE_FACTOR = 1.07
+POSTER_HEIGHT = 720
+
+
+def get_directory(media_id, file_name):
+    # A directory per file, so that the URLs of the streams of a file never change
+    return f'{DIRECTORY}/{media_id}/{hashlib.sha1(file_name.encode()).hexdigest()[:16]}'
+
+
+@contextlib.contextmanager
+def claim(media_id, file_name):
+    """
+    Yield whether the streams of the file `file_name` of the given media item may be generated, which they may not if
+    another task is generating them already. The claim is released when the task exits, even if it crashes.
+    """
+    # Hidden, so that it is neither served nor deleted along with streams of other files
+    name_hash = os.path.basename(get_directory(media_id, file_name))
+    path = default_storage.path(f'{DIRECTORY}/{media_id}/.{name_hash}.lock')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        f = open(path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            yield False
+            return
+        # The previous holder may have deleted the file after we opened it
+        try:
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(path)):
+                break
+        except FileNotFoundError:
+            pass
+        f.close()
+    try:
+        yield True
+    finally:
+        os.remove(path)
+        f.close()
+
+
+def get_streams(media):
+    """Return the `MediaStreams` of the current file of `media`, or None if it hasn't been transcoded yet."""
+    try:
+        streams = media.streams
+    except ObjectDoesNotExist:
+        return None
+    return streams if streams.source == media.file.name else None
+
+
+def needs_transcoding(media):
+    return settings.TRANSCODE_MEDIA and bool(media.file) and get_streams(media) is None
+
+
+def run(args):
+    subprocess.run(args, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def probe(path):
+    """Return the duration of the file at `path` and the width and height of its video stream, which may be None."""
+    result = subprocess.run(
+        [settings.FFPROBE, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+        check=True, stdin=subprocess.DEVNULL, capture_output=True)
+    info = json.loads(result.stdout)
+    video = next((stream for stream in info['streams'] if stream['codec_type'] == 'video'
+                  and not stream.get('disposition', {}).get('attached_pic')), None)
+    duration = float(info['format'].get('duration') or 0)
+    if video is None:
+        return duration, None, None
+    return duration, video['width'], video['height']
+
+
+def hls_args(directory, name):
+    return ['-f', 'hls', '-hls_time', str(SEGMENT_DURATION), '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(directory, f'{name}_%04d.ts'),
+            os.path.join(directory, f'{name}.m3u8')]
+
+
+def transcode_video(source, directory, width, height):
+    """Write the HLS renditions of the video `source` to `directory` and return the variants."""
+    renditions = [(name, *rendition) for name, rendition in VIDEO_RENDITIONS.items() if rendition[0] <= height]
+    if not renditions:
+        # Small videos get the lowest bitrate at their own height
+        name, (_, video_bitrate, audio_bitrate) = next(iter(VIDEO_RENDITIONS.items()))
+        renditions = [(name, height, video_bitrate, audio_bitrate)]
+    variants = []
+    for name, rendition_height, video_bitrate, audio_bitrate in renditions:
+        rendition_height -= rendition_height % 2
+        # Like `scale=-2:<height>`, which keeps the aspect ratio with an even width
+        rendition_width = round(width * rendition_height / height / 2) * 2
+        max_rate = int(video_bitrate * MAX_RATE_FACTOR)
+        run([settings.FFMPEG, '-nostdin', '-y', '-v', 'error', '-i', source,
+             '-map', '0:v:0', '-map', '0:a:0?',
+             '-vf', f'scale={rendition_width}:{rendition_height}',
+             '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+             '-b:v', f'{video_bitrate}k', '-maxrate', f'{max_rate}k', '-bufsize', f'{video_bitrate * 2}k',
+             # Keyframes at segment boundaries, so that all renditions can be switched between
+             '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_DURATION})',
+             '-c:a', 'aac', '-b:a', f'{audio_bitrate}k', '-ac', '2',
+             *hls_args(directory, name)])
+        variants.append({
+            'name': name,
+            'bandwidth': (max_rate + audio_bitrate) * 1000,
+            'width': rendition_width,
+            'height': rendition_height,
+        })
+    return variants
+
+
+def transcode_audio(source, directory):
+    """Write the HLS renditions of the audio `source` to `directory` and return the variants."""
+    variants = []
+    for name, audio_bitrate in AUDIO_RENDITIONS.items():
+        run([settings.FFMPEG, '-nostdin', '-y', '-v', 'error', '-i', source, '-map', '0:a:0', '-vn',
+             '-c:a', 'aac', '-b:a', f'{audio_bitrate}k', *hls_args(directory, name)])
+        variants.append({'name': name, 'bandwidth': audio_bitrate * 1000, 'width': None, 'height': None})
+    return variants
+
+
+def extract_poster(source, directory, duration, height):
+    """Write a frame from the beginning of the video `source` to `directory` as `poster.jpg`."""
+    poster_height = min(height, POSTER_HEIGHT)
+    poster_height -= poster_height % 2
+    # Skip fade-ins, but not beyond the middle of short videos
+    position = min(1.0, duration / 2)
+    run([settings.FFMPEG, '-nostdin', '-y', '-v', 'error', '-ss', str(position), '-i', source,
+         '-frames:v', '1', '-vf', f'scale=-2:{poster_height}', '-q:v', '3', os.path.join(directory, 'poster.jpg')])
+
+
+def write_master_playlist(directory, variants):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for variant in variants:
+        attributes = f'BANDWIDTH={variant["bandwidth"]}'
+        if variant['width']:
+            attributes += f',RESOLUTION={variant["width"]}x{variant["height"]}'
+        lines += [f'#EXT-X-STREAM-INF:{attributes}', f'{variant["name"]}.m3u8']
+    with open(os.path.join(directory, 'index.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def transcode_media(media_id, file_name, force=False):
+    """
+    Generate the streams of the file `file_name` of the given media item and record them, unless the item's file has
+    changed in the meantime, another task is transcoding the same file or, unless `force` is true, the streams exist
+    already.
+    """
+    with claim(media_id, file_name) as claimed:
+        if claimed:
+            _transcode_media(media_id, file_name, force)
+
+
+def _transcode_media(media_id, file_name, force):
+    media_model = get_media_model()
+    media = media_model.objects.filter(pk=media_id, file=file_name).first()
+    if media is None or (not force and get_streams(media) is not None):
+        return
+    source = media.file.path
+    duration, width, height = probe(source)
+    is_video = media.type == 'video' and width is not None
+
+    directory = get_directory(media_id, file_name)
+    path = default_storage.path(directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Hidden, so that `material.media` doesn't serve it before it's complete
+    temp_path = tempfile.mkdtemp(prefix='.', dir=os.path.dirname(path))
+    try:
+        if is_video:
+            variants = transcode_video(source, temp_path, width, height)
+            extract_poster(source, temp_path, duration, height)
+        else:
+            variants = transcode_audio(source, temp_path)
+        write_master_playlist(temp_path, variants)
+        # The web server must be able to read the files regardless of our umask
+        os.chmod(temp_path, 0o755)
+        for name in os.listdir(temp_path):
+            os.chmod(os.path.join(temp_path, name), 0o644)
+        # Streams of the same file are only written again by `manage.py transcodemedia --all`, and never by two tasks
+        # at once (see `claim`)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(temp_path, path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+    with transaction.atomic():
+        if not media_model.objects.select_for_update().filter(pk=media_id, file=file_name).exists():
+            shutil.rmtree(path, ignore_errors=True)
+            return
+        for variant in variants:
+            variant['playlist'] = f'{directory}/{variant.pop("name")}.m3u8'
+        models.MediaStreams.objects.update_or_create(media_id=media_id, defaults={
+            'source': file_name,
+            'playlist': f'{directory}/index.m3u8',
+            'poster': f'{directory}/poster.jpg' if is_video else '',
+            'variants': variants,
+        })
+    delete_streams(media_id, keep=directory)
+
+
+def delete_streams(media_id, keep=None):
+    """Delete the streams of all files of the given media item except those in the directory `keep`."""
+    path = default_storage.path(f'{DIRECTORY}/{media_id}')
+    if not os.path.isdir(path):
+        return
+    for name in os.listdir(path):
+        # Hidden directories belong to transcoding tasks in progress
+        if keep is None or (f'{DIRECTORY}/{media_id}/{name}' != keep and not name.startswith('.')):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    if keep is None:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def get_representation(media, request):
+    """
+    Return the URLs of the master playlist, of each rendition and of the poster frame of the current file of `media`
+    for the API, or None if it hasn't been transcoded yet.
+    """
+    streams = get_streams(media)
+    if streams is None:
+        return None
+    return {
+        'hls': request.build_absolute_uri(default_storage.url(streams.playlist)),
+        'variants': [{
+            'url': request.build_absolute_uri(default_storage.url(variant['playlist'])),
+            'bandwidth': variant['bandwidth'],
+            'width': variant['width'],
+            'height': variant['height'],
+        } for variant in streams.variants],
+        'poster': request.build_absolute_uri(default_storage.url(streams.poster)) if streams.poster else None,
+    }
@@ -0,0 +1,212 @@
+"""
+Streaming uploads of avatars and organization logos with size limits.
+
+`UserSerializer` accepts avatars as base64 data URIs in JSON bodies, which are read, parsed and decoded in memory as a
+whole. The endpoints `PUT /users/{id}/avatar/` and `PUT /organizations/{id}/logo/` instead accept the image as
+
+- the raw request body with `Content-Type: image/...`,
+- a base64 request body with `Content-Type: text/plain`, optionally as a data URI, or
+- the field `file` of a `multipart/form-data` body.
+
+The parsers below write the decoded image to a temporary file chunk by chunk and stop reading with 413 as soon as it
+exceeds MAX_IMAGE_UPLOAD_SIZE bytes. `validate_image` then only reads the header of the image to check its format and
+that it has at most MAX_IMAGE_UPLOAD_PIXELS pixels, so that images are first decoded when they are processed in the
+background (see `material.avatars`).
+"""
+import base64
+import binascii
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http.multipartparser import MultiPartParser as DjangoMultiPartParser, MultiPartParserError
+from PIL import Image
+from rest_framework import exceptions, parsers, status
+
+CHUNK_SIZE = 64 * 2**10
+# Formats that browsers can display, and the extensions of the stored files
+FORMATS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+# Longest data URI prefix we accept, e.g., `data:image/jpeg;base64,`
+MAX_DATA_URI_PREFIX_LENGTH = 100
+WHITESPACE = b' \t\r\n'
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = 'upload_too_large'
+
+    def __init__(self):
+        super().__init__(f"The image must not be larger than {settings.MAX_IMAGE_UPLOAD_SIZE} bytes.")
+
+
+def get_max_base64_length():
+    """Return the length of the base64 encoding of an image of MAX_IMAGE_UPLOAD_SIZE bytes with a data URI prefix."""
+    return (settings.MAX_IMAGE_UPLOAD_SIZE + 2) // 3 * 4 + MAX_DATA_URI_PREFIX_LENGTH
+
+
+def check_content_length(request, limit):
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > limit:
+        raise UploadTooLarge()
+
+
+def read_chunks(stream):
+    if stream is None:
+        return
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def create_file(content_type='application/octet-stream'):
+    # The name is replaced once the format is known
+    return TemporaryUploadedFile('upload', content_type, 0, None)
+
+
+def write_chunk(file, chunk):
+    file.size += len(chunk)
+    if file.size > settings.MAX_IMAGE_UPLOAD_SIZE:
+        file.close()
+        raise UploadTooLarge()
+    file.write(chunk)
+
+
+class ImageUploadParser(parsers.BaseParser):
+    """Parse a request body consisting of an image into `{'file': <TemporaryUploadedFile>}`."""
+    media_type = 'image/*'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context['request'], settings.MAX_IMAGE_UPLOAD_SIZE)
+        file = create_file(media_type)
+        for chunk in read_chunks(stream):
+            write_chunk(file, chunk)
+        file.seek(0)
+        return {'file': file}
+
+
+class Base64ImageUploadParser(parsers.BaseParser):
+    """
+    Parse a request body consisting of a base64-encoded image, optionally as a data URI, into
+    `{'file': <TemporaryUploadedFile>}`, decoding it chunk by chunk.
+    """
+    media_type = 'text/plain'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        check_content_length(parser_context['request'], get_max_base64_length())
+        file = create_file()
+        prefix_done = False
+        pending = b''
+        try:
+            for chunk in read_chunks(stream):
+                pending += chunk.translate(None, WHITESPACE)
+                if not prefix_done:
+                    if pending.startswith(b'data:'):
+                        separator = pending.find(b',')
+                        if separator < 0:
+                            if len(pending) > MAX_DATA_URI_PREFIX_LENGTH:
+                                raise exceptions.ParseError("Invalid data URI.")
+                            continue
+                        if not pending[:separator].endswith(b';base64'):
+                            raise exceptions.ParseError("The data URI must be base64-encoded.")
+                        pending = pending[separator + 1:]
+                    elif len(pending) < len(b'data:') and b'data:'.startswith(pending):
+                        continue
+                    prefix_done = True
+                # Decode complete groups of four characters and keep the rest for the next chunk
+                end = len(pending) // 4 * 4
+                write_chunk(file, base64.b64decode(pending[:end], validate=True))
+                pending = pending[end:]
+        except binascii.Error as e:
+            file.close()
+            raise exceptions.ParseError(f"Invalid base64 data: {e}")
+        if pending:
+            file.close()
+            raise exceptions.ParseError("Invalid base64 data: incorrect padding")
+        file.seek(0)
+        return {'file': file}
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Upload handler writing files to temporary files that aborts the upload once a file is too large."""
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.file.close()
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+
+class MultiPartImageUploadParser(parsers.MultiPartParser):
+    """
+    Like DRF's MultiPartParser, but always write files to temporary files, regardless of FILE_UPLOAD_HANDLERS, and
+    enforce MAX_IMAGE_UPLOAD_SIZE while receiving them.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        upload_handlers = [LimitedTemporaryFileUploadHandler(request._request)]
+        try:
+            parser = DjangoMultiPartParser(request.META, stream, upload_handlers, encoding)
+            data, files = parser.parse()
+            return parsers.DataAndFiles(data, files)
+        except MultiPartParserError as exc:
+            raise exceptions.ParseError('Multipart form parse error - %s' % str(exc))
+
+
+PARSER_CLASSES = [ImageUploadParser, Base64ImageUploadParser, MultiPartImageUploadParser]
+
+
+def validate_image(file):
+    """
+    Check the size, format and dimensions of the uploaded image `file` without decoding it, and give it a random name
+    with the extension of its format. Raise a ValidationError if the image is invalid or too large.
+    """
+    if file.size > settings.MAX_IMAGE_UPLOAD_SIZE:
+        raise exceptions.ValidationError(f"The image must not be larger than {settings.MAX_IMAGE_UPLOAD_SIZE} bytes.")
+    file.seek(0)
+    try:
+        # Only reads the header
+        image = Image.open(file)
+        image_format = image.format
+        width, height = image.size
+    except Image.DecompressionBombError:
+        raise exceptions.ValidationError("The image has too many pixels.")
+    except Exception:
+        raise exceptions.ValidationError("Upload a valid image.")
+    finally:
+        file.seek(0)
+    if image_format not in FORMATS:
+        raise exceptions.ValidationError(f"Unsupported image format. Use one of {', '.join(FORMATS)}.")
+    if width * height > settings.MAX_IMAGE_UPLOAD_PIXELS:
+        raise exceptions.ValidationError(
+            f"The image must not have more than {settings.MAX_IMAGE_UPLOAD_PIXELS} pixels, but it has "
+            f"{width}x{height}.")
+    file.name = f'{uuid.uuid4()}.{FORMATS[image_format]}'
+    file.content_type = Image.MIME[image_format]
+    return file
+
+
+def get_uploaded_image(request):
+    """Return the validated image uploaded with one of PARSER_CLASSES."""
+    file = request.data.get('file')
+    if not hasattr(file, 'read'):
+        raise exceptions.ValidationError({'file': ["No image was uploaded."]})
+    try:
+        return validate_image(file)
+    except exceptions.ValidationError as e:
+        raise exceptions.ValidationError({'file': e.detail})
@@ -0,0 +1,29 @@
+"""
+Versions of content whose changes cannot be queried, like media items and their streams.
+
+Signal handlers bump the version of a kind of content whenever something in it changes, and readers compare it with
+the version they saw before, e.g., in ETags or cache entries. Versions are stored in the database rather than in the
+cache, which may be process-local, so that a change in one process is seen by all others.
+"""
+import uuid
+
+from django.utils import timezone
+
+from material import models
+
+
+def get_version(name):
+    """Return (version, last_modified) of the content called `name`."""
+    row = models.ContentVersion.objects.filter(name=name).values_list('version', 'last_modified').first()
+    if row is None:
+        # Without a record of the last change, we don't know when it happened
+        content_version, _ = models.ContentVersion.objects.get_or_create(name=name,
+                                                                         defaults={'version': uuid.uuid4().hex})
+        row = content_version.version, content_version.last_modified
+    return row
+
+
+def bump_version(name):
+    """Change the version of the content called `name`."""
+    models.ContentVersion.objects.update_or_create(name=name, defaults={'version': uuid.uuid4().hex,
+                                                                        'last_modified': timezone.now()})
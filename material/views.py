@@ -1,15 +1,43 @@
-from rest_framework import viewsets, mixins
+from collections import defaultdict
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q
+from django.http import Http404
+from djoser.permissions import CurrentUserOrAdmin
+from djoser.views import UserViewSet as DjoserUserViewSet
+from rest_framework import status, viewsets, mixins
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
+from wagtail.core.models import Page, Site
+
+from material import bundles
+from material import conditional
+from material import fieldsets
 from material import models
+from material import packs
+from material import pagination
+from material import payloads
 from material import permissions
+from material import prefetching
+from material import progress
 from material import serializers
+from material import uploads
 
 
-class StaticPageViewSet(viewsets.ModelViewSet):
+class StaticPageViewSet(conditional.ConditionalGetMixin, fieldsets.SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.StaticPage.objects.all()
     serializer_class = serializers.StaticPageSerializer
+    pagination_class = pagination.PageCursorPagination
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
+    def get_content_version(self):
+        return conditional.get_page_version(self.get_content_queryset())
+
 
 # class SectionViewSet(viewsets.ModelViewSet):
 #     queryset = models.Section.objects.all()
@@ -17,43 +45,206 @@ class StaticPageViewSet(viewsets.ModelViewSet):
 #     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
 
-class MultipleChoiceQuestionViewSet(viewsets.ModelViewSet):
+class MultipleChoiceQuestionViewSet(fieldsets.SparseFieldsetMixin, prefetching.PrefetchMixin, viewsets.ModelViewSet):
     queryset = models.MultipleChoiceQuestion.objects.all()
     serializer_class = serializers.MultipleChoiceQuestionSerializer
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
 
-class MultipleChoiceAnswerViewSet(viewsets.ModelViewSet):
+class MultipleChoiceAnswerViewSet(fieldsets.SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.MultipleChoiceAnswer.objects.all()
     serializer_class = serializers.MultipleChoiceAnswerSerializer
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
 
-class QuizViewSet(viewsets.ModelViewSet):
+class QuizViewSet(conditional.ConditionalGetMixin,
+                  fieldsets.SparseFieldsetMixin,
+                  prefetching.PrefetchMixin,
+                  viewsets.ModelViewSet):
     queryset = models.Quiz.objects.all()
     serializer_class = serializers.QuizSerializer
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
+    def get_content_version(self):
+        return conditional.get_quiz_version(self.get_content_queryset())
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def submit(self, request, pk=None):
+        """
+        Save the requesting user's responses to the answers of this quiz, given as
+        `{"responses": [{"answer": ..., "response": ...}, ...]}`, and grade the quiz.
+
+        Responses to answers that are not part of the submission are taken from earlier submissions.
+        """
+        quiz = self.get_object()
+        submission = serializers.QuizSubmissionSerializer(data=request.data,
+                                                          context={**self.get_serializer_context(), 'quiz': quiz})
+        submission.is_valid(raise_exception=True)
+        saved = models.MultipleChoiceResponse.objects.bulk_upsert(
+            [models.MultipleChoiceResponse(user=request.user, answer_id=item['answer'], response=item['response'])
+             for item in submission.validated_data['responses']],
+            unique_fields=['user_id', 'answer_id'],
+            update_fields=['response'])
+        responses = dict(models.MultipleChoiceResponse.objects
+                         .filter(user=request.user, answer__in=submission.answers.keys())
+                         .values_list('answer', 'response'))
+        return Response({
+            'responses': serializers.MultipleChoiceResponseSerializer([response for response, _ in saved], many=True,
+                                                                      context=self.get_serializer_context()).data,
+            **submission.grade(responses),
+        })
+
 
-class OpenQuestionViewSet(viewsets.ModelViewSet):
+class OpenQuestionViewSet(conditional.ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = models.OpenQuestion.objects.all()
     serializer_class = serializers.OpenQuestionSerializer
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
+    def get_content_version(self):
+        return conditional.get_snippet_version(self.get_content_queryset())
 
-class LessonViewSet(viewsets.ModelViewSet):
+
+class LessonViewSet(conditional.ConditionalGetMixin, fieldsets.SparseFieldsetMixin, viewsets.ModelViewSet):
+    """
+    Lessons are served from the stored payloads in `material.payloads` where possible, falling back to serializing
+    (and storing) them on a miss.
+
+    With `?inline_quizzes=true`, quiz blocks contain the whole quiz including questions and answers instead of its ID.
+    """
     queryset = models.Lesson.objects.all()
     serializer_class = serializers.LessonSerializer
+    pagination_class = pagination.PageCursorPagination
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['inline_quizzes'] = self.inlines_quizzes()
+        return context
+
+    def inlines_quizzes(self):
+        return self.request.query_params.get('inline_quizzes', '').lower() in ('1', 'true')
+
+    def get_content_version(self):
+        versions = [conditional.get_page_version(self.get_content_queryset()), conditional.get_media_version()]
+        if self.inlines_quizzes():
+            # We don't know which quizzes the lessons contain without looking at their bodies
+            versions.append(conditional.get_quiz_version(models.Quiz.objects.all()))
+        return conditional.combine_versions(*versions)
+
+    def list(self, request, *args, **kwargs):
+        return self.respond_conditionally(self.list_from_payloads, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respond_conditionally(self.retrieve_from_payloads, request, *args, **kwargs)
+
+    def list_from_payloads(self, request, *args, **kwargs):
+        if not payloads.is_servable(request):
+            return mixins.ListModelMixin.list(self, request, *args, **kwargs)
+        # The paginator only needs the ordering field of each row to build the cursors
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()).values('pk', 'path'))
+        lesson_ids = [row['pk'] for row in page]
+        stored = payloads.get_payloads(lesson_ids, request)
+        missing = self.get_queryset().in_bulk([pk for pk in lesson_ids if pk not in stored])
+        data = [stored[pk] if pk in stored else payloads.store_payload(missing[pk], request) for pk in lesson_ids]
+        return self.get_paginated_response(data)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def progress(self, request):
+        """
+        Return for each live lesson how many blocks of its body the requesting user has completed and how many there
+        are in total, per language, as `[{"lesson": ..., "completed": {"en": ...}, "total": {"en": ...}}, ...]`.
+
+        This is computed with a single aggregate query on `LessonBlock` and the user's block completions.
+        """
+        completed_blocks = models.BlockCompletion.objects.filter(user=request.user).values('block')
+        rows = (models.LessonBlock.objects.filter(lesson__live=True)
+                .values('lesson', 'language')
+                .annotate(total=Count('pk'), completed=Count('pk', filter=Q(block__in=completed_blocks)))
+                .order_by('lesson', 'language'))
+        by_lesson = {}
+        for row in rows:
+            lesson_progress = by_lesson.setdefault(row['lesson'],
+                                                   {'lesson': row['lesson'], 'completed': {}, 'total': {}})
+            lesson_progress['completed'][row['language']] = row['completed']
+            lesson_progress['total'][row['language']] = row['total']
+        return Response(list(by_lesson.values()))
+
+    def retrieve_from_payloads(self, request, *args, **kwargs):
+        if not payloads.is_servable(request):
+            return mixins.RetrieveModelMixin.retrieve(self, request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            lesson_id = models.Lesson._meta.pk.to_python(self.kwargs[lookup_url_kwarg])
+        except DjangoValidationError:
+            raise Http404
+        stored = payloads.get_payloads([lesson_id], request)
+        if stored:
+            return Response(next(iter(stored.values())))
+        return Response(payloads.store_payload(self.get_object(), request))
+
+
+class CategoryViewSet(conditional.ConditionalGetMixin, fieldsets.SparseFieldsetMixin, viewsets.ModelViewSet):
     queryset = models.Category.objects.all()
     serializer_class = serializers.CategorySerializer
+    pagination_class = pagination.PageCursorPagination
     permission_classes = [permissions.IsSuperUserOrReadOnly]
 
+    def get_root_page(self):
+        site = Site.find_for_request(self.request)
+        return site.root_page if site else Page.get_first_root_node()
+
+    def get_content_version(self):
+        if self.action == 'list':
+            root = self.get_root_page()
+            pages = (Page.objects.live().type(models.Category, models.Lesson)
+                     .filter(path__startswith=root.path, depth__gt=root.depth))
+        else:
+            # The category and its lessons
+            path = self.get_content_queryset().values_list('path', flat=True).first() or ''
+            pages = Page.objects.filter(path__startswith=path, depth__lte=len(path) // Page.steplen + 1)
+        # Expanded lessons contain media items
+        return conditional.combine_versions(conditional.get_page_version(pages), conditional.get_media_version())
+
+    def list(self, request, *args, **kwargs):
+        return self.respond_conditionally(self.list_catalog, request, *args, **kwargs)
+
+    def list_catalog(self, request, *args, **kwargs):
+        """List the live categories of the requested site with their live lessons."""
+        root = self.get_root_page()
+        categories = (self.filter_queryset(self.get_queryset()).live()
+                      .filter(path__startswith=root.path, depth__gt=root.depth))
+        page = self.paginate_queryset(categories.values('path'))
+        lesson_serializer = self.get_lesson_serializer()
+        catalog = models.Category.live_catalog(root,
+                                               category_paths=[row['path'] for row in page],
+                                               deferred_lesson_fields=fieldsets.get_deferred_fields(lesson_serializer))
+        # The lessons are serialized separately for each category, so prepare them for all categories at once
+        lesson_serializer.prefetch_bodies([lesson for category in catalog for lesson in category.lessons])
+        serializer = self.get_serializer(catalog, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_object(self):
+        category = super().get_object()
+        if self.request.method in SAFE_METHODS:
+            deferred = fieldsets.get_deferred_fields(self.get_lesson_serializer())
+            category._lessons = models.Lesson.objects.child_of(category).live().order_by('path').defer(*deferred)
+        return category
+
+    def get_lesson_serializer(self):
+        """
+        Return the serializer for the lessons of a category as it will be used for the response, or one that outputs
+        only their IDs if lessons are not expanded.
+        """
+        serializer = self.get_serializer()
+        serializers.apply_representation_options(serializer)
+        lessons = serializer.fields.get('lessons')
+        if isinstance(lessons, ListSerializer):
+            return lessons.child
+        return serializers.LessonSerializer(fields=['id'])
 
-class BlockCompletionViewSet(mixins.CreateModelMixin,
+
+class BlockCompletionViewSet(fieldsets.SparseFieldsetMixin,
+                             mixins.CreateModelMixin,
                              mixins.RetrieveModelMixin,
                              mixins.UpdateModelMixin,
                              mixins.DestroyModelMixin,
@@ -62,8 +253,74 @@ class BlockCompletionViewSet(mixins.CreateModelMixin,
     serializer_class = serializers.BlockCompletionSerializer
     permission_classes = [permissions.IsOwner]
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def batch(self, request):
+        """
+        Create or update a list of block completions of the requesting user at once.
+
+        The response contains one result per item in the order of the request: `{"status": 201, "data": ...}` for a
+        new completion, `{"status": 200, "data": ...}` for an updated one and `{"status": 400, "errors": ...}` for an
+        invalid item, which does not prevent the other items from being saved.
+        """
+        if not isinstance(request.data, list):
+            raise ValidationError("Expected a list of block completions")
+        if len(request.data) > settings.API_MAX_BATCH_SIZE:
+            raise ValidationError(f"Send at most {settings.API_MAX_BATCH_SIZE} block completions at once")
+
+        items = [serializers.BlockCompletionBatchItemSerializer(data=item, context=self.get_serializer_context())
+                 for item in request.data]
+        lesson_ids = {item.validated_data['lesson'] for item in items if item.is_valid()}
+        existing_lesson_ids = set(models.Lesson.objects.filter(pk__in=lesson_ids).values_list('pk', flat=True))
+        completions = []
+        errors = []
+        for item in items:
+            if not item.is_valid():
+                errors.append(item.errors)
+            elif item.validated_data['lesson'] not in existing_lesson_ids:
+                errors.append({'lesson': [f"Invalid pk \"{item.validated_data['lesson']}\" - object does not exist."]})
+            else:
+                errors.append(None)
+                completions.append(models.BlockCompletion(user=request.user,
+                                                          lesson_id=item.validated_data['lesson'],
+                                                          block=item.validated_data['block']))
+        previous_lessons = dict(models.BlockCompletion.objects
+                                .filter(user=request.user, block__in=[completion.block for completion in completions])
+                                .values_list('block', 'lesson'))
+        upserted = models.BlockCompletion.objects.bulk_upsert(completions,
+                                                              unique_fields=['user_id', 'block'],
+                                                              update_fields=['lesson'])
+        self.update_progress(request.user, upserted, previous_lessons)
+        saved = iter(upserted)
+
+        results = []
+        for item_errors in errors:
+            if item_errors:
+                results.append({'status': status.HTTP_400_BAD_REQUEST, 'errors': item_errors})
+            else:
+                completion, created = next(saved)
+                results.append({
+                    'status': status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+                    'data': self.get_serializer(completion).data,
+                })
+        return Response(results)
+
+    def update_progress(self, user, upserted, previous_lessons):
+        created_blocks = defaultdict(set)
+        moved_lessons = set()
+        for completion, created in upserted:
+            if created:
+                created_blocks[completion.lesson_id].add(completion.block)
+            elif previous_lessons.get(completion.block, completion.lesson_id) != completion.lesson_id:
+                moved_lessons |= {previous_lessons[completion.block], completion.lesson_id}
+        for lesson_id, blocks in created_blocks.items():
+            progress.record_completions(user.pk, lesson_id, blocks, 1)
+        if moved_lessons:
+            # Completions are rarely moved to another lesson, so we just recompute the affected rows
+            progress.refresh_for_users(moved_lessons, [user.pk])
 
-class MultipleChoiceResponseViewSet(mixins.CreateModelMixin,
+
+class MultipleChoiceResponseViewSet(fieldsets.SparseFieldsetMixin,
+                                    mixins.CreateModelMixin,
                                     mixins.RetrieveModelMixin,
                                     mixins.UpdateModelMixin,
                                     mixins.DestroyModelMixin,
@@ -73,7 +330,8 @@ class MultipleChoiceResponseViewSet(mixins.CreateModelMixin,
     permission_classes = [permissions.IsOwner]
 
 
-class OpenQuestionResponseViewSet(mixins.CreateModelMixin,
+class OpenQuestionResponseViewSet(fieldsets.SparseFieldsetMixin,
+                                  mixins.CreateModelMixin,
                                   mixins.RetrieveModelMixin,
                                   mixins.UpdateModelMixin,
                                   mixins.DestroyModelMixin,
@@ -83,7 +341,8 @@ class OpenQuestionResponseViewSet(mixins.CreateModelMixin,
     permission_classes = [permissions.IsOwner]
 
 
-class OrganizationViewSet(mixins.RetrieveModelMixin,
+class OrganizationViewSet(prefetching.PrefetchMixin,
+                          mixins.RetrieveModelMixin,
                           viewsets.GenericViewSet):
     queryset = models.Organization.objects.all()
     # permission_classes = [permissions.IsSupervisorOfThisOrganizationOrReadOnly]
@@ -96,9 +355,97 @@ class OrganizationViewSet(mixins.RetrieveModelMixin,
         if self.action == 'retrieve' and self.request.user.is_authenticated:
             if self.request.user.is_superuser:
                 return serializers.OrganizationSerializerWithMembers
-            elif self.request.user.organization == self.get_object():
+            # Compare IDs rather than calling get_object(), whose queryset depends on the serializer
+            elif str(self.request.user.organization_id) == self.kwargs[self.lookup_url_kwarg or self.lookup_field]:
                 if self.request.user.is_supervisor:
                     return serializers.OrganizationSerializerWithMembers
                 else:
                     return serializers.OrganizationSerializerWithSupervisors
         return serializers.OrganizationSerializer
+
+    @action(detail=True)
+    def bundle(self, request, pk=None):
+        """
+        Return everything the frontend of this organization needs at startup as
+        `{"organization": ..., "categories": [...], "static_pages": [...]}`, where each category contains the live
+        lessons assigned to the organization, in the same representation as `/lessons/{id}/`.
+
+        Bundles are cached by `material.bundles`, so a request is usually served with a single query for the bundle
+        version.
+        """
+        data = bundles.get_cached_bundle(pk, request)
+        if data is None:
+            data = bundles.store_bundle(self.get_object(), request)
+        return Response(data)
+
+    @action(detail=True)
+    def pack(self, request, pk=None):
+        """
+        Return the version, URL and size of the offline content pack of this organization, building it first if its
+        content may have changed. The pack itself is served by the web server; see `material.packs`.
+        """
+        organization = self.get_object()
+        version, _ = packs.get_pack(organization)
+        name = packs.get_name(organization.pk, version)
+        return Response({
+            'version': version,
+            'url': request.build_absolute_uri(default_storage.url(name)),
+            'size': default_storage.size(name),
+        })
+
+    @action(detail=True, permission_classes=[IsAuthenticated, permissions.IsSupervisorOfThisOrganization])
+    def progress(self, request, pk=None):
+        """
+        Return the number of members and, for each lesson in which any member made progress, the rollup maintained
+        by `material.progress`.
+        """
+        organization = self.get_object()
+        lessons = (organization.lesson_progress.filter(members_started__gt=0)
+                   .values('lesson', 'completed_blocks', 'members_started', 'members_finished')
+                   .order_by('lesson'))
+        return Response({
+            'members': organization.user_set.count(),
+            'lessons': list(lessons),
+        })
+
+    @action(detail=True, methods=['put', 'delete'], parser_classes=uploads.PARSER_CLASSES,
+            permission_classes=[IsAuthenticated, permissions.IsSupervisorOfThisOrganization])
+    def logo(self, request, pk=None):
+        """
+        Replace the logo of this organization by the image in the request body, streamed to disk as described in
+        `material.uploads`, or delete it. Return the URL of the logo.
+        """
+        organization = self.get_object()
+        if request.method == 'DELETE':
+            organization.logo.delete()
+        else:
+            image = uploads.get_uploaded_image(request)
+            organization.logo.save(image.name, image)
+            # The storage has moved the temporary file
+            image.close()
+        url = request.build_absolute_uri(organization.logo.url) if organization.logo else None
+        return Response({'logo': url})
+
+
+class UserViewSet(prefetching.PrefetchMixin, DjoserUserViewSet):
+    """Djoser's user views, with the relations expanded by `?expand=` prefetched."""
+
+    @action(detail=True, methods=['put', 'delete'], parser_classes=uploads.PARSER_CLASSES,
+            permission_classes=[CurrentUserOrAdmin])
+    def avatar(self, request, *args, **kwargs):
+        """
+        Replace the avatar of this user by the image in the request body, streamed to disk as described in
+        `material.uploads`, or delete it. Return the user.
+        """
+        user = self.get_object()
+        if request.method == 'DELETE':
+            # The file and its variants are deleted in the background by material.blobs
+            user.avatar = None
+            user.avatar_variants = {}
+            user.save()
+        else:
+            image = uploads.get_uploaded_image(request)
+            user.avatar.save(image.name, image)
+            # The storage has moved the temporary file
+            image.close()
+        return Response(self.get_serializer(user).data)